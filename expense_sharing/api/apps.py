@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import metrics, slow_queries
+
+        # Instrument every connection, however it was opened.
+        connection_created.connect(metrics.install_query_wrapper, dispatch_uid="api.metrics")
+        connection_created.connect(slow_queries.install_query_wrapper, dispatch_uid="api.slow_queries")
@@ -0,0 +1,206 @@
+# api/async_views.py
+#
+# Async versions of the read endpoints for the ASGI application. They return
+# the same JSON as their counterparts in views.py but use the async ORM, so
+# a worker can interleave many requests instead of running them one at a
+# time on the thread-sensitive sync executor. The expense event stream lives
+# here too, since holding thousands of idle connections needs an event loop.
+
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from . import changes, fast_serializers, pubsub
+from .authentication import AsyncJWTAuthentication, AsyncJWTQueryAuthentication
+from .conditional import auser_state, expense_conditions, prefetch_user_state, user_conditions
+from .filters import filter_expenses
+from .models import CustomUser, Expense, ExpenseParticipant
+from .pagination import ExpenseCursorPagination
+from .serializers import ExpenseSerializer, UserSerializer
+
+
+def render(data, status=status.HTTP_200_OK):
+    """
+    Render `data` exactly as DRF's JSONRenderer does for the sync views.
+    """
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def async_api_view(view=None, *, authentication_class=AsyncJWTAuthentication):
+    """
+    Async stand-in for `@api_view(['GET'])` with JWT authentication and
+    `IsAuthenticated`, turning DRF API exceptions into JSON error responses.
+    """
+    if view is None:
+        return functools.partial(async_api_view, authentication_class=authentication_class)
+    authenticator = authentication_class()
+
+    @require_GET
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            result = await authenticator.aauthenticate(request)
+            if result is None:
+                raise NotAuthenticated()
+            request.user, request.auth = result
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            response = render(data, exc.status_code)
+            if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+                response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+            return response
+    return wrapper
+
+
+@async_api_view
+@prefetch_user_state
+@user_conditions
+async def get_user_details(request, user_id):
+    """
+    Retrieve user details by user_id.
+    """
+    user = await CustomUser.objects.filter(id=user_id).afirst()
+    if user is None:
+        raise NotFound("No CustomUser matches the given query.")
+    return render(UserSerializer(user).data)
+
+
+@async_api_view
+@prefetch_user_state
+@user_conditions
+async def get_user_by_username(request):
+    """
+    Retrieve user details by username.
+    """
+    username = request.GET.get('username')
+    if not username:
+        return render({"error": "Username query parameter is required."}, status.HTTP_400_BAD_REQUEST)
+
+    user = await CustomUser.objects.filter(username=username).afirst()
+    if not user:
+        return render({"error": "User not found."}, status.HTTP_404_NOT_FOUND)
+    return render(UserSerializer(user).data)
+
+
+@async_api_view
+@prefetch_user_state
+@expense_conditions
+async def get_user_expenses(request, user_id):
+    """
+    Retrieve individual user expenses, newest first, with the same cursor
+    pagination and filters as the sync endpoint.
+    """
+    if await auser_state(request, id=user_id) is None:
+        raise NotFound("User not found.")
+    expenses = Expense.objects.filter(
+        id__in=ExpenseParticipant.objects.filter(user_id=user_id).values('expense_id')
+    )
+    paginator = ExpenseCursorPagination()
+    page_queryset = paginator.get_page_queryset(filter_expenses(expenses, request.GET), Request(request))
+    rows = fast_serializers.expense_rows_query(page_queryset, paginator.get_ordering())
+    page = paginator.build_page(fast_serializers.group_rows([row async for row in rows]))
+    return render({
+        'next': paginator.get_next_link(),
+        'previous': paginator.get_previous_link(),
+        'results': fast_serializers.serialize_page(page),
+    })
+
+
+@async_api_view
+@prefetch_user_state
+@expense_conditions
+async def get_latest_expense(request, user_id):
+    """
+    Get the latest expense for the given user.
+    """
+    state = await auser_state(request, id=user_id)
+    latest_expense = None
+    if state is not None:
+        last_expense_id = state[-1]
+        expenses = ExpenseSerializer.setup_eager_loading(Expense.objects.all())
+        if last_expense_id:
+            latest_expense = await expenses.filter(id=last_expense_id).afirst()
+        if latest_expense is None:
+            latest_expense = await expenses.filter(participants__user__id=user_id).order_by('-created_at', '-id').afirst()
+    if latest_expense:
+        return render(ExpenseSerializer(latest_expense).data)
+    return render({"detail": "No expenses found."}, status.HTTP_404_NOT_FOUND)
+
+
+# Server-Sent Events
+
+# Milliseconds a disconnected EventSource waits before reconnecting.
+RETRY_MS = 3000
+# Changes replayed to a reconnecting stream before it is asked to reconnect again.
+REPLAY_LIMIT = 500
+
+
+def format_event(event):
+    return f"id: {event['cursor']}\nevent: expense\ndata: {json.dumps(event)}\n\n"
+
+
+async def stream_events(broker, user_id, since):
+    """
+    Yield the SSE stream of one subscriber: changes missed since `since`
+    from the change log, then live events, with keep-alive comments while idle.
+    """
+    subscription = broker.subscribe(user_id)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        if since is not None:
+            # Subscribed first, so nothing written during the replay is lost;
+            # live events the replay already covered are skipped below.
+            rows, has_more = await sync_to_async(changes.change_rows)(user_id, since, REPLAY_LIMIT)
+            for cursor, expense_id in rows:
+                yield format_event(pubsub.make_event(cursor, expense_id))
+            if has_more:
+                # The client reconnects from the last id for the rest.
+                return
+            if rows:
+                since = rows[-1][0]
+        while True:
+            event = await subscription.get(settings.EVENTS_HEARTBEAT_SECONDS)
+            if event is None:
+                yield ": keepalive\n\n"
+            elif since is None or event['cursor'] > since:
+                yield format_event(event)
+    except pubsub.Overflow:
+        # Closing makes the client reconnect with Last-Event-ID and catch up.
+        return
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@async_api_view(authentication_class=AsyncJWTQueryAuthentication)
+async def expense_events(request):
+    """
+    Stream an event to the authenticated user whenever an expense they take
+    part in is written. Each event carries the expense id and its change
+    cursor; a reconnecting client sends Last-Event-ID (or `since`) and first
+    receives the changes it missed.
+    """
+    since = request.headers.get('Last-Event-ID') or request.GET.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            raise ValidationError({"error": "Last-Event-ID and since must be integers."})
+
+    broker = pubsub.get_broker()
+    if broker.is_full():
+        return render({"detail": "Too many open event streams."}, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    response = StreamingHttpResponse(stream_events(broker, request.user.id, since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,57 @@
+# api/authentication.py
+
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+class AsyncJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication for async views.
+
+    Token parsing and validation are pure Python and reused as-is; only the
+    user lookup goes through the async ORM so it never blocks the event loop.
+    """
+    # Query parameter accepted when the request carries no Authorization header.
+    query_param = None
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is not None:
+            raw_token = self.get_raw_token(header)
+        elif self.query_param and request.GET.get(self.query_param):
+            raw_token = request.GET[self.query_param].encode()
+        else:
+            return None
+
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return user
+
+
+class AsyncJWTQueryAuthentication(AsyncJWTAuthentication):
+    """
+    Also accept the access token as `?token=`, for browser EventSource
+    connections, which cannot send an Authorization header.
+    """
+    query_param = 'token'
@@ -0,0 +1,104 @@
+# api/bulk.py
+
+import csv
+import io
+
+from django.db import transaction
+
+from . import splits
+from .models import Expense, ExpenseParticipant
+from .serializers import ExpenseSerializer, collect_user_ids, load_users
+
+MAX_ITEMS = 10000
+BATCH_SIZE = 500
+
+CSV_EXPENSE_FIELDS = ('name', 'created_by', 'total_amount', 'split_type')
+CSV_PARTICIPANT_FIELDS = ('user_id', 'amount_owed', 'percentage_owed')
+
+
+def parse_csv(file):
+    """
+    Parse an uploaded CSV into expense items.
+
+    Each row holds one participant. Rows sharing the same `expense` reference
+    belong to the same expense, whose fields are taken from its first row.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+    missing = {'expense', *CSV_EXPENSE_FIELDS, 'user_id'} - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"Missing CSV columns: {', '.join(sorted(missing))}.")
+
+    items = {}
+    for row in reader:
+        ref = row['expense']
+        if ref not in items:
+            items[ref] = {field: row[field] for field in CSV_EXPENSE_FIELDS}
+            items[ref]['ref'] = ref
+            items[ref]['participants'] = []
+        items[ref]['participants'].append({
+            field: row[field] or None for field in CSV_PARTICIPANT_FIELDS if field in row
+        })
+    return list(items.values())
+
+
+def validate_batch(items):
+    """
+    Validate a batch of expense items, resolving all users in one query.
+
+    Returns (valid, errors) where `valid` is a list of (index, validated_data)
+    and `errors` is a list of (index, errors).
+    """
+    users = load_users(collect_user_ids(items), {})
+    valid = []
+    errors = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append((index, {'non_field_errors': ["Expected an expense object."]}))
+            continue
+        serializer = ExpenseSerializer(data=item, context={'users': users})
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors.append((index, serializer.errors))
+    return valid, errors
+
+
+def write_expenses(validated):
+    """
+    Insert validated expenses and their participants with batched inserts.
+    """
+    expenses = []
+    participants = []
+    for data in validated:
+        data = dict(data)
+        participants_data = data.pop('participants')
+        expense = Expense(**data, total_cents=splits.to_cents(data['total_amount']))
+        expenses.append(expense)
+        participants.extend(ExpenseSerializer.build_participants(expense, participants_data))
+
+    # bulk_create fills in the expense primary keys, which the participants
+    # pick up from their related expense when they are inserted.
+    Expense.objects.bulk_create(expenses, batch_size=BATCH_SIZE)
+    ExpenseParticipant.objects.bulk_create(participants, batch_size=BATCH_SIZE)
+    ExpenseSerializer.record_participants(participants)
+    return expenses
+
+
+def create_expenses(items, batch_size=BATCH_SIZE):
+    """
+    Validate and create many expenses at once.
+
+    Invalid items are reported without aborting the valid ones, which are all
+    written in a single transaction. Returns (created, errors) where `created`
+    lists (index, expense) and `errors` lists (index, errors).
+    """
+    created = []
+    errors = []
+    with transaction.atomic():
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            valid, batch_errors = validate_batch(batch)
+            errors.extend((start + index, error) for index, error in batch_errors)
+            expenses = write_expenses([data for _, data in valid])
+            created.extend((start + index, expense) for (index, _), expense in zip(valid, expenses))
+    return created, errors
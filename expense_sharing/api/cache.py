@@ -0,0 +1,161 @@
+# api/cache.py
+
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+GENERATION_KEY = 'generation'
+STATS_PREFIX = 'stats'
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def get_generation(cache):
+    """
+    Return the current generation, starting a new one if the counter is gone.
+
+    A cache may evict the counter like any other key. Restarting it from the
+    clock in nanoseconds puts it past every generation handed out before, so
+    responses cached under an old generation can never be read again.
+    """
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def invalidate():
+    """
+    Invalidate every cached response.
+
+    Rather than deleting keys, bump the generation that is part of each key;
+    stale entries are never read again and age out through LRU eviction or
+    the cache's TIMEOUT.
+    The bump is repeated once the surrounding transaction commits so a read
+    racing with the write cannot cache pre-commit data under the new
+    generation.
+    """
+    def bump():
+        cache = get_cache()
+        get_generation(cache)
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            # Evicted since get_generation(); a fresh one is newer anyway.
+            get_generation(cache)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def record(name, outcome):
+    cache = get_cache()
+    key = f'{STATS_PREFIX}:{name}:{outcome}'
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr(); losing one count is fine.
+        pass
+
+
+def get_stats(names):
+    cache = get_cache()
+    keys = [f'{STATS_PREFIX}:{name}:{outcome}' for name in names for outcome in ('hits', 'misses')]
+    values = cache.get_many(keys)
+    return {
+        name: {
+            outcome: values.get(f'{STATS_PREFIX}:{name}:{outcome}', 0)
+            for outcome in ('hits', 'misses')
+        }
+        for name in names
+    }
+
+
+def make_key(name, request, generation):
+    params = sorted(request.GET.lists())
+    digest = hashlib.sha1(repr((request.get_host(), request.path, params)).encode()).hexdigest()
+    return f'response:{name}:{generation}:{digest}'
+
+
+CACHED_VIEWS = []
+
+
+def cached_response(name, timeout=DEFAULT_TIMEOUT, max_streaming_bytes=None):
+    """
+    Cache a GET view's response per query parameter set until the next write,
+    or until `timeout` seconds pass (the cache's TIMEOUT by default).
+
+    DRF responses are cached as their data and re-rendered on a hit so
+    content negotiation still applies. Streaming responses are cached only
+    when the full body stays under `max_streaming_bytes`; larger ones are
+    streamed through untouched so memory use stays flat.
+    """
+    if max_streaming_bytes is None:
+        max_streaming_bytes = settings.RESPONSE_CACHE_MAX_STREAMING_BYTES
+    CACHED_VIEWS.append(name)
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            cache = get_cache()
+            key = make_key(name, request, get_generation(cache))
+            cached = cache.get(key)
+            if cached is not None:
+                record(name, 'hits')
+                kind, status, body, headers = cached
+                if kind == 'data':
+                    response = Response(body, status=status)
+                else:
+                    response = HttpResponse(body, status=status)
+                for header, value in headers:
+                    response[header] = value
+                return response
+
+            record(name, 'misses')
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+            if isinstance(response, Response):
+                headers = [(header, value) for header, value in response.items() if header != 'Content-Type']
+                cache.set(key, ('data', response.status_code, response.data, headers), timeout)
+            elif response.streaming:
+                response.streaming_content = tee_to_cache(
+                    response.streaming_content, cache, key, response, timeout, max_streaming_bytes,
+                )
+            return response
+        return wrapper
+    return decorator
+
+
+def tee_to_cache(chunks, cache, key, response, timeout, max_bytes):
+    """
+    Pass streamed chunks through, caching the body if it stays under `max_bytes`.
+    """
+    buffered = []
+    size = 0
+    for chunk in chunks:
+        if buffered is not None:
+            size += len(chunk)
+            if size > max_bytes:
+                buffered = None
+            else:
+                buffered.append(chunk)
+        yield chunk
+    if buffered is not None:
+        headers = list(response.items())
+        cache.set(key, ('content', response.status_code, b''.join(buffered), headers), timeout)
@@ -0,0 +1,82 @@
+# api/changes.py
+
+from django.db import connections, router
+
+from . import pubsub
+from .models import ExpenseChange
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+# Key of the PostgreSQL advisory lock serializing change-log inserts.
+CHANGE_LOG_LOCK = 0x65787063
+
+
+def record_changes(participants):
+    """
+    Append a change for every user involved in the expenses of `participants`:
+    each participant and each expense's creator.
+
+    Must run inside the transaction that writes the participants; event
+    stream subscribers are notified once it commits.
+
+    Readers page by id, so ids must become visible in order or a reader
+    could move its cursor past a change that commits later. SQLite
+    serializes writers; on PostgreSQL a transaction-level advisory lock
+    makes writers take ids and commit one at a time from here on. Other
+    databases are not supported.
+    """
+    connection = connections[router.db_for_write(ExpenseChange)]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CHANGE_LOG_LOCK])
+    pairs = {}
+    for participant in participants:
+        expense = participant.expense
+        pairs.setdefault((expense.id, participant.user_id), expense)
+        pairs.setdefault((expense.id, expense.created_by_id), expense)
+    changes = ExpenseChange.objects.bulk_create([
+        ExpenseChange(expense_id=expense_id, user_id=user_id)
+        for expense_id, user_id in sorted(pairs)
+    ])
+    pubsub.get_broker().publish_changes(changes)
+    return changes
+
+
+def latest_cursor(user_id):
+    """
+    Return the id of the user's newest change, or 0 when there is none.
+    """
+    return ExpenseChange.objects.filter(user_id=user_id).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def global_cursor():
+    """
+    Return the id of the newest change of any user, or 0 when there is none.
+    """
+    return ExpenseChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def change_rows(user_id, since, limit=PAGE_SIZE):
+    """
+    Return ([(id, expense_id), ...], has_more) for at most `limit` of the
+    user's changes after `since`, oldest first.
+    """
+    rows = list(
+        ExpenseChange.objects.filter(user_id=user_id, id__gt=since)
+        .order_by('id').values_list('id', 'expense_id')[:limit + 1]
+    )
+    return rows[:limit], len(rows) > limit
+
+
+def changes_since(user_id, since, limit=PAGE_SIZE):
+    """
+    Return (expense_ids, cursor, has_more) for the user's changes after `since`.
+
+    At most `limit` changes are read; `cursor` is the id of the last one
+    returned (or `since` when there are none) and `has_more` tells the client
+    to ask again straight away. Expense ids are unique and in change order.
+    """
+    rows, has_more = change_rows(user_id, since, limit)
+    expense_ids = list(dict.fromkeys(expense_id for _, expense_id in rows))
+    cursor = rows[-1][0] if rows else since
+    return expense_ids, cursor, has_more
@@ -0,0 +1,94 @@
+# api/conditional.py
+
+import functools
+import hashlib
+
+from django.views.decorators.http import condition
+
+from .models import CustomUser
+
+
+def user_state(request, **lookup):
+    """
+    Return (id, expense_version, modified_at, username, email,
+    mobile_number, last_expense_id) for the user matching `lookup`, or None.
+    Cached on the request so the ETag and Last-Modified callbacks and the view
+    itself share one query against the user table only.
+    """
+    cache = request.__dict__.setdefault('_user_state', {})
+    key = tuple(sorted(lookup.items()))
+    if key not in cache:
+        cache[key] = user_state_queryset(lookup).first()
+    return cache[key]
+
+
+async def auser_state(request, **lookup):
+    """
+    Async counterpart of `user_state`, filling the same per-request cache.
+    """
+    cache = request.__dict__.setdefault('_user_state', {})
+    key = tuple(sorted(lookup.items()))
+    if key not in cache:
+        cache[key] = await user_state_queryset(lookup).afirst()
+    return cache[key]
+
+
+def user_state_queryset(lookup):
+    return CustomUser.objects.filter(**lookup).values_list(
+        'id', 'expense_version', 'modified_at', 'username', 'email', 'mobile_number', 'last_expense_id'
+    )
+
+
+def prefetch_user_state(view):
+    """
+    Load the user state of an async view with the async ORM before the
+    `condition` callbacks, which are synchronous, read it from the cache.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if 'user_id' in kwargs:
+            await auser_state(request, id=kwargs['user_id'])
+        elif request.GET.get('username'):
+            await auser_state(request, username=request.GET['username'])
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def make_etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def expenses_etag(request, user_id, **kwargs):
+    """
+    ETag of a user's expense endpoints: their version plus the query string,
+    since filters and cursors select different pages of the same data.
+    """
+    state = user_state(request, id=user_id)
+    if state is None:
+        return None
+    _, version, *_ = state
+    return make_etag('expenses', request.path, user_id, version, request.META.get('QUERY_STRING', ''))
+
+
+def expenses_last_modified(request, user_id, **kwargs):
+    state = user_state(request, id=user_id)
+    return state[2] if state else None
+
+
+def user_detail_etag(request, user_id=None, **kwargs):
+    """
+    ETag of the user-detail endpoints, derived from the fields they return.
+    """
+    if user_id is None:
+        username = request.GET.get('username')
+        state = user_state(request, username=username) if username else None
+    else:
+        state = user_state(request, id=user_id)
+    if state is None:
+        return None
+    id, _, _, username, email, mobile_number, _ = state
+    return make_etag('user', id, username, email, mobile_number)
+
+
+expense_conditions = condition(etag_func=expenses_etag, last_modified_func=expenses_last_modified)
+user_conditions = condition(etag_func=user_detail_etag)
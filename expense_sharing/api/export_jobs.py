@@ -0,0 +1,202 @@
+# api/export_jobs.py
+#
+# Balance sheet exports too large to stream within a request. A job writes
+# the CSV to EXPORTS_DIR on a background thread; clients poll its status and
+# download the finished file, resuming with HTTP Range requests. A finished
+# export is reused for the same selection until new expenses are written.
+
+import hashlib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+
+from . import changes, exports
+from .models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.EXPORT_WORKERS, thread_name_prefix='export')
+        return _executor
+
+
+def job_path(job):
+    return settings.EXPORTS_DIR / f'{job.id}.csv'
+
+
+def selected_ids(job):
+    return [int(id) for id in job.expense_ids.split(',')] if job.expense_ids else None
+
+
+def expire_if_stale(job):
+    """
+    Mark `job` failed when it should long have finished; return whether it did.
+    """
+    if job.status not in (ExportJob.PENDING, ExportJob.RUNNING):
+        return False
+    if job.created_at > timezone.now() - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT):
+        return False
+    job.status = ExportJob.FAILED
+    job.error = "The export was interrupted."
+    job.finished_at = timezone.now()
+    ExportJob.objects.filter(id=job.id, status__in=[ExportJob.PENDING, ExportJob.RUNNING]).update(
+        status=job.status, error=job.error, finished_at=job.finished_at,
+    )
+    return True
+
+
+def start(expense_ids, user=None):
+    """
+    Return (job, created): a new export job for `expense_ids` (None for every
+    expense), or the job that already covers them and every expense written
+    so far.
+    """
+    expense_ids = '' if expense_ids is None else ','.join(map(str, sorted(set(expense_ids))))
+    selection = hashlib.sha1(expense_ids.encode()).hexdigest()
+    cursor = changes.global_cursor()
+    candidates = ExportJob.objects.filter(selection=selection, cursor=cursor).exclude(status=ExportJob.FAILED)
+    for job in candidates.order_by('-created_at'):
+        if expire_if_stale(job):
+            continue
+        if job.status != ExportJob.DONE or job_path(job).exists():
+            return job, False
+
+    with transaction.atomic():
+        job = ExportJob.objects.create(requested_by=user, expense_ids=expense_ids, selection=selection, cursor=cursor)
+        transaction.on_commit(lambda: submit(job.id))
+    return job, True
+
+
+def submit(job_id):
+    if settings.EXPORT_WORKERS == 0:
+        run(job_id)
+    else:
+        get_executor().submit(run_in_thread, job_id)
+
+
+def run_in_thread(job_id):
+    try:
+        run(job_id)
+    finally:
+        # Worker threads keep their own connections; do not leak them.
+        connections.close_all()
+
+
+def run(job_id, chunk_size=5000):
+    """
+    Write the export of job `job_id` unless another worker took it already.
+    """
+    if not ExportJob.objects.filter(id=job_id, status=ExportJob.PENDING).update(status=ExportJob.RUNNING):
+        return
+    job = ExportJob.objects.get(id=job_id)
+    path = job_path(job)
+    partial = path.with_suffix('.partial')
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(partial, 'w', encoding='utf-8', newline='') as file:
+            for block in exports.stream_balance_sheet(selected_ids(job), chunk_size):
+                file.write(block)
+        partial.replace(path)
+    except Exception as error:
+        logger.exception("Export %s failed", job_id)
+        partial.unlink(missing_ok=True)
+        ExportJob.objects.filter(id=job_id).update(status=ExportJob.FAILED, error=str(error), finished_at=timezone.now())
+        return
+    ExportJob.objects.filter(id=job_id).update(status=ExportJob.DONE, size=path.stat().st_size, finished_at=timezone.now())
+    remove_superseded(job)
+
+
+def remove_superseded(job):
+    """
+    Delete older exports of the same selection, which newer expenses made stale.
+    """
+    older = ExportJob.objects.filter(selection=job.selection, cursor__lt=job.cursor).exclude(
+        status__in=[ExportJob.PENDING, ExportJob.RUNNING],
+    )
+    for old in older:
+        job_path(old).unlink(missing_ok=True)
+    older.delete()
+
+
+def parse_range(header, size):
+    """
+    Return the inclusive (start, end) byte range a Range header asks for,
+    or None to send the whole file. Only single ranges are honoured.
+    Raises ValueError when the range lies outside the file.
+    """
+    match = RANGE_PATTERN.match(header.replace(' ', ''))
+    if match is None or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # A suffix range: the last `last` bytes.
+        if int(last) == 0 or size == 0:
+            raise ValueError(header)
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def read_blocks(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            block = file.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def file_response(request, job, filename):
+    """
+    Serve a finished export, or the byte range the request asks for.
+    """
+    path = job_path(job)
+    size = path.stat().st_size
+    # Export files never change, so the job id identifies the content.
+    etag = f'"{job.id}"'
+    byte_range = None
+    header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if header and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type='text/csv')
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(read_blocks(path, start, end - start + 1), status=206, content_type='text/csv')
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
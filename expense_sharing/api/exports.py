@@ -0,0 +1,237 @@
+# api/exports.py
+
+import csv
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.db import connections
+from django.db.models import Max, Min
+
+from .models import Expense, ExpenseParticipant
+
+BALANCE_SHEET_HEADER = [
+    'Expense ID', 'Name', 'Total Amount', 'Split Type', 'Created At',
+    'Participant Username', 'Amount Owed', 'Percentage Owed'
+]
+
+BALANCE_SHEET_COLUMNS = (
+    'expense_id',
+    'expense__name',
+    'expense__total_amount',
+    'expense__split_type',
+    'expense__created_at',
+    'user__username',
+    'amount_owed',
+    'percentage_owed',
+)
+
+
+# NDJSON keys, in the order of BALANCE_SHEET_HEADER.
+BALANCE_SHEET_KEYS = [
+    'expense_id', 'name', 'total_amount', 'split_type', 'created_at',
+    'participant_username', 'amount_owed', 'percentage_owed',
+]
+
+FORMATS = ('csv', 'ndjson')
+
+
+class Echo:
+    """
+    File-like object whose write() returns the value instead of buffering it.
+    """
+    def write(self, value):
+        return value
+
+
+def balance_sheet_rows(expense_ids=None, chunk_size=2000, id_range=None):
+    """
+    Yield balance sheet rows from a single joined, chunked query, optionally
+    limited to the expenses with ids in `id_range`, a (first, last) pair.
+    """
+    participants = ExpenseParticipant.objects.all()
+    if expense_ids is not None:
+        participants = participants.filter(expense_id__in=expense_ids)
+    if id_range is not None:
+        participants = participants.filter(expense_id__gte=id_range[0], expense_id__lte=id_range[1])
+    rows = participants.order_by('expense_id', 'id').values_list(*BALANCE_SHEET_COLUMNS)
+
+    for expense_id, name, total_amount, split_type, created_at, username, amount_owed, percentage_owed in rows.iterator(chunk_size=chunk_size):
+        yield [
+            expense_id,
+            name,
+            total_amount,
+            split_type,
+            created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            username,
+            amount_owed if amount_owed else '',
+            percentage_owed if percentage_owed else '',
+        ]
+
+
+def stream_balance_sheet(expense_ids=None, chunk_size=2000):
+    """
+    Yield the balance sheet CSV in blocks of at most `chunk_size` lines.
+    """
+    writer = csv.writer(Echo())
+    lines = [writer.writerow(BALANCE_SHEET_HEADER)]
+    for row in balance_sheet_rows(expense_ids, chunk_size):
+        lines.append(writer.writerow(row))
+        if len(lines) >= chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def write_balance_sheet(file, rows, format='csv', header=True):
+    """
+    Write balance sheet `rows` to the text `file` as CSV or NDJSON (one
+    object per line, empty amounts as null); return the number of rows.
+    """
+    count = 0
+    if format == 'csv':
+        writer = csv.writer(file)
+        if header:
+            writer.writerow(BALANCE_SHEET_HEADER)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        return count
+    for row in rows:
+        record = dict(zip(BALANCE_SHEET_KEYS, row))
+        for key in ('total_amount', 'amount_owed', 'percentage_owed'):
+            record[key] = str(record[key]) if record[key] != '' else None
+        file.write(json.dumps(record, ensure_ascii=False))
+        file.write('\n')
+        count += 1
+    return count
+
+
+def open_output(path, compress):
+    """
+    Open `path` for writing text, gzip-compressed when `compress` is set.
+    """
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=6)
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def id_chunks(chunk_size):
+    """
+    Split the current expense id range into (first, last) ranges of at most
+    `chunk_size` ids. The last id is read once, so expenses written during
+    the export are left out consistently.
+    """
+    bounds = Expense.objects.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return []
+    return [
+        (first, min(first + chunk_size - 1, bounds['last']))
+        for first in range(bounds['first'], bounds['last'] + 1, chunk_size)
+    ]
+
+
+def export_part(path, id_range, format, compress, header):
+    """
+    Write the rows of the expenses in `id_range` to `path`; return a manifest entry.
+    """
+    with open_output(path, compress) as file:
+        rows = write_balance_sheet(file, balance_sheet_rows(id_range=id_range), format, header)
+    return {
+        'file': Path(path).name,
+        'first_expense_id': id_range[0],
+        'last_expense_id': id_range[1],
+        'rows': rows,
+        'bytes': os.path.getsize(path),
+        'sha256': file_digest(path),
+    }
+
+
+def init_worker():
+    """
+    Set up Django in a pool process started with "spawn"; forked ones have it.
+    """
+    import django
+    from django.apps import apps
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'expense_sharing.settings')
+    if not apps.ready:
+        django.setup()
+
+
+def export_parts(directory, chunks, format, compress, header, processes, suffix):
+    """
+    Render one part file per chunk in `directory` on `processes` worker
+    processes (inline for 1); return their manifest entries in id order.
+    """
+    tasks = [
+        (str(Path(directory) / f'part-{index:05d}{suffix}'), chunk, format, compress, header)
+        for index, chunk in enumerate(chunks)
+    ]
+    if processes == 1:
+        return [export_part(*task) for task in tasks]
+    # Children open their own connections; close ours so none is inherited open.
+    connections.close_all()
+    with ProcessPoolExecutor(processes, initializer=init_worker) as pool:
+        return list(pool.map(export_part, *zip(*tasks)))
+
+
+def export_expenses(output, format='csv', compress=False, partitioned=False, processes=1, chunk_size=100_000):
+    """
+    Export the balance sheet of every expense to `output`, rendering chunks
+    of `chunk_size` expense ids in parallel. Return the manifest.
+
+    With `partitioned`, `output` is a directory of part files, each with its
+    own CSV header, and a manifest.json. Otherwise the parts are concatenated
+    into the single file `output`; gzip members concatenate into a valid
+    gzip file, so compressed parts are appended as they are.
+    """
+    output = Path(output)
+    suffix = f'.{format}' + ('.gz' if compress else '')
+    chunks = id_chunks(chunk_size)
+    manifest = {
+        'format': format,
+        'compression': 'gzip' if compress else None,
+        'columns': BALANCE_SHEET_HEADER if format == 'csv' else BALANCE_SHEET_KEYS,
+    }
+
+    if partitioned:
+        output.mkdir(parents=True, exist_ok=True)
+        parts = export_parts(output, chunks, format, compress, True, processes, suffix)
+        for part in parts:
+            if part['rows'] == 0:
+                (output / part['file']).unlink()
+        manifest['parts'] = [part for part in parts if part['rows']]
+        manifest['rows'] = sum(part['rows'] for part in parts)
+        (output / 'manifest.json').write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+        return manifest
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=output.parent, prefix=f'.{output.name}.') as directory:
+        parts = export_parts(directory, chunks, format, compress, False, processes, suffix)
+        partial = Path(directory) / output.name
+        if format == 'csv':
+            with open_output(partial, compress) as file:
+                csv.writer(file).writerow(BALANCE_SHEET_HEADER)
+        with open(partial, 'ab') as file:
+            for part in parts:
+                with open(Path(directory) / part['file'], 'rb') as source:
+                    shutil.copyfileobj(source, file, 1024 * 1024)
+        partial.replace(output)
+    manifest['rows'] = sum(part['rows'] for part in parts)
+    manifest['bytes'] = output.stat().st_size
+    return manifest
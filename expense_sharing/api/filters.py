@@ -0,0 +1,59 @@
+# api/filters.py
+
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import Expense
+
+
+def parse_moment(value, end_of_day=False):
+    """
+    Parse an ISO date or datetime query parameter into an aware datetime.
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filter_expenses(queryset, params):
+    """
+    Apply the optional expense list filters from the query parameters.
+
+    Supported parameters: created_after, created_before (ISO dates or
+    datetimes, inclusive), created_by (user id) and split_type.
+    """
+    errors = {}
+
+    for param, lookup, end_of_day in (('created_after', 'created_at__gte', False), ('created_before', 'created_at__lte', True)):
+        value = params.get(param)
+        if value:
+            try:
+                queryset = queryset.filter(**{lookup: parse_moment(value, end_of_day)})
+            except ValueError:
+                errors[param] = ["Enter a valid ISO 8601 date or datetime."]
+
+    created_by = params.get('created_by')
+    if created_by:
+        try:
+            queryset = queryset.filter(created_by_id=int(created_by))
+        except ValueError:
+            errors['created_by'] = ["A valid integer is required."]
+
+    split_type = params.get('split_type')
+    if split_type:
+        if split_type not in dict(Expense.SPLIT_CHOICES):
+            errors['split_type'] = ["Invalid split type."]
+        queryset = queryset.filter(split_type=split_type)
+
+    if errors:
+        raise ValidationError(errors)
+    return queryset
@@ -0,0 +1,144 @@
+# api/ledger.py
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import F, Q
+
+from . import splits
+from .models import Balance, ExpenseParticipant
+
+
+def compute_deltas(rows):
+    """
+    Turn (debtor_id, creditor_id, amount) rows into per-pair balance deltas.
+
+    Each debt is recorded on the pair and negated on its mirror. Rows where a
+    user owes themselves (the creator's own share) are ignored.
+    """
+    deltas = defaultdict(Decimal)
+    for debtor_id, creditor_id, amount in rows:
+        if debtor_id == creditor_id or not amount:
+            continue
+        deltas[(debtor_id, creditor_id)] += amount
+        deltas[(creditor_id, debtor_id)] -= amount
+    return deltas
+
+
+def participant_rows(participants):
+    """
+    Yield ledger rows for saved `ExpenseParticipant` instances.
+    """
+    for participant in participants:
+        yield participant.user_id, participant.expense.created_by_id, participant.amount_owed
+
+
+def apply_deltas(deltas):
+    """
+    Add `deltas` to the stored balances.
+
+    Must run inside the transaction that writes the participants so the
+    ledger never drifts from the raw rows, after locking the rows of every
+    user in `deltas` (see `ExpenseSerializer.record_participants`): the row
+    locks below cannot cover pairs that have no balance yet, and two
+    writers creating the same pair would otherwise both insert from zero.
+    """
+    if not deltas:
+        return
+
+    # Group the pairs around the user with the most counterparties (usually
+    # the expense creator) so the lookup stays a handful of indexed clauses
+    # instead of one clause per pair.
+    degree = defaultdict(int)
+    for debtor_id, _ in deltas:
+        degree[debtor_id] += 1
+    counterparties = defaultdict(set)
+    for debtor_id, creditor_id in deltas:
+        hub, other = sorted((debtor_id, creditor_id), key=lambda user_id: (-degree[user_id], user_id))
+        counterparties[hub].add(other)
+    lookup = Q()
+    for user_id, others in counterparties.items():
+        lookup |= Q(debtor_id=user_id, creditor_id__in=others) | Q(creditor_id=user_id, debtor_id__in=others)
+
+    existing = {
+        (debtor_id, creditor_id): amount
+        for debtor_id, creditor_id, amount in Balance.objects.select_for_update().filter(lookup).values_list('debtor_id', 'creditor_id', 'amount')
+    }
+
+    # The affected rows are locked above, so their new totals can be written
+    # back with a single upsert on the pair covering new and existing rows.
+    balances = [
+        Balance(debtor_id=debtor_id, creditor_id=creditor_id, amount=existing.get((debtor_id, creditor_id), 0) + delta)
+        for (debtor_id, creditor_id), delta in deltas.items()
+    ]
+
+    Balance.objects.bulk_create(
+        balances,
+        update_conflicts=True,
+        unique_fields=['debtor', 'creditor'],
+        update_fields=['amount'],
+    )
+
+
+def record_participants(participants):
+    """
+    Update the ledger for newly written participants.
+    """
+    apply_deltas(compute_deltas(participant_rows(participants)))
+
+
+def compute_from_rows():
+    """
+    Compute every pairwise balance directly from the `ExpenseParticipant` rows.
+    """
+    totals = (
+        ExpenseParticipant.objects
+        .exclude(user_id=F('expense__created_by_id'))
+        .exclude(amount_owed__isnull=True)
+        .values_list('user_id', 'expense__created_by_id')
+        .annotate(total=splits.owed_total())
+        .order_by()
+    )
+    return compute_deltas(
+        (debtor_id, creditor_id, splits.owed_decimal(total))
+        for debtor_id, creditor_id, total in totals
+    )
+
+
+def stored_balances():
+    """
+    Return the stored ledger as a {(debtor_id, creditor_id): amount} dict.
+    """
+    return {
+        (debtor_id, creditor_id): amount
+        for debtor_id, creditor_id, amount in Balance.objects.values_list('debtor_id', 'creditor_id', 'amount')
+    }
+
+
+def find_mismatches(expected, actual):
+    """
+    Compare two balance dicts, treating missing pairs as zero.
+    """
+    mismatches = []
+    for pair in sorted(set(expected) | set(actual)):
+        want = expected.get(pair, Decimal('0.00'))
+        got = actual.get(pair, Decimal('0.00'))
+        if want != got:
+            mismatches.append((pair, want, got))
+    return mismatches
+
+
+def rebuild(batch_size=1000):
+    """
+    Replace the stored ledger with balances recomputed from the raw rows.
+    """
+    deltas = compute_from_rows()
+    Balance.objects.all().delete()
+    Balance.objects.bulk_create(
+        [
+            Balance(debtor_id=debtor_id, creditor_id=creditor_id, amount=amount)
+            for (debtor_id, creditor_id), amount in deltas.items()
+        ],
+        batch_size=batch_size,
+    )
+    return len(deltas)
@@ -0,0 +1,42 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import exports
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the balance sheet of every expense for offline analytics, "
+        "rendering chunks of the expense id range on a pool of processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Output file, or directory with --partitioned.")
+        parser.add_argument('--format', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--gzip', action='store_true', help="Compress the output with gzip.")
+        parser.add_argument(
+            '--partitioned', action='store_true',
+            help="Write one file per chunk and a manifest.json into the output directory.",
+        )
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', type=int, default=100_000, help="Expense ids per chunk.")
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1 or options['chunk_size'] < 1:
+            raise CommandError("--processes and --chunk-size must be positive.")
+        start = time.perf_counter()
+        manifest = exports.export_expenses(
+            options['output'],
+            format=options['format'],
+            compress=options['gzip'],
+            partitioned=options['partitioned'],
+            processes=options['processes'],
+            chunk_size=options['chunk_size'],
+        )
+        parts = f" in {len(manifest['parts'])} parts" if options['partitioned'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {manifest['rows']} rows{parts} to {options['output']} "
+            f"in {time.perf_counter() - start:.1f}s."
+        ))
@@ -0,0 +1,56 @@
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import profiling
+
+
+class Command(BaseCommand):
+    help = "List, show and diff the request profiles saved with X-Profile."
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest='action', required=True)
+        actions.add_parser('list', help="List saved profiles, oldest first.")
+        show = actions.add_parser('show', help="Print the top functions of a cProfile profile.")
+        show.add_argument('profile_id')
+        show.add_argument('--sort', default='cumulative', choices=['cumulative', 'tottime', 'calls'])
+        show.add_argument('--limit', type=int, default=30)
+        diff = actions.add_parser('diff', help="Compare two cProfile profiles function by function.")
+        diff.add_argument('before')
+        diff.add_argument('after')
+        diff.add_argument('--limit', type=int, default=20)
+
+    def handle(self, *args, **options):
+        getattr(self, f"handle_{options['action']}")(**options)
+
+    def handle_list(self, **options):
+        profiles = profiling.list_profiles()
+        if not profiles:
+            self.stdout.write("No profiles saved.")
+            return
+        for profile in profiles:
+            self.stdout.write(
+                f"{profile['id']:<52} {profile['mode']:<9} {profile['status']:>4} "
+                f"{profile['duration_ms']:>10.1f} ms  {profile['method']} {profile['path']}"
+            )
+
+    def handle_show(self, profile_id, sort, limit, **options):
+        stats = self.load(profile_id)
+        stats.stream = io.StringIO()
+        stats.sort_stats(sort).print_stats(limit)
+        self.stdout.write(stats.stream.getvalue())
+
+    def handle_diff(self, before, after, limit, **options):
+        rows = profiling.diff_stats(self.load(before), self.load(after))
+        self.stdout.write(f"{'calls':>17} {'cumulative s':>23}  function")
+        for label, calls_before, calls_after, cumulative_before, cumulative_after in rows[:limit]:
+            self.stdout.write(
+                f"{calls_before:>8} {calls_after:>8} {cumulative_before:>9.4f} {cumulative_after:>9.4f} "
+                f"{cumulative_after - cumulative_before:>+9.4f}  {label}"
+            )
+
+    def load(self, profile_id):
+        try:
+            return profiling.load_stats(profile_id)
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import ledger
+
+
+class Command(BaseCommand):
+    help = "Rebuild the pairwise balance ledger from the raw expense rows and verify it."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Only compare the stored ledger against the raw rows, without rewriting it.",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            with transaction.atomic():
+                count = ledger.rebuild(batch_size=options['batch_size'])
+            self.stdout.write(f"Rebuilt {count} balance rows.")
+
+        mismatches = ledger.find_mismatches(ledger.compute_from_rows(), ledger.stored_balances())
+        for (debtor_id, creditor_id), expected, stored in mismatches:
+            self.stderr.write(
+                f"User {debtor_id} -> user {creditor_id}: expected {expected}, stored {stored}"
+            )
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} balance rows do not match the expense rows.")
+        self.stdout.write(self.style.SUCCESS("Balance ledger matches the expense rows."))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily spending rollups from the raw expense rows and verify them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Only compare the stored rollups against the raw rows, without rewriting them.",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            with transaction.atomic():
+                count = rollups.rebuild(batch_size=options['batch_size'])
+            self.stdout.write(f"Rebuilt {count} daily rollup rows.")
+
+        mismatches = rollups.find_mismatches(rollups.compute_from_rows(), rollups.stored_rollups())
+        for (user_id, day), (expected_owed, expected_paid), (owed, paid) in mismatches:
+            self.stderr.write(
+                f"User {user_id} on {day}: expected owed {expected_owed} and paid {expected_paid}, "
+                f"stored owed {owed} and paid {paid}"
+            )
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} rollup rows do not match the expense rows.")
+        self.stdout.write(self.style.SUCCESS("Daily rollups match the expense rows."))
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import seeding
+from api.models import CustomUser, Expense
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill an empty database with a deterministic synthetic dataset: users, "
+        "expenses with skewed group sizes and a mix of split types. Every user's "
+        f"password is {seeding.PASSWORD!r}."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--expenses', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives the same data.")
+        parser.add_argument('--max-participants', type=int, default=20)
+        parser.add_argument(
+            '--skew', type=float, default=1.0,
+            help="Zipf exponent of how often each user takes part in an expense; 0 picks users uniformly.",
+        )
+        parser.add_argument(
+            '--split-mix', default='EQUAL:60,EXACT:25,PERCENTAGE:15',
+            help="Relative weights of the split types.",
+        )
+        parser.add_argument('--days', type=int, default=730, help="Spread the expenses over this many days.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['expenses'] < 0:
+            raise CommandError("Need at least 2 users and a non-negative number of expenses.")
+        try:
+            split_mix = seeding.parse_split_mix(options['split_mix'])
+        except ValueError as error:
+            raise CommandError(str(error))
+        if Expense.objects.exists() or CustomUser.objects.filter(username__startswith='seed').exists():
+            raise CommandError(
+                "The database already has data; seed a fresh one, e.g. "
+                "SQLITE_PATH=/tmp/seed.sqlite3 python manage.py migrate first."
+            )
+
+        start = time.perf_counter()
+
+        def progress(expenses, participants):
+            if options['verbosity'] > 1 or expenses == options['expenses']:
+                self.stdout.write(
+                    f"{expenses} expenses, {participants} participants "
+                    f"({time.perf_counter() - start:.1f}s)"
+                )
+
+        seeding.seed(
+            users=options['users'],
+            expenses=options['expenses'],
+            seed=options['seed'],
+            max_participants=options['max_participants'],
+            skew=options['skew'],
+            split_mix=split_mix,
+            days=options['days'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {options['users']} users and {options['expenses']} expenses "
+            f"in {time.perf_counter() - start:.1f}s."
+        ))
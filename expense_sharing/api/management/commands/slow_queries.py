@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import slow_queries
+
+SORT_KEYS = {
+    'total': lambda group: group['total_ms'],
+    'max': lambda group: group['max_ms'],
+    'count': lambda group: group['count'],
+}
+
+
+class Command(BaseCommand):
+    help = "Summarise the slow query log: the statements costing the most time, with their plans."
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help="Log files to read (default: SLOW_QUERY_LOG and its backups).")
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='total')
+        parser.add_argument('--sql-width', type=int, default=200, help="Truncate SQL to this many characters (0 for no limit).")
+
+    def handle(self, *args, **options):
+        paths = options['files'] or slow_queries.log_files()
+        if not paths:
+            raise CommandError("No slow query log found.")
+        groups = slow_queries.summarize(slow_queries.read_entries(paths))
+        if not groups:
+            self.stdout.write("No slow queries logged.")
+            return
+
+        groups.sort(key=SORT_KEYS[options['sort']], reverse=True)
+        width = options['sql_width']
+        for rank, group in enumerate(groups[:options['top']], 1):
+            sql = group['sql'] if not width or len(group['sql']) <= width else group['sql'][:width] + '...'
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"#{rank}  {group['count']} calls, {group['total_ms']:.1f} ms total, "
+                f"{group['total_ms'] / group['count']:.1f} ms avg, {group['max_ms']:.1f} ms max"
+            ))
+            self.stdout.write(f"    views:   {', '.join(sorted(group['views'])) or '-'}")
+            self.stdout.write(f"    callers: {', '.join(sorted(group['callers'])) or '-'}")
+            self.stdout.write(f"    last:    {group['last_seen'] or '-'}")
+            self.stdout.write(f"    sql:     {sql}")
+            for line in group['plan'] or []:
+                self.stdout.write(f"    plan:    {line}")
+        self.stdout.write(f"{len(groups)} distinct statements in {len(paths)} file(s).")
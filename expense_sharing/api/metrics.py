@@ -0,0 +1,158 @@
+# api/metrics.py
+#
+# In-process request metrics exposed in the Prometheus text format. Every
+# worker process keeps its own counters, as with the client libraries'
+# default mode, so each worker has to be scraped separately.
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Query totals of the request being served. Context variables follow the
+# request into sync_to_async threads, so queries issued by async views count.
+request_queries = ContextVar('request_queries', default=None)
+# The request being served, for logs that name the calling view.
+current_request = ContextVar('current_request', default=None)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(self.values.items()):
+            yield f'{self.name}{format_labels(self.labels, labels)} {format_value(value)}'
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [count per bucket (the last one is +Inf), sum]
+        self.values = {}
+
+    def observe(self, labels, value):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{format_labels(self.labels, labels, [("le", bound)])} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labels, labels)} {format_value(total)}'
+            yield f'{self.name}_count{format_labels(self.labels, labels)} {cumulative}'
+
+
+lock = threading.Lock()
+
+requests_total = Counter(
+    'http_requests_total', 'Requests by route, method and status code.', ('route', 'method', 'status'),
+)
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Time until the response is returned, by route.',
+    ('route', 'method'), LATENCY_BUCKETS,
+)
+request_queries_histogram = Histogram(
+    'http_request_db_queries', 'Database queries per request, by route.',
+    ('route', 'method'), QUERY_COUNT_BUCKETS,
+)
+request_query_duration = Histogram(
+    'http_request_db_duration_seconds', 'Time spent in database queries per request, by route.',
+    ('route', 'method'), LATENCY_BUCKETS,
+)
+response_size = Histogram(
+    'http_response_size_bytes', 'Response body size, by route.', ('route', 'method'), SIZE_BUCKETS,
+)
+METRICS = [requests_total, request_duration, request_queries_histogram, request_query_duration, response_size]
+
+
+def record_request(route, method, status, duration, queries, query_duration, size):
+    """
+    Record one finished request; `size` is None while a streamed body is still being sent.
+    """
+    labels = (route, method)
+    with lock:
+        requests_total.inc((route, method, str(status)))
+        request_duration.observe(labels, duration)
+        request_queries_histogram.observe(labels, queries)
+        request_query_duration.observe(labels, query_duration)
+        if size is not None:
+            response_size.observe(labels, size)
+
+
+def record_size(route, method, size):
+    with lock:
+        response_size.observe((route, method), size)
+
+
+def render():
+    with lock:
+        lines = [line for metric in METRICS for line in metric.collect()]
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with lock:
+        for metric in METRICS:
+            metric.values.clear()
+
+
+def instrument_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection: adds the query and its
+    duration to the current request's totals, if any.
+    """
+    totals = request_queries.get()
+    if totals is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        totals[0] += 1
+        totals[1] += time.perf_counter() - start
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """
+    `connection_created` receiver adding `instrument_query` to new connections.
+    """
+    if instrument_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(instrument_query)
@@ -0,0 +1,250 @@
+# api/middleware.py
+
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics, profiling, routers
+
+logger = logging.getLogger(__name__)
+
+
+def sends_file(response):
+    """
+    Whether the response body is still a file the server can send itself
+    (`wsgi.file_wrapper`, sendfile). Wrapping the body would copy it through
+    Python instead, so middleware leaves these responses alone.
+    """
+    return getattr(response, 'file_to_stream', None) is not None
+
+
+class MetricsMiddleware:
+    """
+    Record latency, database queries, response size and status per route.
+
+    Routes are labelled with the URL name, so the number of series stays
+    bounded by urls.py. Works for sync and async views alike; a sync-only
+    middleware would run every async view, event streams included, through
+    a thread. Streamed bodies are measured once fully sent, and files by
+    their Content-Length; their latency is the time to the first byte.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        totals = [0, 0.0]
+        token = metrics.request_queries.set(totals)
+        request_token = metrics.current_request.set(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_request.reset(request_token)
+            metrics.request_queries.reset(token)
+        return self.record(request, response, time.perf_counter() - start, totals)
+
+    async def __acall__(self, request):
+        totals = [0, 0.0]
+        token = metrics.request_queries.set(totals)
+        request_token = metrics.current_request.set(request)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_request.reset(request_token)
+            metrics.request_queries.reset(token)
+        return self.record(request, response, time.perf_counter() - start, totals)
+
+    def record(self, request, response, duration, totals):
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        size = None
+        if sends_file(response):
+            if response.has_header('Content-Length'):
+                size = int(response['Content-Length'])
+        elif response.streaming:
+            response.streaming_content = (
+                count_async_bytes(response.streaming_content, route, request.method) if response.is_async
+                else count_bytes(response.streaming_content, route, request.method)
+            )
+        else:
+            size = len(response.content)
+        metrics.record_request(route, request.method, response.status_code, duration, totals[0], totals[1], size)
+        return response
+
+
+def count_bytes(chunks, route, method):
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        metrics.record_size(route, method, size)
+
+
+async def count_async_bytes(chunks, route, method):
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        metrics.record_size(route, method, size)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let the reads of GET and HEAD requests go to a read replica; see
+    api/routers.py. Sync streamed bodies read from the same replica; async
+    ones (event streams) read from the primary, where changes appear first.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        state = routers.ReplicaReads()
+        token = routers.replica_reads.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.replica_reads.reset(token)
+        if response.streaming and not response.is_async and not sends_file(response):
+            # CSV exports query while their body is being sent.
+            response.streaming_content = read_from_replica(response.streaming_content, state)
+        return response
+
+    async def __acall__(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return await self.get_response(request)
+        token = routers.replica_reads.set(routers.ReplicaReads())
+        try:
+            return await self.get_response(request)
+        finally:
+            routers.replica_reads.reset(token)
+
+
+def read_from_replica(chunks, state):
+    """
+    Generate `chunks` with the request's replica routing in effect.
+    """
+    chunks = iter(chunks)
+    while True:
+        token = routers.replica_reads.set(state)
+        try:
+            chunk = next(chunks, None)
+        finally:
+            routers.replica_reads.reset(token)
+        if chunk is None:
+            return
+        yield chunk
+
+
+class ProfilerMiddleware:
+    """
+    Run a request under a profiler when a staff user asks for it with
+    `X-Profile` or `?profile`; see api/profiling.py.
+
+    Streamed bodies are profiled while they are sent, since that is where
+    CSV exports do their work, and the profile is saved once they end; async
+    ones are left alone as they may never end, and files are left for the
+    server to send (see `sends_file`). Under ASGI only the event
+    loop thread is profiled. While one request is being profiled, others
+    asking for a profile run unprofiled with an `X-Profile-Skipped` header.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mode = profiling.requested_mode(request)
+        if mode is None or not profiling.is_staff(request):
+            return self.get_response(request)
+        if not profiling.lock.acquire(blocking=False):
+            return self.skip(request, self.get_response(request))
+        streaming = False
+        try:
+            profiler = profiling.RequestProfiler(mode)
+            start = time.perf_counter()
+            profiler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop()
+            if response.streaming and not response.is_async and not sends_file(response):
+                streaming = True
+                return self.profile_stream(profiler, request, response, start)
+            return self.finish(profiler, request, response, time.perf_counter() - start)
+        finally:
+            # A profiled stream releases the lock once its body ends.
+            if not streaming:
+                profiling.lock.release()
+
+    async def __acall__(self, request):
+        mode = profiling.requested_mode(request)
+        if mode is None or not await profiling.ais_staff(request):
+            return await self.get_response(request)
+        if not profiling.lock.acquire(blocking=False):
+            return self.skip(request, await self.get_response(request))
+        try:
+            profiler = profiling.RequestProfiler(mode)
+            start = time.perf_counter()
+            profiler.start()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.stop()
+            return self.finish(profiler, request, response, time.perf_counter() - start)
+        finally:
+            profiling.lock.release()
+
+    def skip(self, request, response):
+        logger.warning("Not profiling %s %s: another request is being profiled", request.method, request.path)
+        response['X-Profile-Skipped'] = 'another request is being profiled'
+        return response
+
+    def finish(self, profiler, request, response, duration):
+        response['X-Profile-Id'] = profiler.save(request, response, duration)
+        response['X-Profile-Mode'] = profiler.mode
+        return response
+
+    def profile_stream(self, profiler, request, response, start):
+        """
+        Profile the body as it is sent; the headers go out first, so the
+        profile id is chosen now and the profile written when the body ends.
+        """
+        profile_id = profiling.new_profile_id(request)
+
+        def on_finish():
+            try:
+                profiler.save(request, response, time.perf_counter() - start, profile_id)
+            finally:
+                profiling.lock.release()
+
+        response.streaming_content = profiling.ProfiledStream(response.streaming_content, profiler, on_finish)
+        response['X-Profile-Id'] = profile_id
+        response['X-Profile-Mode'] = profiler.mode
+        return response
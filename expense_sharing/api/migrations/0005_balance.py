@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:15
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def backfill_balances(apps, schema_editor):
+    ExpenseParticipant = apps.get_model('api', 'ExpenseParticipant')
+    Balance = apps.get_model('api', 'Balance')
+    owed = (
+        ExpenseParticipant.objects
+        .exclude(amount_owed__isnull=True)
+        .exclude(user_id=F('expense__created_by_id'))
+        .values_list('user_id', 'expense__created_by_id')
+        .annotate(total=Sum('amount_owed'))
+        .order_by()
+    )
+    balances = defaultdict(Decimal)
+    for debtor_id, creditor_id, total in owed:
+        total = total.quantize(Decimal('0.01'))
+        balances[(debtor_id, creditor_id)] += total
+        balances[(creditor_id, debtor_id)] -= total
+    Balance.objects.bulk_create([
+        Balance(debtor_id=debtor_id, creditor_id=creditor_id, amount=amount)
+        for (debtor_id, creditor_id), amount in balances.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_expense_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Balance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('creditor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('debtor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('debtor', 'creditor'), name='unique_balance_pair')],
+            },
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_last_expense(apps, schema_editor):
+    CustomUser = apps.get_model('api', 'CustomUser')
+    ExpenseParticipant = apps.get_model('api', 'ExpenseParticipant')
+    latest = (
+        ExpenseParticipant.objects
+        .filter(user=models.OuterRef('pk'))
+        .order_by('-expense__created_at', '-expense_id')
+        .values('expense_id')[:1]
+    )
+    CustomUser.objects.update(last_expense=models.Subquery(latest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_expense_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='last_expense',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.expense'),
+        ),
+        migrations.AddIndex(
+            model_name='expenseparticipant',
+            index=models.Index(fields=['user', 'expense'], name='participant_user_expense_idx'),
+        ),
+        migrations.RunPython(backfill_last_expense, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:26
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_latest_expense_pointer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='expense_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_changes(apps, schema_editor):
+    Expense = apps.get_model('api', 'Expense')
+    ExpenseChange = apps.get_model('api', 'ExpenseChange')
+    ExpenseParticipant = apps.get_model('api', 'ExpenseParticipant')
+    creators = dict(Expense.objects.values_list('id', 'created_by_id'))
+    users_by_expense = {expense_id: {creator_id} for expense_id, creator_id in creators.items()}
+    for expense_id, user_id in ExpenseParticipant.objects.values_list('expense_id', 'user_id'):
+        users_by_expense[expense_id].add(user_id)
+    ordered = Expense.objects.order_by('created_at', 'id').values_list('id', flat=True)
+    ExpenseChange.objects.bulk_create([
+        ExpenseChange(expense_id=expense_id, user_id=user_id)
+        for expense_id in ordered
+        for user_id in sorted(users_by_expense[expense_id])
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_user_expense_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.expense')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='change_user_seq_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_changes, migrations.RunPython.noop),
+    ]
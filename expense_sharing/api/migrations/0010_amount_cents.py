@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:29
+
+from django.db import migrations, models
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast, Round
+
+
+def cents(field):
+    return Cast(Round(F(field) * 100), BigIntegerField())
+
+
+def backfill_cents(apps, schema_editor):
+    Expense = apps.get_model('api', 'Expense')
+    ExpenseParticipant = apps.get_model('api', 'ExpenseParticipant')
+    Expense.objects.update(total_cents=cents('total_amount'))
+    ExpenseParticipant.objects.update(
+        amount_owed_cents=cents('amount_owed'),
+        percentage_bp=cents('percentage_owed'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_expense_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='total_cents',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='expenseparticipant',
+            name='amount_owed_cents',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='expenseparticipant',
+            name='percentage_bp',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_cents, migrations.RunPython.noop),
+    ]
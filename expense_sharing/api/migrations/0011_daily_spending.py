@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:34
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    Expense = apps.get_model('api', 'Expense')
+    ExpenseParticipant = apps.get_model('api', 'ExpenseParticipant')
+    DailySpending = apps.get_model('api', 'DailySpending')
+    totals = defaultdict(lambda: [Decimal('0.00'), Decimal('0.00')])
+    owed = (
+        ExpenseParticipant.objects.exclude(amount_owed__isnull=True)
+        .values_list('user_id', TruncDate('expense__created_at')).annotate(total=Sum('amount_owed')).order_by()
+    )
+    for user_id, day, total in owed:
+        totals[(user_id, day)][0] += total.quantize(Decimal('0.01'))
+    paid = Expense.objects.values_list('created_by_id', TruncDate('created_at')).annotate(total=Sum('total_amount')).order_by()
+    for user_id, day, total in paid:
+        totals[(user_id, day)][1] += total.quantize(Decimal('0.01'))
+    DailySpending.objects.bulk_create([
+        DailySpending(user_id=user_id, day=day, owed=owed, paid=paid)
+        for (user_id, day), (owed, paid) in totals.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_amount_cents'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySpending',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('owed', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='unique_daily_spending')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
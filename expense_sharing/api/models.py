@@ -1,9 +1,19 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
     mobile_number = models.CharField(max_length=15, unique=True)
+    # Denormalized pointer to the newest expense the user takes part in,
+    # kept up to date by the expense write paths.
+    last_expense = models.ForeignKey('Expense', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Bumped whenever an expense involving the user is written; drives the
+    # ETag and Last-Modified headers of the per-user read endpoints.
+    expense_version = models.PositiveBigIntegerField(default=0)
+    modified_at = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return self.username
@@ -17,9 +27,20 @@ class Expense(models.Model):
     name = models.CharField(max_length=100, default="New Expanse")
     created_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='expenses_created')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # total_amount in cents; see api/splits.py.
+    total_cents = models.BigIntegerField(null=True, blank=True)
     split_type = models.CharField(max_length=10, choices=SPLIT_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination walks (created_at, id); the filtered variants
+            # lead with the filter column so each page stays a range scan.
+            models.Index(fields=['created_at', 'id'], name='expense_created_idx'),
+            models.Index(fields=['created_by', 'created_at', 'id'], name='expense_creator_created_idx'),
+            models.Index(fields=['split_type', 'created_at', 'id'], name='expense_split_created_idx'),
+        ]
+
     def __str__(self):
         return f'Expense {self.name} by {self.created_by.username}'
 
@@ -28,6 +49,113 @@ class ExpenseParticipant(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     amount_owed = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     percentage_owed = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    # The same values in integer minor units: cents and basis points.
+    amount_owed_cents = models.BigIntegerField(null=True, blank=True)
+    percentage_bp = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Covers "expenses of user X" lookups without touching the table.
+            models.Index(fields=['user', 'expense'], name='participant_user_expense_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} owes {self.amount_owed or self.percentage_owed}%'
+
+class Balance(models.Model):
+    """
+    Net amount `debtor` owes `creditor` across all expenses.
+
+    Every pair is stored in both directions (the mirror row holds the negated
+    amount) so a user's balances are a single indexed lookup on `debtor`.
+    """
+    debtor = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='balances')
+    creditor = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['debtor', 'creditor'], name='unique_balance_pair'),
+        ]
+
+    def __str__(self):
+        return f'{self.debtor.username} owes {self.creditor.username} {self.amount}'
+
+class ExpenseChange(models.Model):
+    """
+    Append-only log of expense writes, one row per affected user.
+
+    The auto-incrementing id is the sync cursor: a client that has seen every
+    change up to N asks for the rows after N, which is a range scan on
+    (user, id) however long the history is.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='change_user_seq_idx'),
+        ]
+
+    def __str__(self):
+        return f'Change {self.id}: expense {self.expense_id} for {self.user_id}'
+
+class DailySpending(models.Model):
+    """
+    Per-user daily totals: `owed` is the user's share of the day's expenses
+    and `paid` the total of the expenses they created that day (UTC).
+
+    Maintained with every expense write, so spending summaries over any range
+    read one row per day instead of every expense.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField()
+    owed = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_daily_spending'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} on {self.day}: owed {self.owed}, paid {self.paid}'
+
+class ExportJob(models.Model):
+    """
+    A balance sheet export written to EXPORTS_DIR in the background.
+
+    `cursor` is the newest expense change when the job was started, so a
+    finished export is reused for the same selection until a newer change
+    arrives.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    requested_by = models.ForeignKey(CustomUser, null=True, on_delete=models.SET_NULL, related_name='+')
+    # Sorted, comma-separated expense ids; empty for every expense.
+    expense_ids = models.TextField(blank=True)
+    # SHA-1 of expense_ids, to look jobs up by selection.
+    selection = models.CharField(max_length=40)
+    cursor = models.BigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    size = models.BigIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['selection', 'cursor'], name='export_job_selection_idx'),
+        ]
+
+    def __str__(self):
+        return f'Export {self.id} ({self.status})'
@@ -0,0 +1,117 @@
+# api/pagination.py
+
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class ExpenseCursorPagination(BasePagination):
+    """
+    Keyset pagination over expenses ordered newest first by (created_at, id).
+
+    Each page is a single indexed range scan from the cursor position, so the
+    cost of a page does not depend on how deep into the history it is.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.build_page(list(self.get_page_queryset(queryset, request)))
+
+    def get_page_queryset(self, queryset, request):
+        """
+        Return the queryset slice holding the requested page plus one extra row.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.position, self.reverse = self.decode_cursor(request)
+
+        if self.reverse:
+            # Walk backwards from the cursor; build_page flips the rows back to newest first.
+            if self.position is not None:
+                created_at, id = self.position
+                queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=id))
+        else:
+            if self.position is not None:
+                created_at, id = self.position
+                queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=id))
+        return queryset.order_by(*self.get_ordering())[:self.page_size + 1]
+
+    def get_ordering(self):
+        """
+        Return the order of the page queryset, which build_page expects its rows in.
+        """
+        return ('created_at', 'id') if self.reverse else ('-created_at', '-id')
+
+    def build_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_previous = has_more
+            self.has_next = self.position is not None
+        else:
+            self.has_previous = self.position is not None
+            self.has_next = has_more
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # An empty page walked backwards past the newest row; continue from the cursor.
+            return self.build_link(self.position, reverse=False)
+        return self.build_link((self.page[-1].created_at, self.page[-1].id), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return self.build_link(self.position, reverse=True)
+        return self.build_link((self.page[0].created_at, self.page[0].id), reverse=True)
+
+    def build_link(self, position, reverse):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    def encode_cursor(self, position, reverse):
+        created_at, id = position
+        payload = {'t': created_at.isoformat(), 'i': id}
+        if reverse:
+            payload['r'] = 1
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position = (datetime.fromisoformat(payload['t']), int(payload['i']))
+            return position, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,214 @@
+# api/profiling.py
+#
+# On-demand profiling of single requests. A staff user adds `X-Profile: 1`
+# (or `?profile=1`) to a request and it runs under cProfile; `sampling`
+# selects pyinstrument's statistical profiler when it is installed. Profiles
+# land in PROFILES_DIR next to a JSON description of the request and are
+# listed, shown and diffed with `manage.py profiles`.
+
+import cProfile
+import json
+import pstats
+import threading
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .authentication import AsyncJWTAuthentication
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+# Profilers hook into the interpreter globally, so one request is profiled at a time.
+lock = threading.Lock()
+
+
+def requested_mode(request):
+    """
+    Return 'cprofile' or 'sampling' when the request asks to be profiled, else None.
+    """
+    if not settings.PROFILING_ENABLED:
+        return None
+    value = request.headers.get('X-Profile') or request.GET.get('profile')
+    if not value or value.lower() in ('0', 'false', 'no'):
+        return None
+    return 'sampling' if value.lower() == 'sampling' else 'cprofile'
+
+
+def is_staff(request):
+    """
+    Whether the request comes from a staff user, by session or JWT.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        return False
+    return bool(result and result[0].is_staff)
+
+
+async def ais_staff(request):
+    if hasattr(request, 'auser'):
+        user = await request.auser()
+        if user.is_authenticated:
+            return user.is_staff
+    try:
+        result = await AsyncJWTAuthentication().aauthenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        return False
+    return bool(result and result[0].is_staff)
+
+
+def view_name(request):
+    match = request.resolver_match
+    return match.view_name if match else 'unmatched'
+
+
+def new_profile_id(request):
+    return f"{timezone.now():%Y%m%dT%H%M%S}-{view_name(request)}-{uuid.uuid4().hex[:6]}"
+
+
+class RequestProfiler:
+    """
+    Profile one request and save the result to PROFILES_DIR.
+    """
+    def __init__(self, mode):
+        if mode == 'sampling' and pyinstrument is not None:
+            self.mode = 'sampling'
+            self.profiler = pyinstrument.Profiler(interval=0.001)
+        else:
+            self.mode = 'cprofile'
+            self.profiler = cProfile.Profile()
+
+    def start(self):
+        if self.mode == 'sampling':
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.mode == 'sampling':
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+
+    def save(self, request, response, duration, profile_id=None):
+        """
+        Write the profile and its description; return the profile id, a new
+        one unless `profile_id` was taken from `new_profile_id` beforehand.
+        """
+        directory = Path(settings.PROFILES_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        view = view_name(request)
+        now = timezone.now()
+        if profile_id is None:
+            profile_id = new_profile_id(request)
+
+        if self.mode == 'sampling':
+            filename = f'{profile_id}.html'
+            (directory / filename).write_text(self.profiler.output_html(), encoding='utf-8')
+        else:
+            filename = f'{profile_id}.prof'
+            self.profiler.dump_stats(directory / filename)
+
+        user = getattr(request, 'user', None)
+        metadata = {
+            'id': profile_id,
+            'file': filename,
+            'mode': self.mode,
+            'time': now.isoformat(),
+            'view': view,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'user': user.get_username() if user is not None and user.is_authenticated else None,
+        }
+        (directory / f'{profile_id}.json').write_text(json.dumps(metadata, indent=2), encoding='utf-8')
+        return profile_id
+
+
+class ProfiledStream:
+    """
+    Iterate over a streamed body with `profiler` running while each chunk is
+    produced. `on_finish` is called once, when the body is exhausted, fails
+    or the response is closed before the end.
+    """
+    def __init__(self, content, profiler, on_finish):
+        self.content = iter(content)
+        self.profiler = profiler
+        self.on_finish = on_finish
+        self.finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            self.profiler.start()
+            try:
+                return next(self.content)
+            finally:
+                self.profiler.stop()
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if not self.finished:
+            self.finished = True
+            self.on_finish()
+
+
+def list_profiles():
+    """
+    Return the descriptions of the saved profiles, oldest first.
+    """
+    directory = Path(settings.PROFILES_DIR)
+    if not directory.exists():
+        return []
+    profiles = []
+    for path in directory.glob('*.json'):
+        try:
+            profiles.append(json.loads(path.read_text(encoding='utf-8')))
+        except ValueError:
+            continue
+    return sorted(profiles, key=lambda profile: profile['time'])
+
+
+def load_stats(profile_id):
+    """
+    Return pstats.Stats for a cProfile profile; raises FileNotFoundError.
+    """
+    path = Path(settings.PROFILES_DIR) / f'{profile_id}.prof'
+    if not path.exists():
+        raise FileNotFoundError(f"No cProfile profile with id {profile_id}.")
+    return pstats.Stats(str(path))
+
+
+def function_label(func):
+    filename, line, name = func
+    return f'{name} ({filename}:{line})' if line else name
+
+
+def diff_stats(before, after):
+    """
+    Return (label, calls before, calls after, cumulative seconds before,
+    cumulative seconds after) per function, largest change first.
+    """
+    rows = []
+    for func in set(before.stats) | set(after.stats):
+        _, calls_before, _, cumulative_before, _ = before.stats.get(func, (0, 0, 0, 0, None))
+        _, calls_after, _, cumulative_after, _ = after.stats.get(func, (0, 0, 0, 0, None))
+        rows.append((function_label(func), calls_before, calls_after, cumulative_before, cumulative_after))
+    rows.sort(key=lambda row: abs(row[4] - row[3]), reverse=True)
+    return rows
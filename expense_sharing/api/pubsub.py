@@ -0,0 +1,167 @@
+# api/pubsub.py
+#
+# Fan-out of expense events to the Server-Sent Events streams of the ASGI
+# application. Each open stream is a subscription holding a small bounded
+# queue, so an idle stream costs one queue and a slow client can never make
+# the worker buffer without limit: once its queue overflows the stream is
+# closed and the client resumes from the change log when it reconnects.
+
+import asyncio
+import functools
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import ExpenseChange
+
+
+class Overflow(Exception):
+    """
+    The subscriber fell further behind than its queue allows.
+    """
+
+
+class Subscription:
+    def __init__(self, user_id, queue_size):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def deliver(self, event):
+        # Always runs on the subscriber's own event loop.
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """
+        Return the next event, or None if none arrived within `timeout` seconds.
+        Raises Overflow once the queued events before an overflow are drained.
+        """
+        if self.overflowed and self.queue.empty():
+            raise Overflow()
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            if self.overflowed:
+                raise Overflow()
+            return None
+
+
+class LocalBroker:
+    """
+    Deliver events to the subscribers of this process only.
+
+    `publish` may be called from any thread; events are handed to each
+    subscriber's event loop with `call_soon_threadsafe`.
+    """
+    def __init__(self, queue_size, max_subscribers, **options):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+        self.count = 0
+
+    def is_full(self):
+        return self.count >= self.max_subscribers
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, self.queue_size)
+        with self.lock:
+            self.subscriptions[user_id].add(subscription)
+            self.count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id)
+            if subscriptions and subscription in subscriptions:
+                subscriptions.discard(subscription)
+                self.count -= 1
+                if not subscriptions:
+                    del self.subscriptions[subscription.user_id]
+
+    def publish(self, events):
+        """
+        Deliver (user_id, event) pairs to every matching subscriber.
+        """
+        with self.lock:
+            targets = [
+                (subscription, event)
+                for user_id, event in events
+                for subscription in self.subscriptions.get(user_id, ())
+            ]
+        for subscription, event in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's loop has shut down; it unsubscribes on its way out.
+                pass
+
+    def publish_changes(self, changes):
+        """
+        Publish saved `ExpenseChange` rows once the writing transaction commits.
+        """
+        events = [(change.user_id, make_event(change.id, change.expense_id)) for change in changes]
+        if events:
+            transaction.on_commit(lambda: self.publish(events))
+
+
+class ChangeLogBroker(LocalBroker):
+    """
+    Share events between worker processes through the change log.
+
+    Writers publish nothing; instead each process runs one poller per event
+    loop that reads new `ExpenseChange` rows by primary key and fans them out
+    to its own subscribers. This is the stand-in for an external broker when
+    several workers share one database.
+    """
+    def __init__(self, queue_size, max_subscribers, poll_interval=0.5, batch_size=1000, **options):
+        super().__init__(queue_size, max_subscribers)
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.pollers = {}
+
+    def subscribe(self, user_id):
+        subscription = super().subscribe(user_id)
+        poller = self.pollers.get(subscription.loop)
+        if poller is None or poller.done():
+            self.pollers[subscription.loop] = subscription.loop.create_task(self.poll())
+        return subscription
+
+    def publish_changes(self, changes):
+        pass
+
+    async def poll(self):
+        last_id = await sync_to_async(latest_change_id)()
+        while self.count:
+            await asyncio.sleep(self.poll_interval)
+            rows = await sync_to_async(list)(
+                ExpenseChange.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', 'user_id', 'expense_id')[:self.batch_size]
+            )
+            if rows:
+                last_id = rows[-1][0]
+                self.publish([(user_id, make_event(id, expense_id)) for id, user_id, expense_id in rows])
+
+
+def latest_change_id():
+    return ExpenseChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def make_event(cursor, expense_id):
+    return {'cursor': cursor, 'expense_id': expense_id}
+
+
+@functools.cache
+def get_broker():
+    options = dict(settings.EVENTS)
+    return import_string(options.pop('BACKEND'))(**{key.lower(): value for key, value in options.items()})
@@ -0,0 +1,177 @@
+# api/rollups.py
+#
+# Daily per-user spending totals in `DailySpending`, kept up to date by the
+# expense write paths the same way as the balance ledger, and the summaries
+# served from them. Days are calendar days in the current time zone (UTC).
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from . import splits
+from .models import DailySpending, Expense, ExpenseParticipant
+
+PERIODS = {
+    'day': None,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def compute_deltas(rows):
+    """
+    Turn (user_id, day, owed, paid) rows into {(user_id, day): [owed, paid]}.
+    """
+    deltas = defaultdict(lambda: [Decimal('0.00'), Decimal('0.00')])
+    for user_id, day, owed, paid in rows:
+        delta = deltas[(user_id, day)]
+        delta[0] += owed
+        delta[1] += paid
+    return deltas
+
+
+def participant_rows(participants):
+    """
+    Yield rollup rows for saved `ExpenseParticipant` instances: each
+    participant's share, and each expense's total for its creator.
+    """
+    expenses = {}
+    for participant in participants:
+        expense = participant.expense
+        day = timezone.localdate(expense.created_at)
+        if participant.amount_owed:
+            yield participant.user_id, day, participant.amount_owed, 0
+        expenses[expense.id] = expense, day
+    for expense, day in expenses.values():
+        yield expense.created_by_id, day, 0, expense.total_amount
+
+
+def apply_deltas(deltas):
+    """
+    Add `deltas` to the stored rollups.
+
+    Must run inside the transaction that writes the participants, like
+    `ledger.apply_deltas`, after locking the rows of every user in `deltas`:
+    a day without a rollup yet has no row to lock, and two writers adding
+    the first spending of the same day would otherwise both start from zero.
+    """
+    if not deltas:
+        return
+
+    days_by_user = defaultdict(set)
+    for user_id, day in deltas:
+        days_by_user[user_id].add(day)
+    lookup = Q()
+    for user_id, days in days_by_user.items():
+        lookup |= Q(user_id=user_id, day__in=days)
+    existing = {
+        (user_id, day): (owed, paid)
+        for user_id, day, owed, paid in DailySpending.objects.select_for_update().filter(lookup).values_list('user_id', 'day', 'owed', 'paid')
+    }
+
+    rows = []
+    for (user_id, day), (owed, paid) in deltas.items():
+        stored_owed, stored_paid = existing.get((user_id, day), (0, 0))
+        rows.append(DailySpending(user_id=user_id, day=day, owed=stored_owed + owed, paid=stored_paid + paid))
+    DailySpending.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['user', 'day'],
+        update_fields=['owed', 'paid'],
+    )
+
+
+def record_participants(participants):
+    """
+    Update the rollups for newly written participants.
+    """
+    apply_deltas(compute_deltas(participant_rows(participants)))
+
+
+def compute_from_rows():
+    """
+    Compute every daily rollup directly from the expense rows.
+    """
+    owed = (
+        ExpenseParticipant.objects
+        .exclude(amount_owed__isnull=True)
+        .values_list('user_id', TruncDate('expense__created_at'))
+        .annotate(total=splits.owed_total())
+        .order_by()
+    )
+    paid = (
+        Expense.objects
+        .values_list('created_by_id', TruncDate('created_at'))
+        .annotate(total=splits.paid_total())
+        .order_by()
+    )
+    return compute_deltas([
+        *((user_id, day, splits.owed_decimal(total), 0) for user_id, day, total in owed),
+        *((user_id, day, 0, splits.owed_decimal(total)) for user_id, day, total in paid),
+    ])
+
+
+def stored_rollups():
+    """
+    Return the stored rollups as a {(user_id, day): [owed, paid]} dict.
+    """
+    return {
+        (user_id, day): [owed, paid]
+        for user_id, day, owed, paid in DailySpending.objects.values_list('user_id', 'day', 'owed', 'paid')
+    }
+
+
+def find_mismatches(expected, actual):
+    """
+    Compare two rollup dicts, treating missing days as zero.
+    """
+    zero = [Decimal('0.00'), Decimal('0.00')]
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        want = expected.get(key, zero)
+        got = actual.get(key, zero)
+        if want != got:
+            mismatches.append((key, want, got))
+    return mismatches
+
+
+def rebuild(batch_size=1000):
+    """
+    Replace the stored rollups with totals recomputed from the expense rows.
+    """
+    deltas = compute_from_rows()
+    DailySpending.objects.all().delete()
+    DailySpending.objects.bulk_create(
+        [
+            DailySpending(user_id=user_id, day=day, owed=owed, paid=paid)
+            for (user_id, day), (owed, paid) in deltas.items()
+        ],
+        batch_size=batch_size,
+    )
+    return len(deltas)
+
+
+def summarize(user_id, period, start=None, end=None):
+    """
+    Return a user's (period_start, owed, paid) totals for each day, week
+    (starting Monday) or month with spending between `start` and `end`,
+    both inclusive.
+    """
+    rows = DailySpending.objects.filter(user_id=user_id)
+    if start is not None:
+        rows = rows.filter(day__gte=start)
+    if end is not None:
+        rows = rows.filter(day__lte=end)
+    trunc = PERIODS[period]
+    if trunc is None:
+        return list(rows.order_by('day').values_list('day', 'owed', 'paid'))
+    totals = (
+        rows.values_list(trunc('day'))
+        .annotate(owed=Sum('owed'), paid=Sum('paid'))
+        .order_by(trunc('day'))
+    )
+    # SQLite sums decimals as floats.
+    return [(period_start, owed.quantize(splits.CENT), paid.quantize(splits.CENT)) for period_start, owed, paid in totals]
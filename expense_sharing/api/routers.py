@@ -0,0 +1,56 @@
+# api/routers.py
+#
+# Route the reads of GET and HEAD requests to the read replicas listed in
+# DATABASE_REPLICAS. Everything else stays on the primary: writes, all
+# reads of other requests (so validation sees the latest rows), reads inside
+# a transaction, and every read a request makes after its first write.
+# Outside of requests (management commands, shells, tests) nothing changes.
+
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Routing state of the read-only request being served, if any. Context
+# variables follow the request into sync_to_async threads.
+replica_reads = ContextVar('replica_reads', default=None)
+
+
+class ReplicaReads:
+    def __init__(self):
+        # Chosen on the first read, so a request sees one consistent replica.
+        self.alias = None
+        # Set by the first write; later reads must see it.
+        self.pinned = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = replica_reads.get()
+        replicas = settings.DATABASE_REPLICAS
+        if state is None or state.pinned or not replicas:
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related rows come from the database their instance came from.
+            return instance._state.db
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        if state.alias is None:
+            state.alias = random.choice(replicas)
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = replica_reads.get()
+        if state is not None:
+            state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        return False if db in settings.DATABASE_REPLICAS else None
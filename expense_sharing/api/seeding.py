@@ -0,0 +1,224 @@
+# api/seeding.py
+#
+# Deterministic synthetic datasets for benchmarks and load tests. The same
+# seed and sizes always produce the same users, expenses and shares. Rows are
+# written with bulk inserts in batches, and the derived state (balance
+# ledger, change log, latest-expense pointers) is filled in the way the
+# write paths would have left it.
+
+import random
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max, OuterRef, Subquery
+
+from . import ledger, rollups, splits
+from .models import CustomUser, Expense, ExpenseChange, ExpenseParticipant
+from .serializers import ExpenseSerializer
+
+PASSWORD = 'password'
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+SPLIT_MIX = {'EQUAL': 60, 'EXACT': 25, 'PERCENTAGE': 15}
+EXPENSE_NAMES = (
+    'Groceries', 'Dinner', 'Rent', 'Utilities', 'Taxi', 'Flights', 'Hotel',
+    'Coffee', 'Concert tickets', 'Internet', 'Fuel', 'Office lunch', 'Gift',
+)
+
+
+def username(index):
+    return f'seed{index}'
+
+
+def parse_split_mix(value):
+    """
+    Parse "EQUAL:60,EXACT:25,PERCENTAGE:15" into a {split_type: weight} dict.
+    """
+    mix = {}
+    for part in value.split(','):
+        split_type, _, weight = part.partition(':')
+        split_type = split_type.strip().upper()
+        if split_type not in dict(Expense.SPLIT_CHOICES):
+            raise ValueError(f"Unknown split type {split_type!r}.")
+        try:
+            mix[split_type] = int(weight)
+        except ValueError:
+            raise ValueError(f"Weight of {split_type} must be an integer.") from None
+    if sum(mix.values()) <= 0:
+        raise ValueError("The split mix needs a positive weight.")
+    return mix
+
+
+def cut(rng, total, parts):
+    """
+    Split the integer `total` into `parts` random positive integers.
+    """
+    points = sorted(rng.sample(range(1, total), parts - 1))
+    return [b - a for a, b in zip([0, *points], [*points, total])]
+
+
+class Generator:
+    """
+    Draws expenses from a seeded random stream.
+
+    Participants are drawn with Zipf-like weights over the users, so a few
+    users appear in a large share of the expenses, as in production. Group
+    sizes are mostly two to four with a long tail up to `max_participants`,
+    and amounts follow a log-normal distribution.
+    """
+    def __init__(self, user_ids, seed=0, max_participants=20, skew=1.0, split_mix=SPLIT_MIX):
+        self.rng = random.Random(seed)
+        self.user_ids = user_ids
+        self.max_participants = max(2, min(max_participants, len(user_ids)))
+        self.user_weights = list(accumulate(1 / (rank + 1) ** skew for rank in range(len(user_ids))))
+        self.split_types = list(split_mix)
+        self.split_weights = list(accumulate(split_mix.values()))
+
+    def pick_users(self, count):
+        # Drawing with cumulative weights is O(log n) per user.
+        total = self.user_weights[-1]
+        picked = {}
+        while len(picked) < count:
+            index = bisect_left(self.user_weights, self.rng.random() * total)
+            picked.setdefault(self.user_ids[min(index, len(self.user_ids) - 1)], None)
+        return list(picked)
+
+    def participant_count(self):
+        return min(2 + int(self.rng.expovariate(0.7)), self.max_participants)
+
+    def expense(self):
+        """
+        Return (expense fields, participant shares) where each share is a
+        dict of user_id, amount_owed and percentage_owed.
+        """
+        rng = self.rng
+        user_ids = self.pick_users(self.participant_count())
+        split_type = rng.choices(self.split_types, cum_weights=self.split_weights)[0]
+        cents = min(max(int(rng.lognormvariate(8, 1.2)), 100 * len(user_ids)), 99_999_999)
+        if split_type == 'EXACT':
+            parts = [(Decimal(part) / 100, None) for part in cut(rng, cents, len(user_ids))]
+        elif split_type == 'PERCENTAGE':
+            parts = [(None, Decimal(part) / 100) for part in cut(rng, 10000, len(user_ids))]
+        else:
+            parts = [(None, None)] * len(user_ids)
+        shares = [
+            {'user_id': user_id, 'amount_owed': amount_owed, 'percentage_owed': percentage_owed}
+            for user_id, (amount_owed, percentage_owed) in zip(user_ids, parts)
+        ]
+        fields = {
+            'name': rng.choice(EXPENSE_NAMES),
+            # The payer is usually part of the group.
+            'created_by_id': user_ids[0],
+            'total_amount': Decimal(cents) / 100,
+            'split_type': split_type,
+        }
+        return fields, shares
+
+
+def create_users(count, batch_size=5000):
+    """
+    Insert `count` users sharing the password `PASSWORD`; return their ids
+    in creation order.
+    """
+    # Hashing is deliberately slow, so every user shares one hash.
+    password = make_password(PASSWORD)
+    ids = []
+    for start in range(0, count, batch_size):
+        with transaction.atomic():
+            users = CustomUser.objects.bulk_create([
+                CustomUser(
+                    username=username(index),
+                    email=f'{username(index)}@example.com',
+                    mobile_number=f'9{index:09d}',
+                    password=password,
+                )
+                for index in range(start, min(start + batch_size, count))
+            ])
+        ids.extend(user.id for user in users)
+    return ids
+
+
+def insert_rows(model, fields, rows):
+    """
+    Insert tuples of `fields` values with one executemany. Building model
+    instances for bulk_create costs several times more than the insert.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(field).column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})', rows)
+
+
+def create_expenses(generator, count, days=730, batch_size=5000, progress=None):
+    """
+    Insert `count` generated expenses with their participants and change
+    log; return (expenses, participants) written.
+
+    Creation times are spread evenly over `days` from EPOCH and follow the
+    insertion order, so ids and `created_at` sort the same way.
+    """
+    step = timedelta(days=days) / max(count, 1)
+    first_id = (Expense.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    written = participant_count = 0
+    for start in range(0, count, batch_size):
+        expenses, participants, change_rows = [], [], []
+        for index in range(start, min(start + batch_size, count)):
+            fields, shares = generator.expense()
+            expense_id = first_id + index
+            created_at = connection.ops.adapt_datetimefield_value(EPOCH + step * index)
+            total_amount = fields['total_amount']
+            expenses.append((expense_id, fields['name'], fields['created_by_id'], total_amount, splits.to_cents(total_amount), fields['split_type'], created_at))
+            amounts = ExpenseSerializer.split_shares(fields['split_type'], total_amount, shares)
+            for share, (cents, basis_points) in zip(shares, amounts):
+                percentage_owed = None if basis_points is None else splits.from_basis_points(basis_points)
+                participants.append((expense_id, share['user_id'], splits.from_cents(cents), cents, percentage_owed, basis_points))
+            # Same rows as changes.record_changes: each participant plus the creator.
+            involved = {share['user_id'] for share in shares} | {fields['created_by_id']}
+            change_rows.extend((expense_id, user_id) for user_id in sorted(involved))
+        with transaction.atomic():
+            insert_rows(Expense, ('id', 'name', 'created_by', 'total_amount', 'total_cents', 'split_type', 'created_at'), expenses)
+            insert_rows(ExpenseParticipant, ('expense', 'user', 'amount_owed', 'amount_owed_cents', 'percentage_owed', 'percentage_bp'), participants)
+            insert_rows(ExpenseChange, ('expense', 'user'), change_rows)
+        written += len(expenses)
+        participant_count += len(participants)
+        if progress:
+            progress(written, participant_count)
+
+    # Explicit ids leave sequences behind on databases that have them.
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Expense]):
+            cursor.execute(sql)
+    return written, participant_count
+
+
+def update_derived_state(batch_size=5000):
+    """
+    Rebuild the balance ledger and the spending rollups, and point every user
+    at their newest expense.
+    """
+    with transaction.atomic():
+        balances = ledger.rebuild(batch_size=batch_size)
+        rollups.rebuild(batch_size=batch_size)
+        # Seeded expense ids follow creation time, so the newest expense is
+        # the highest id, read from the (user, expense) index.
+        CustomUser.objects.update(last_expense=Subquery(
+            ExpenseParticipant.objects.filter(user_id=OuterRef('pk'))
+            .order_by('-expense_id').values('expense_id')[:1]
+        ))
+    return balances
+
+
+def seed(users, expenses, seed=0, max_participants=20, skew=1.0, split_mix=SPLIT_MIX, days=730, batch_size=5000, progress=None):
+    """
+    Generate a dataset into an empty database; return the user ids.
+    """
+    user_ids = create_users(users, batch_size=batch_size)
+    generator = Generator(user_ids, seed=seed, max_participants=max_participants, skew=skew, split_mix=split_mix)
+    create_expenses(generator, expenses, days=days, batch_size=batch_size, progress=progress)
+    update_derived_state(batch_size=batch_size)
+    return user_ids
@@ -1,10 +1,16 @@
 # api/serializers.py
 
 from rest_framework import serializers
-from .models import CustomUser, Expense, ExpenseParticipant
+from .models import Balance, CustomUser, Expense, ExpenseParticipant, ExportJob
+from . import changes, ledger, rollups, splits
+from . import cache as response_cache
 from django.contrib.auth.password_validation import validate_password
+from django.db import transaction
+from django.db.models import Case, F, Prefetch, Value, When
+from django.urls import reverse
+from django.utils import timezone
 from rest_framework.validators import UniqueValidator
-from decimal import Decimal, ROUND_HALF_UP
+from collections.abc import Mapping
 
 class UserSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(
@@ -22,17 +28,69 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('id', 'username', 'email', 'password', 'mobile_number')
 
     def create(self, validated_data):
-        user = CustomUser.objects.create(
+        user = CustomUser(
             username=validated_data['username'],
             email=validated_data['email'],
             mobile_number=validated_data['mobile_number']
         )
+        # Hash before saving, so registering is a single INSERT.
         user.set_password(validated_data['password'])
         user.save()
         return user
 
+def collect_user_ids(items):
+    """
+    Return every user id referenced by raw expense `items`, ignoring malformed values.
+    """
+    user_ids = set()
+    for item in items:
+        if not isinstance(item, Mapping):
+            continue
+        values = [item.get('created_by')]
+        participants = item.get('participants')
+        if isinstance(participants, list):
+            values.extend(participant.get('user_id') for participant in participants if isinstance(participant, Mapping))
+        for value in values:
+            if isinstance(value, bool):
+                continue
+            try:
+                user_ids.add(int(value))
+            except (TypeError, ValueError):
+                pass
+    return user_ids
+
+def load_users(user_ids, users):
+    """
+    Add the users with `user_ids` to the `users` map and return it. Ids that
+    do not exist map to None, so they are not looked up again.
+    """
+    if user_ids:
+        users.update(dict.fromkeys(user_ids))
+        users.update(CustomUser.objects.in_bulk(user_ids))
+    return users
+
+class UserPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field that resolves users from a preloaded `users` map in the
+    serializer context when one is given, instead of one query per value.
+    Ids missing from the map or mapped to None do not exist.
+    """
+    def to_internal_value(self, data):
+        users = self.context.get('users')
+        if users is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            user = users.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if user is None:
+            self.fail('does_not_exist', pk_value=data)
+        return user
+
 class ExpenseParticipantSerializer(serializers.ModelSerializer):
-    user_id = serializers.PrimaryKeyRelatedField(
+    user_id = UserPrimaryKeyField(
         queryset=CustomUser.objects.all(),
         source='user',
         write_only=True
@@ -48,7 +106,7 @@ class ExpenseParticipantSerializer(serializers.ModelSerializer):
 
 class ExpenseSerializer(serializers.ModelSerializer):
     participants = ExpenseParticipantSerializer(many=True)
-    created_by = serializers.PrimaryKeyRelatedField(
+    created_by = UserPrimaryKeyField(
         queryset=CustomUser.objects.all(),
         write_only=True
     )
@@ -59,6 +117,23 @@ class ExpenseSerializer(serializers.ModelSerializer):
         fields = ('id', 'name','created_by', 'created_by_username', 'total_amount', 'split_type', 'created_at', 'participants')
         read_only_fields = ('id', 'created_at', 'created_by_username')
 
+    def to_internal_value(self, data):
+        # Resolve the creator and every participant with one IN query up front
+        # so the user fields do not query once per participant.
+        users = self.context.setdefault('users', {})
+        load_users(collect_user_ids([data]) - users.keys(), users)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Load everything the serializer reads up front: the creator through a
+        join and the participants with their users in one extra query.
+        """
+        return queryset.select_related('created_by').prefetch_related(
+            Prefetch('participants', queryset=ExpenseParticipant.objects.select_related('user').order_by('id'))
+        )
+
     def validate(self, data):
         split_type = data.get('split_type')
         participants = data.get('participants')
@@ -70,81 +145,146 @@ class ExpenseSerializer(serializers.ModelSerializer):
         if not participants:
             raise serializers.ValidationError("At least one participant is required.")
 
-        # Validate based on split type
-        if split_type == 'EXACT':
-            sum_amounts = Decimal('0.00')
+        # Validate based on split type, in integer cents and basis points
+        values = []
+        if split_type in ('EXACT', 'PERCENTAGE'):
+            field = 'amount_owed' if split_type == 'EXACT' else 'percentage_owed'
             for participant in participants:
-                amount = participant.get('amount_owed')
-                if amount is None:
-                    raise serializers.ValidationError("All participants must have 'amount_owed' for EXACT split.")
-                if amount < 0:
-                    raise serializers.ValidationError("'amount_owed' must be non-negative.")
-                sum_amounts += amount
-            if sum_amounts != total_amount:
-                raise serializers.ValidationError(f"Sum of exact amounts {sum_amounts} does not equal total amount {total_amount}.")
-        
-        elif split_type == 'PERCENTAGE':
-            sum_percent = Decimal('0.00')
-            for participant in participants:
-                percent = participant.get('percentage_owed')
-                if percent is None:
-                    raise serializers.ValidationError("All participants must have 'percentage_owed' for PERCENTAGE split.")
-                if percent < 0:
-                    raise serializers.ValidationError("'percentage_owed' must be non-negative.")
-                sum_percent += percent
-            if sum_percent != Decimal('100.00'):
-                raise serializers.ValidationError(f"Sum of percentages {sum_percent} does not equal 100%.")
-        
-        elif split_type == 'EQUAL':
-            # For equal split, ensure total_amount is positive and participants are non-empty
-            if total_amount <= 0:
-                raise serializers.ValidationError("Total amount must be greater than zero for EQUAL split.")
+                value = participant.get(field)
+                if value is None:
+                    raise serializers.ValidationError(f"All participants must have '{field}' for {split_type} split.")
+                if value < 0:
+                    raise serializers.ValidationError(f"'{field}' must be non-negative.")
+                values.append(splits.to_cents(value))
+        error = splits.check(split_type, splits.to_cents(total_amount), values)
+        if error:
+            raise serializers.ValidationError(error)
 
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         participants_data = validated_data.pop('participants')
-        expense = Expense.objects.create(**validated_data)
-        split_type = expense.split_type
-        total_amount = expense.total_amount
-        num_participants = len(participants_data)
-
-        if split_type == 'EQUAL':
-            # Calculate equal share, handle rounding to ensure total matches
-            equal_share = (total_amount / num_participants).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            shares = [equal_share for _ in range(num_participants)]
-            # Adjust the last participant's share to account for any rounding discrepancies
-            total_assigned = sum(shares)
-            discrepancy = total_amount - total_assigned
-            if discrepancy != Decimal('0.00'):
-                shares[-1] += discrepancy
-
-            for participant_data, share in zip(participants_data, shares):
-                ExpenseParticipant.objects.create(
-                    expense=expense,
-                    user=participant_data['user'],
-                    amount_owed=share
-                )
-
-        elif split_type == 'EXACT':
-            for participant_data in participants_data:
-                ExpenseParticipant.objects.create(
-                    expense=expense,
-                    user=participant_data['user'],
-                    amount_owed=participant_data['amount_owed']
-                )
+        expense = Expense.objects.create(**validated_data, total_cents=splits.to_cents(validated_data['total_amount']))
+        participants = ExpenseParticipant.objects.bulk_create(self.build_participants(expense, participants_data))
+
+        self.record_participants(participants)
+        return expense
+
+    @staticmethod
+    def record_participants(participants):
+        """
+        Update the state derived from newly written participants: the balance
+        ledger, the daily spending rollups, the change log read by delta sync,
+        the server-side response cache, each participant's latest-expense
+        pointer and the expense version of everyone involved, which
+        invalidates their conditional GETs.
+        """
+        # Bumping the versions first also takes a row lock on every involved
+        # user. Balances and rollups only change for pairs and days of these
+        # users, so concurrent writers touching the same rows queue here
+        # until the earlier transaction commits, and the ledger and rollups
+        # then read totals that include its deltas.
+        involved = {participant.user_id for participant in participants}
+        involved.update(participant.expense.created_by_id for participant in participants)
+        CustomUser.objects.filter(id__in=involved).update(
+            expense_version=F('expense_version') + 1,
+            modified_at=timezone.now(),
+        )
+
+        ledger.record_participants(participants)
+        rollups.record_participants(participants)
+        changes.record_changes(participants)
+        response_cache.invalidate()
 
+        latest = {}
+        for participant in participants:
+            expense = participant.expense
+            current = latest.get(participant.user_id)
+            if current is None or (expense.created_at, expense.id) > (current.created_at, current.id):
+                latest[participant.user_id] = expense
+        # The users are locked above, so their current pointers can be read
+        # and every move written back in one statement.
+        stored = CustomUser.objects.filter(id__in=latest).values_list(
+            'id', 'last_expense_id', 'last_expense__created_at',
+        )
+        moves = {
+            user_id: latest[user_id].id
+            for user_id, expense_id, created_at in stored
+            if expense_id is None or (created_at, expense_id) < (latest[user_id].created_at, latest[user_id].id)
+        }
+        if moves:
+            CustomUser.objects.filter(id__in=moves).update(last_expense=Case(
+                *(When(id=user_id, then=Value(expense_id)) for user_id, expense_id in moves.items()),
+            ))
+
+    @staticmethod
+    def build_participants(expense, participants_data):
+        """
+        Return unsaved `ExpenseParticipant` rows with each participant's share.
+        """
+        shares = ExpenseSerializer.split_shares(expense.split_type, expense.total_amount, participants_data)
+        return [
+            ExpenseParticipant(
+                expense=expense,
+                user=participant_data['user'],
+                amount_owed=splits.from_cents(cents),
+                amount_owed_cents=cents,
+                percentage_owed=None if basis_points is None else splits.from_basis_points(basis_points),
+                percentage_bp=basis_points,
+            )
+            for participant_data, (cents, basis_points) in zip(participants_data, shares)
+        ]
+
+    @staticmethod
+    def split_shares(split_type, total_amount, participants_data):
+        """
+        Return (amount_owed in cents, percentage_owed in basis points or None)
+        for each participant; see api/splits.py.
+        """
+        if split_type == 'EXACT':
+            values = [splits.to_cents(data['amount_owed']) for data in participants_data]
         elif split_type == 'PERCENTAGE':
-            for participant_data in participants_data:
-                percentage = participant_data['percentage_owed']
-                amount = (percentage / Decimal('100.00')) * total_amount
-                # Round the amount to 2 decimal places
-                amount = amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-                ExpenseParticipant.objects.create(
-                    expense=expense,
-                    user=participant_data['user'],
-                    percentage_owed=percentage,
-                    amount_owed=amount
-                )
+            values = [splits.to_basis_points(data['percentage_owed']) for data in participants_data]
+        else:
+            values = [None] * len(participants_data)
+        shares = splits.split(split_type, splits.to_cents(total_amount), values)
+        return list(zip(shares, values if split_type == 'PERCENTAGE' else [None] * len(shares)))
 
-        return expense
+class BalanceSerializer(serializers.ModelSerializer):
+    user_id = serializers.IntegerField(source='creditor_id', read_only=True)
+    username = serializers.CharField(source='creditor.username', read_only=True)
+
+    class Meta:
+        model = Balance
+        fields = ('user_id', 'username', 'amount')
+
+class SettlementTransferSerializer(serializers.Serializer):
+    from_user_id = serializers.IntegerField()
+    from_username = serializers.CharField()
+    to_user_id = serializers.IntegerField()
+    to_username = serializers.CharField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class SpendingSummarySerializer(serializers.Serializer):
+    period_start = serializers.DateField()
+    owed = serializers.DecimalField(max_digits=14, decimal_places=2)
+    paid = serializers.DecimalField(max_digits=14, decimal_places=2)
+    # Positive when the user paid more than their share.
+    net = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    status_url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = ('id', 'status', 'size', 'error', 'created_at', 'finished_at', 'status_url', 'download_url')
+
+    def get_status_url(self, job):
+        return self.context['request'].build_absolute_uri(reverse('get_export_job', args=[job.id]))
+
+    def get_download_url(self, job):
+        if job.status != ExportJob.DONE:
+            return None
+        return self.context['request'].build_absolute_uri(reverse('download_export_job', args=[job.id]))
@@ -0,0 +1,69 @@
+# api/settlement.py
+
+import heapq
+from collections import defaultdict
+from decimal import Decimal
+
+from . import splits
+from .models import ExpenseParticipant
+
+CENT = Decimal('0.01')
+
+
+def compute_net_positions(user_ids=None):
+    """
+    Return {user_id: net Decimal} from the raw expense rows.
+
+    A positive position means the user is owed money, a negative one means
+    they owe money. When `user_ids` is given only debts between members of
+    that set are counted, so the positions still sum to zero.
+    """
+    rows = ExpenseParticipant.objects.exclude(amount_owed__isnull=True)
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids, expense__created_by_id__in=user_ids)
+
+    positions = defaultdict(Decimal)
+    # A creator's own share appears on both sides and cancels out.
+    for user_id, total in rows.values_list('user_id').annotate(total=splits.owed_total()).order_by():
+        positions[user_id] -= splits.owed_decimal(total)
+    for user_id, total in rows.values_list('expense__created_by_id').annotate(total=splits.owed_total()).order_by():
+        positions[user_id] += splits.owed_decimal(total)
+    return {user_id: amount for user_id, amount in positions.items() if amount}
+
+
+def minimize_cash_flow(positions):
+    """
+    Return a list of (debtor_id, creditor_id, amount) transfers settling `positions`.
+
+    Greedily matches the largest debtor with the largest creditor using two
+    heaps. Each transfer settles at least one side, so the result has at most
+    n - 1 transfers and runs in O(n log n). Amounts are handled in integer
+    cents and returned as exact `Decimal` values.
+    """
+    debtors = []
+    creditors = []
+    total = 0
+    for user_id, amount in positions.items():
+        cents = int((amount / CENT).to_integral_value())
+        total += cents
+        if cents > 0:
+            creditors.append((-cents, user_id))
+        elif cents < 0:
+            debtors.append((cents, user_id))
+    if total != 0:
+        raise ValueError("Net positions must sum to zero.")
+
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+
+    transfers = []
+    while debtors:
+        debt, debtor_id = heapq.heappop(debtors)
+        credit, creditor_id = heapq.heappop(creditors)
+        cents = min(-debt, -credit)
+        transfers.append((debtor_id, creditor_id, Decimal(cents) * CENT))
+        if -debt > cents:
+            heapq.heappush(debtors, (debt + cents, debtor_id))
+        if -credit > cents:
+            heapq.heappush(creditors, (credit + cents, creditor_id))
+    return transfers
@@ -0,0 +1,220 @@
+# api/slow_queries.py
+#
+# Log every query slower than SLOW_QUERY_THRESHOLD_MS as one JSON object per
+# line, with the view and code that issued it and the database's plan for
+# it, so queries that degrade as the tables grow show up before users
+# notice. `manage.py slow_queries` summarises the log.
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import contextmanager, nullcontext
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .metrics import current_request
+
+logger = logging.getLogger('api.slow_queries')
+
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+MAX_PARAM_LENGTH = 200
+# Modules whose frames are skipped when looking for the calling code.
+INTERNAL_PATHS = (str(Path(__file__)), str(Path(__file__).with_name('metrics.py')))
+
+# Set while a plan is being captured, so the EXPLAIN itself is not logged.
+capturing = threading.local()
+
+
+def log_slow_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection: times the query and logs
+    it when it exceeds the threshold.
+    """
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    if threshold is None or getattr(capturing, 'active', False):
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration_ms = (time.perf_counter() - start) * 1000
+    if duration_ms >= threshold:
+        try:
+            logger.warning(json.dumps(build_entry(sql, params, many, context['connection'], duration_ms)))
+        except Exception:
+            # Never fail the query because it could not be logged.
+            logger.exception("Could not log a slow query")
+    return result
+
+
+def build_entry(sql, params, many, connection, duration_ms):
+    request = current_request.get()
+    match = getattr(request, 'resolver_match', None)
+    entry = {
+        'time': timezone.now().isoformat(),
+        'duration_ms': round(duration_ms, 3),
+        'database': connection.alias,
+        'view': match.view_name if match else None,
+        'method': request.method if request else None,
+        'path': request.path if request else None,
+        'caller': find_caller(),
+        'sql': sql,
+        'params': None if many else format_params(params),
+        'many': many,
+    }
+    if settings.SLOW_QUERY_EXPLAIN and not many:
+        entry['plan'], entry['explain_error'] = explain(connection, sql, params)
+    return entry
+
+
+def format_params(params):
+    if params is None:
+        return None
+    values = params.values() if isinstance(params, dict) else params
+    return [value if isinstance(value, (int, float, bool)) or value is None else str(value)[:MAX_PARAM_LENGTH] for value in values]
+
+
+def find_caller():
+    """
+    Return "path:line in function" of the innermost project frame outside
+    Django and this module, or None.
+    """
+    project_dir = str(settings.BASE_DIR)
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(project_dir) and filename not in INTERNAL_PATHS:
+            return f'{Path(filename).relative_to(project_dir)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+def explain(connection, sql, params):
+    """
+    Return (plan lines, error) for a read query; writes are not explained.
+    """
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor)
+    if prefix is None or not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None, None
+    capturing.active = True
+    try:
+        # A separate cursor, so the caller can still fetch the original
+        # results, inside a savepoint when the caller is in a transaction:
+        # on PostgreSQL a failed EXPLAIN would otherwise abort it. Outside
+        # one, opening a transaction would make reads wait for the write
+        # lock under SQLite's BEGIN IMMEDIATE.
+        savepoint = transaction.atomic(using=connection.alias) if connection.in_atomic_block else nullcontext()
+        with savepoint, connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+        if connection.vendor == 'sqlite':
+            # (id, parent, notused, detail): only the detail is readable.
+            return [str(row[-1]) for row in rows], None
+        return [' '.join(str(value) for value in row) for row in rows], None
+    except Exception:
+        return None, traceback.format_exc(limit=0).strip()
+    finally:
+        capturing.active = False
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """
+    `connection_created` receiver adding `log_slow_query` to new connections.
+    """
+    if log_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(log_slow_query)
+
+
+class LogFileHandler(RotatingFileHandler):
+    """
+    Rotating handler writing to the current SLOW_QUERY_LOG, which it creates
+    on the first slow query rather than when the settings are loaded.
+    """
+    def __init__(self, **kwargs):
+        kwargs['delay'] = True
+        super().__init__(settings.SLOW_QUERY_LOG, **kwargs)
+
+    def emit(self, record):
+        # Follow the setting when it changes, as it does during test runs.
+        path = os.path.abspath(settings.SLOW_QUERY_LOG)
+        if path != self.baseFilename:
+            self.close()
+            self.baseFilename = path
+        super().emit(record)
+
+    def _open(self):
+        Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)
+        return super()._open()
+
+
+@contextmanager
+def temporary_log():
+    """
+    Write the slow query log to a throwaway directory for the duration, so
+    test and benchmark runs leave the real log alone.
+    """
+    from django.test import override_settings
+
+    with tempfile.TemporaryDirectory() as directory, override_settings(SLOW_QUERY_LOG=Path(directory) / 'slow_queries.log'):
+        yield
+
+
+def log_files():
+    """
+    Return the slow query log and its rotated backups, oldest first.
+    """
+    path = Path(settings.SLOW_QUERY_LOG)
+    backups = sorted(path.parent.glob(path.name + '.*'), key=lambda p: int(p.suffix[1:]) if p.suffix[1:].isdigit() else 0)
+    return list(reversed(backups)) + ([path] if path.exists() else [])
+
+
+def read_entries(paths):
+    """
+    Yield the JSON entries of the given log files, skipping malformed lines.
+    """
+    for path in paths:
+        with open(path, encoding='utf-8') as log:
+            for line in log:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and 'sql' in entry:
+                    yield entry
+
+
+def summarize(entries):
+    """
+    Group entries by SQL text; return one summary dict per statement.
+    """
+    groups = {}
+    for entry in entries:
+        group = groups.get(entry['sql'])
+        if group is None:
+            group = groups[entry['sql']] = {
+                'sql': entry['sql'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'views': set(), 'callers': set(), 'plan': None, 'last_seen': None,
+            }
+        duration = float(entry.get('duration_ms', 0))
+        group['count'] += 1
+        group['total_ms'] += duration
+        if duration >= group['max_ms']:
+            group['max_ms'] = duration
+            group['plan'] = entry.get('plan') or group['plan']
+        if entry.get('view'):
+            group['views'].add(entry['view'])
+        if entry.get('caller'):
+            group['callers'].add(entry['caller'])
+        group['last_seen'] = max(filter(None, [group['last_seen'], entry.get('time')]), default=None)
+    return list(groups.values())
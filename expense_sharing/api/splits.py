@@ -0,0 +1,137 @@
+# api/splits.py
+#
+# Split arithmetic in integer minor units: amounts in cents and percentages
+# in basis points (hundredths of a percent). Shares are rounded with the
+# largest remainder method, so they always add up to the total exactly.
+# Integer arithmetic is several times cheaper than `Decimal`, which matters
+# for bulk imports and for aggregating millions of rows.
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Sum
+
+CENT = Decimal('0.01')
+# 100.00% in basis points.
+WHOLE = 10000
+
+
+def to_cents(amount):
+    """
+    Convert a Decimal amount with at most two decimal places to integer cents.
+    """
+    return int(amount.scaleb(2).to_integral_value())
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+# Percentages have two decimal places too: 12.34% is 1234 basis points.
+to_basis_points = to_cents
+from_basis_points = from_cents
+
+
+def largest_remainder(total, weights, weight_sum=None):
+    """
+    Split the integer `total` in proportion to integer `weights`.
+
+    Each share is rounded down and the units left over go to the shares with
+    the largest remainders; ties go to the later participant, which for an
+    equal split matches the previous rule of giving the rounding difference
+    to the last participant.
+    """
+    if weight_sum is None:
+        weight_sum = sum(weights)
+    shares = []
+    remainders = []
+    for weight in weights:
+        share, remainder = divmod(total * weight, weight_sum)
+        shares.append(share)
+        remainders.append(remainder)
+    leftover = total - sum(shares)
+    if leftover:
+        for index in sorted(range(len(shares)), key=lambda i: (remainders[i], i), reverse=True)[:leftover]:
+            shares[index] += 1
+    return shares
+
+
+def split(split_type, total, values):
+    """
+    Return each participant's share in cents of `total` cents.
+
+    `values` holds one entry per participant: cents for EXACT, basis points
+    for PERCENTAGE; for EQUAL only their number matters.
+    """
+    if split_type == 'EQUAL':
+        count = len(values)
+        share, leftover = divmod(total, count)
+        # The same as largest_remainder with equal weights, without the sort.
+        return [share] * (count - leftover) + [share + 1] * leftover
+    if split_type == 'EXACT':
+        return list(values)
+    if split_type == 'PERCENTAGE':
+        return largest_remainder(total, values, WHOLE)
+    raise ValueError(f"Unknown split type {split_type!r}.")
+
+
+def split_batch(split_types, totals, counts, values):
+    """
+    Split many expenses in one call over flat arrays.
+
+    `split_types`, `totals` (cents) and `counts` hold one entry per expense;
+    `values` holds one entry per participant, expense after expense, as for
+    `split`. Returns the shares in cents as one flat list in the same order.
+    """
+    shares = []
+    start = 0
+    for split_type, total, count in zip(split_types, totals, counts):
+        shares.extend(split(split_type, total, values[start:start + count]))
+        start += count
+    return shares
+
+
+def check(split_type, total, values):
+    """
+    Return an error message when `values` cannot split `total`, else None.
+    """
+    if split_type == 'EXACT':
+        if sum(values) != total:
+            return f"Sum of exact amounts {from_cents(sum(values))} does not equal total amount {from_cents(total)}."
+    elif split_type == 'PERCENTAGE':
+        if sum(values) != WHOLE:
+            return f"Sum of percentages {from_basis_points(sum(values))} does not equal 100%."
+    elif split_type == 'EQUAL':
+        if total <= 0:
+            return "Total amount must be greater than zero for EQUAL split."
+    return None
+
+
+def owed_total():
+    """
+    Aggregate summing participants' amount_owed, from the integer column
+    when AMOUNT_COLUMNS is "cents". Read the result with `owed_decimal`.
+    """
+    if settings.AMOUNT_COLUMNS == 'cents':
+        return Sum('amount_owed_cents')
+    return Sum('amount_owed')
+
+
+def paid_total():
+    """
+    Aggregate summing expenses' total_amount, like `owed_total`.
+    """
+    if settings.AMOUNT_COLUMNS == 'cents':
+        return Sum('total_cents')
+    return Sum('total_amount')
+
+
+def owed_decimal(total):
+    """
+    Convert an `owed_total` or `paid_total` result to an exact Decimal.
+    """
+    if settings.AMOUNT_COLUMNS == 'cents':
+        return from_cents(total)
+    # SQLite sums decimals as floats; amounts are whole cents, so round the
+    # error of long sums away.
+    return total.quantize(CENT)
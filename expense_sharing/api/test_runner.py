@@ -0,0 +1,19 @@
+# api/test_runner.py
+
+from django.test.runner import DiscoverRunner
+
+from . import slow_queries
+
+
+class TestRunner(DiscoverRunner):
+    """
+    The default runner, with the slow query log sent to a temporary file.
+    """
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.slow_query_log = slow_queries.temporary_log()
+        self.slow_query_log.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self.slow_query_log.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
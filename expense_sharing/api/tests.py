@@ -1,7 +1,32 @@
+import asyncio
+import gzip
+import json
+import tempfile
+import time
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from io import BytesIO, StringIO
+from pathlib import Path
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection, connections
+from django.conf import settings
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import mock, skipUnless
+from wsgiref.util import FileWrapper
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
 from rest_framework import status
-from api.models import CustomUser, Expense
+from api import changes, exports, fast_serializers, ledger, metrics, profiling, pubsub, rollups, routers, seeding, settlement, slow_queries, splits
+from api import cache as response_cache
+from decimal import Decimal
+from api.models import Balance, CustomUser, DailySpending, Expense, ExpenseChange, ExpenseParticipant, ExportJob
+from api.serializers import ExpenseSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
 
 class UserRegistrationTest(APITestCase):
@@ -114,8 +139,8 @@ class ExpenseTest(APITestCase):
 
         # Verify the response contains the expected data
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], 'Dinner')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], 'Dinner')
 
     def test_download_latest_expense(self):
         """
@@ -135,3 +160,1361 @@ class ExpenseTest(APITestCase):
         # Verify that the response is successful
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('attachment; filename="latest_expense_', response['Content-Disposition'])
+
+
+class MultiUserTestCase(APITestCase):
+    def setUp(self):
+        """
+        Create three users and authenticate as the first one.
+        """
+        response_cache.get_cache().clear()
+        self.alice = CustomUser.objects.create_user(
+            username="alice", email="alice@example.com", mobile_number="1000000001", password="password123"
+        )
+        self.bob = CustomUser.objects.create_user(
+            username="bob", email="bob@example.com", mobile_number="1000000002", password="password123"
+        )
+        self.carol = CustomUser.objects.create_user(
+            username="carol", email="carol@example.com", mobile_number="1000000003", password="password123"
+        )
+        refresh = RefreshToken.for_user(self.alice)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def add_expense(self, created_by, total_amount, participants):
+        data = {
+            "name": "Shared",
+            "created_by": created_by.id,
+            "total_amount": total_amount,
+            "split_type": "EXACT",
+            "participants": [
+                {"user_id": user.id, "amount_owed": amount} for user, amount in participants
+            ],
+        }
+        response = self.client.post(reverse('add_expense'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['expense_id']
+
+
+class BalanceLedgerTest(MultiUserTestCase):
+    def test_balances_are_netted_per_pair(self):
+        """
+        Ensure the ledger nets debts in both directions between two users.
+        """
+        self.add_expense(self.alice, "90.00", [(self.alice, "30.00"), (self.bob, "30.00"), (self.carol, "30.00")])
+        self.add_expense(self.bob, "20.00", [(self.alice, "20.00")])
+
+        response = self.client.get(reverse('get_user_balances', args=[self.bob.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{'user_id': self.alice.id, 'username': 'alice', 'amount': '10.00'}])
+
+        response = self.client.get(reverse('get_user_balances', args=[self.alice.id]))
+        amounts = {row['username']: row['amount'] for row in response.data}
+        self.assertEqual(amounts, {'bob': '-10.00', 'carol': '-30.00'})
+
+    def test_rebuild_balances_matches_raw_rows(self):
+        """
+        Ensure the rebuild command reproduces the incrementally maintained ledger.
+        """
+        self.add_expense(self.alice, "90.00", [(self.alice, "30.00"), (self.bob, "30.00"), (self.carol, "30.00")])
+        self.add_expense(self.carol, "15.00", [(self.bob, "15.00")])
+        before = ledger.stored_balances()
+
+        call_command('rebuild_balances', stdout=StringIO())
+        self.assertEqual(ledger.stored_balances(), before)
+
+        Balance.objects.filter(debtor=self.bob, creditor=self.carol).update(amount=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_balances', '--check', stdout=StringIO(), stderr=StringIO())
+
+    def test_involved_users_are_locked_before_the_ledger(self):
+        """
+        Ensure writers lock the involved users before reading balances to update.
+        """
+        with CaptureQueriesContext(connection) as context:
+            self.add_expense(self.alice, "20.00", [(self.bob, "20.00")])
+        statements = [query['sql'] for query in context.captured_queries]
+        lock = next(index for index, sql in enumerate(statements) if sql.startswith('UPDATE "api_customuser"'))
+        ledger_read = next(index for index, sql in enumerate(statements) if 'FROM "api_balance"' in sql)
+        self.assertLess(lock, ledger_read)
+
+
+class SettlementTest(MultiUserTestCase):
+    def test_minimize_cash_flow_is_exact(self):
+        """
+        Ensure the greedy settlement uses at most n - 1 transfers and settles to the cent.
+        """
+        positions = {1: Decimal('10.01'), 2: Decimal('-3.34'), 3: Decimal('-3.33'), 4: Decimal('-3.34')}
+        transfers = settlement.minimize_cash_flow(positions)
+        self.assertLessEqual(len(transfers), 3)
+        for debtor_id, creditor_id, amount in transfers:
+            positions[debtor_id] += amount
+            positions[creditor_id] -= amount
+        self.assertTrue(all(amount == 0 for amount in positions.values()))
+
+        with self.assertRaises(ValueError):
+            settlement.minimize_cash_flow({1: Decimal('1.00')})
+
+    def test_settle_expenses(self):
+        """
+        Ensure a chain of debts collapses into a single transfer.
+        """
+        self.add_expense(self.bob, "25.00", [(self.alice, "25.00")])
+        self.add_expense(self.carol, "25.00", [(self.bob, "25.00")])
+
+        response = self.client.get(reverse('settle_expenses'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['transfers'], [{
+            'from_user_id': self.alice.id, 'from_username': 'alice',
+            'to_user_id': self.carol.id, 'to_username': 'carol',
+            'amount': '25.00',
+        }])
+
+        response = self.client.get(reverse('settle_expenses'), {'user_ids': f'{self.alice.id},{self.bob.id}'})
+        self.assertEqual(len(response.data['transfers']), 1)
+        self.assertEqual(response.data['transfers'][0]['to_username'], 'bob')
+
+
+class SplitEngineTest(MultiUserTestCase):
+    def test_shares_add_up_to_the_total(self):
+        """
+        Ensure integer splits hand out every cent, with the largest remainders first.
+        """
+        self.assertEqual(splits.split('EQUAL', 1000, [None] * 3), [333, 333, 334])
+        self.assertEqual(splits.split('PERCENTAGE', 1000, [3333, 3333, 3334]), [333, 333, 334])
+        self.assertEqual(splits.split('PERCENTAGE', 101, [5000, 2500, 2500]), [51, 25, 25])
+        for total in (1, 99, 1001, 123457):
+            self.assertEqual(sum(splits.split('PERCENTAGE', total, [1, 3333, 6666])), total)
+
+        expenses = [('EQUAL', 1000, [None] * 3), ('EXACT', 500, [200, 300]), ('PERCENTAGE', 999, [2500, 7500])]
+        flat = [value for _, _, values in expenses for value in values]
+        self.assertEqual(
+            splits.split_batch([e[0] for e in expenses], [e[1] for e in expenses], [len(e[2]) for e in expenses], flat),
+            [cents for split_type, total, values in expenses for cents in splits.split(split_type, total, values)],
+        )
+
+    def test_percentage_expense_stores_cents(self):
+        """
+        Ensure percentage shares sum to the total and the integer columns are filled in.
+        """
+        response = self.client.post(reverse('add_expense'), {
+            "name": "Dinner",
+            "created_by": self.alice.id,
+            "total_amount": "10.00",
+            "split_type": "PERCENTAGE",
+            "participants": [
+                {"user_id": self.alice.id, "percentage_owed": "33.33"},
+                {"user_id": self.bob.id, "percentage_owed": "33.33"},
+                {"user_id": self.carol.id, "percentage_owed": "33.34"},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        expense = Expense.objects.get(id=response.data['expense_id'])
+        self.assertEqual(expense.total_cents, 1000)
+        participants = list(expense.participants.order_by('id'))
+        self.assertEqual([p.amount_owed_cents for p in participants], [333, 333, 334])
+        self.assertEqual([p.percentage_bp for p in participants], [3333, 3333, 3334])
+        self.assertEqual(sum(p.amount_owed for p in participants), Decimal('10.00'))
+
+    def test_cents_columns_aggregate_like_decimals(self):
+        """
+        Ensure AMOUNT_COLUMNS=cents computes the same balances and settlement.
+        """
+        self.add_expense(self.alice, "90.01", [(self.alice, "30.01"), (self.bob, "30.00"), (self.carol, "30.00")])
+        self.add_expense(self.carol, "15.55", [(self.bob, "15.55")])
+        expected = (ledger.compute_from_rows(), settlement.compute_net_positions())
+        with override_settings(AMOUNT_COLUMNS='cents'):
+            self.assertEqual((ledger.compute_from_rows(), settlement.compute_net_positions()), expected)
+
+
+class SpendingSummaryTest(MultiUserTestCase):
+    def test_rollups_follow_expense_writes(self):
+        """
+        Ensure the incrementally maintained rollups match a rebuild from the raw rows.
+        """
+        self.add_expense(self.alice, "90.00", [(self.alice, "30.00"), (self.bob, "30.00"), (self.carol, "30.00")])
+        self.add_expense(self.bob, "20.00", [(self.alice, "20.00")])
+        self.assertEqual(rollups.find_mismatches(rollups.compute_from_rows(), rollups.stored_rollups()), [])
+
+        response = self.client.get(reverse('get_spending_summary', args=[self.alice.id]), {'period': 'day'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{
+            'period_start': timezone.localdate().isoformat(), 'owed': '50.00', 'paid': '90.00', 'net': '40.00',
+        }])
+
+        DailySpending.objects.filter(user=self.bob).update(paid=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', '--check', stdout=StringIO(), stderr=StringIO())
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(DailySpending.objects.get(user=self.bob).paid, Decimal('20.00'))
+
+    def test_involved_users_are_locked_before_the_rollups(self):
+        """
+        Ensure writers lock the involved users before reading rollups to update.
+        """
+        with CaptureQueriesContext(connection) as context:
+            self.add_expense(self.alice, "20.00", [(self.bob, "20.00")])
+        statements = [query['sql'] for query in context.captured_queries]
+        lock = next(index for index, sql in enumerate(statements) if sql.startswith('UPDATE "api_customuser"'))
+        rollup_read = next(index for index, sql in enumerate(statements) if 'FROM "api_dailyspending"' in sql)
+        self.assertLess(lock, rollup_read)
+
+    def test_summary_periods_and_range(self):
+        """
+        Ensure totals are grouped per day, week and month within the requested range.
+        """
+        for day, total in (('2024-01-15', "10.00"), ('2024-01-20', "20.00"), ('2024-02-03', "40.00")):
+            expense_id = self.add_expense(self.alice, total, [(self.bob, total)])
+            Expense.objects.filter(id=expense_id).update(created_at=f'{day}T12:00:00Z')
+        call_command('rebuild_rollups', stdout=StringIO())
+        url = reverse('get_spending_summary', args=[self.bob.id])
+
+        def owed(params):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [(row['period_start'], row['owed']) for row in response.data['results']]
+
+        self.assertEqual(owed({}), [('2024-01-01', '30.00'), ('2024-02-01', '40.00')])
+        self.assertEqual(owed({'period': 'week'}), [('2024-01-15', '30.00'), ('2024-01-29', '40.00')])
+        self.assertEqual(owed({'period': 'day', 'start': '2024-01-16', 'end': '2024-02-03'}), [('2024-01-20', '20.00'), ('2024-02-03', '40.00')])
+
+        response = self.client.get(url, {'period': 'year', 'start': '2024-02-30'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'period', 'start'})
+        response = self.client.get(reverse('get_spending_summary', args=[999999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BalanceSheetExportTest(MultiUserTestCase):
+    def download(self, **params):
+        response = self.client.get(reverse('download_balance_sheet'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_streamed_rows(self):
+        """
+        Ensure the streamed CSV has one row per participant, filtered by expense_ids.
+        """
+        first = self.add_expense(self.alice, "30.00", [(self.alice, "10.00"), (self.bob, "20.00")])
+        self.add_expense(self.bob, "5.00", [(self.carol, "5.00")])
+
+        lines = self.download()
+        self.assertEqual(lines[0], 'Expense ID,Name,Total Amount,Split Type,Created At,Participant Username,Amount Owed,Percentage Owed')
+        self.assertEqual(len(lines), 4)
+
+        lines = self.download(expense_ids=str(first))
+        self.assertEqual([line.split(',')[5] for line in lines[1:]], ['alice', 'bob'])
+        self.assertEqual(lines[2].split(',')[6:], ['20.00', ''])
+
+    def test_query_count_is_independent_of_size(self):
+        """
+        Ensure the export runs a fixed number of queries however many rows it writes.
+        """
+        self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+        with self.assertNumQueries(2):
+            self.download()
+
+        for _ in range(5):
+            self.add_expense(self.alice, "30.00", [(self.alice, "10.00"), (self.bob, "10.00"), (self.carol, "10.00")])
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.download()), 17)
+
+
+class ExportJobTest(MultiUserTestCase):
+    def setUp(self):
+        super().setUp()
+        exports_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(exports_dir.cleanup)
+        # Jobs run inline when their transaction commits.
+        settings_override = override_settings(EXPORT_WORKERS=0, EXPORTS_DIR=Path(exports_dir.name))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def start_export(self, expected_status=status.HTTP_202_ACCEPTED, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('download_balance_sheet'), data, format='json')
+        self.assertEqual(response.status_code, expected_status)
+        return response.data['id']
+
+    def test_export_job_downloads_with_ranges(self):
+        """
+        Ensure a finished job serves the same CSV as the streamed export, in byte ranges too.
+        """
+        self.add_expense(self.alice, "30.00", [(self.alice, "10.00"), (self.bob, "20.00")])
+        job_id = self.start_export()
+
+        response = self.client.get(reverse('get_export_job', args=[job_id]))
+        self.assertEqual(response.data['status'], 'done')
+        download_url = reverse('download_export_job', args=[job_id])
+        self.assertTrue(response.data['download_url'].endswith(download_url))
+
+        response = self.client.get(reverse('download_balance_sheet'))
+        expected = b''.join(response.streaming_content)
+        response = self.client.get(download_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), expected)
+
+        response = self.client.get(download_url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(expected)}')
+        self.assertEqual(b''.join(response.streaming_content), expected[10:20])
+        response = self.client.get(download_url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), expected[-5:])
+        response = self.client.get(download_url, HTTP_RANGE=f'bytes={len(expected)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        # A changed file would not match If-Range, so the whole file is sent.
+        response = self.client.get(download_url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_finished_export_is_sent_as_a_file(self):
+        """
+        Ensure middleware leaves a finished export to the server's file wrapper and still measures it.
+        """
+        metrics.reset()
+        CustomUser.objects.filter(id=self.alice.id).update(is_staff=True)
+        self.add_expense(self.alice, "30.00", [(self.alice, "10.00"), (self.bob, "20.00")])
+        job_id = self.start_export()
+        # The test client rewraps every streamed body, so call the WSGI
+        # handler directly, keeping the test's connection open like it does.
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+        request = RequestFactory().get(
+            reverse('download_export_job', args=[job_id]),
+            HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.alice).access_token}', HTTP_X_PROFILE='1',
+        )
+        headers = {}
+        with self.settings(PROFILES_DIR=Path(tempfile.mkdtemp(dir=settings.EXPORTS_DIR))):
+            result = WSGIHandler()({**request.environ, 'wsgi.file_wrapper': FileWrapper}, lambda status, response_headers: headers.update(response_headers))
+        self.assertIsInstance(result, FileWrapper)
+        self.assertIn('X-Profile-Id', headers)
+        body = b''.join(result)
+        result.close()
+        self.assertEqual(len(body), int(headers['Content-Length']))
+        self.assertIn(
+            f'http_response_size_bytes_sum{{route="download_export_job",method="GET"}} {metrics.format_value(len(body))}',
+            metrics.render().splitlines(),
+        )
+
+    def test_finished_export_is_reused_until_new_expenses(self):
+        """
+        Ensure the same selection reuses a finished export until an expense is written.
+        """
+        expense_id = self.add_expense(self.alice, "30.00", [(self.bob, "30.00")])
+        first = self.start_export(expense_ids=[expense_id])
+        self.assertEqual(self.start_export(status.HTTP_200_OK, expense_ids=[expense_id]), first)
+        self.assertNotEqual(self.start_export(), first)
+
+        self.add_expense(self.bob, "5.00", [(self.carol, "5.00")])
+        second = self.start_export(expense_ids=[expense_id])
+        self.assertNotEqual(second, first)
+        # The stale export is removed once the new one finishes.
+        self.assertFalse(ExportJob.objects.filter(id=first).exists())
+        self.assertEqual(len(list(settings.EXPORTS_DIR.iterdir())), 2)
+
+    def test_unfinished_jobs(self):
+        """
+        Ensure an unfinished job cannot be downloaded and is failed once it times out.
+        """
+        job = ExportJob.objects.create(selection='', cursor=0)
+        response = self.client.get(reverse('download_export_job', args=[job.id]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        ExportJob.objects.filter(id=job.id).update(created_at=timezone.now() - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT + 1))
+        response = self.client.get(reverse('get_export_job', args=[job.id]))
+        self.assertEqual(response.data['status'], 'failed')
+
+
+class ExportExpensesTest(MultiUserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_expense(self.alice, "30.00", [(self.alice, "10.00"), (self.bob, "20.00")])
+        self.add_expense(self.bob, "5.00", [(self.carol, "5.00")])
+        self.add_expense(self.carol, "9.00", [(self.alice, "4.50"), (self.bob, "4.50")])
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def export(self, output, *args):
+        # The test database is in memory, so chunks are rendered in this process.
+        call_command('export_expenses', str(self.directory / output), '--processes', '1', '--chunk-size', '2', *args, stdout=StringIO())
+        return self.directory / output
+
+    def test_concatenated_export_matches_the_download(self):
+        """
+        Ensure chunked CSV output, plain or gzipped, is identical to the streamed balance sheet.
+        """
+        expected = ''.join(exports.stream_balance_sheet()).encode()
+        self.assertEqual(self.export('expenses.csv').read_bytes(), expected)
+        self.assertEqual(gzip.decompress(self.export('expenses.csv.gz', '--gzip').read_bytes()), expected)
+
+    def test_partitioned_ndjson_export(self):
+        """
+        Ensure a partitioned export writes one file per chunk and a manifest describing them.
+        """
+        output = self.export('parts', '--partitioned', '--format', 'ndjson')
+        manifest = json.loads((output / 'manifest.json').read_text())
+        self.assertEqual(manifest['rows'], 5)
+        self.assertEqual([part['rows'] for part in manifest['parts']], [3, 2])
+        records = [
+            json.loads(line)
+            for part in manifest['parts']
+            for line in (output / part['file']).read_text().splitlines()
+        ]
+        self.assertEqual(records[1]['participant_username'], 'bob')
+        self.assertEqual(records[1]['amount_owed'], '20.00')
+        self.assertIsNone(records[1]['percentage_owed'])
+        self.assertEqual(list(records[0]), exports.BALANCE_SHEET_KEYS)
+
+
+class ExpensePaginationTest(MultiUserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.expense_ids = [
+            self.add_expense(self.alice if i % 2 else self.bob, "10.00", [(self.carol, "10.00")])
+            for i in range(5)
+        ]
+
+    def test_cursor_pages_are_stable(self):
+        """
+        Ensure next and previous cursors walk the full list newest first without gaps or repeats.
+        """
+        seen = []
+        url = reverse('get_overall_expenses') + '?page_size=2'
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([expense['id'] for expense in response.data['results']])
+            seen.extend(pages[-1])
+            last = response.data
+            url = response.data['next']
+        self.assertEqual(seen, list(reversed(self.expense_ids)))
+
+        response = self.client.get(last['previous'])
+        self.assertEqual([expense['id'] for expense in response.data['results']], pages[-2])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_filters(self):
+        """
+        Ensure created_by, split_type and date filters narrow the list.
+        """
+        url = reverse('get_user_expenses', args=[self.carol.id])
+        response = self.client.get(url, {'created_by': self.alice.id})
+        self.assertEqual(len(response.data['results']), 2)
+
+        response = self.client.get(url, {'split_type': 'EQUAL'})
+        self.assertEqual(response.data['results'], [])
+
+        response = self.client.get(url, {'created_after': '2000-01-01', 'created_before': '2000-12-31'})
+        self.assertEqual(response.data['results'], [])
+
+        response = self.client.get(url, {'created_after': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class QueryBudgetMixin:
+    """
+    Assert that an endpoint stays within a fixed number of queries.
+    """
+    def assertQueryBudget(self, url, budget, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(
+            len(context.captured_queries), budget,
+            "\n".join(query['sql'] for query in context.captured_queries),
+        )
+        return response
+
+
+class FastSerializerTest(MultiUserTestCase):
+    def test_output_is_identical_to_expense_serializer(self):
+        """
+        Ensure the values-based list rendering is byte-for-byte the ExpenseSerializer JSON.
+        """
+        self.add_expense(self.alice, "90.00", [(self.alice, "30.00"), (self.bob, "30.00"), (self.carol, "30.00")])
+        for split_type, total, participants in (
+            ('EQUAL', '10.00', [{"user_id": self.bob.id}, {"user_id": self.carol.id}, {"user_id": self.alice.id}]),
+            ('PERCENTAGE', '7.77', [{"user_id": self.bob.id, "percentage_owed": "12.50"}, {"user_id": self.carol.id, "percentage_owed": "87.50"}]),
+        ):
+            response = self.client.post(reverse('add_expense'), {
+                "name": "Café ☕", "created_by": self.bob.id, "total_amount": total,
+                "split_type": split_type, "participants": participants,
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # An expense left without participants, and a timestamp with microseconds.
+        Expense.objects.create(name="Empty", created_by=self.carol, total_amount=Decimal('5'), split_type='EQUAL')
+        Expense.objects.filter(name="Empty").update(created_at=timezone.now().replace(microsecond=123456))
+
+        def render(data):
+            return JSONRenderer().render(data)
+
+        for zone in ('Asia/Kolkata', 'UTC'):
+            with timezone.override(zone):
+                ordering = ('-created_at', '-id')
+                expected = ExpenseSerializer(
+                    ExpenseSerializer.setup_eager_loading(Expense.objects.order_by(*ordering)), many=True,
+                ).data
+                rows = fast_serializers.expense_rows_query(Expense.objects.order_by(*ordering)[:10], ordering)
+                self.assertEqual(render(fast_serializers.serialize_page(fast_serializers.group_rows(rows))), render(expected))
+
+        response = self.client.get(reverse('get_overall_expenses'), {'page_size': 2})
+        self.assertEqual(render(response.data['results']), render(expected[:2]))
+        response = self.client.get(response.data['next'])
+        self.assertEqual(render(response.data['results']), render(expected[2:4]))
+
+
+class ExpenseQueryBudgetTest(QueryBudgetMixin, MultiUserTestCase):
+    def add_expenses(self, count):
+        for _ in range(count):
+            self.add_expense(self.alice, "30.00", [(self.alice, "10.00"), (self.bob, "10.00"), (self.carol, "10.00")])
+
+    def test_read_endpoints_have_fixed_query_budget(self):
+        """
+        Ensure the read endpoints run the same number of queries for one or many expenses.
+        """
+        for count in (1, 10):
+            self.add_expenses(count)
+            # Authentication, then expenses joined with their participants.
+            self.assertQueryBudget(reverse('get_overall_expenses'), 2)
+            # Plus the user's version lookup for the conditional GET.
+            self.assertQueryBudget(reverse('get_user_expenses', args=[self.bob.id]), 3)
+            self.assertQueryBudget(reverse('latest_expense', args=[self.bob.id]), 4)
+            self.assertQueryBudget(reverse('download_latest_expense', args=[self.bob.id]), 4)
+
+    def test_add_expense_query_count_is_independent_of_participants(self):
+        """
+        Ensure users are resolved with one query and participants inserted in one batch.
+        """
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'guest{i}', email=f'guest{i}@example.com', mobile_number=f'20000000{i:02d}')
+            for i in range(20)
+        ])
+        counts = []
+        for guests in (users[:2], users):
+            data = {
+                "name": "Company event",
+                "created_by": self.alice.id,
+                "total_amount": "1000.00",
+                "split_type": "EQUAL",
+                "participants": [{"user_id": user.id} for user in guests],
+            }
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(reverse('add_expense'), data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class BulkExpenseTest(MultiUserTestCase):
+    def expense(self, total_amount="30.00", **overrides):
+        data = {
+            "name": "Imported",
+            "created_by": self.alice.id,
+            "total_amount": total_amount,
+            "split_type": "EQUAL",
+            "participants": [{"user_id": self.alice.id}, {"user_id": self.bob.id}, {"user_id": self.carol.id}],
+        }
+        data.update(overrides)
+        return data
+
+    def test_bulk_json_reports_item_errors(self):
+        """
+        Ensure valid items are created while invalid ones are reported by index.
+        """
+        items = [self.expense(), self.expense(split_type="BOGUS"), self.expense(created_by=999999)]
+        response = self.client.post(reverse('bulk_add_expenses'), items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['expense_ids']), 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+
+        expense = Expense.objects.get(id=response.data['expense_ids'][0])
+        self.assertEqual(sorted(expense.participants.values_list('amount_owed', flat=True)), [10, 10, 10])
+        self.assertEqual(Balance.objects.get(debtor=self.bob, creditor=self.alice).amount, Decimal('10.00'))
+
+    def test_bulk_csv_upload(self):
+        """
+        Ensure a CSV with one participant per row is grouped into expenses.
+        """
+        upload = BytesIO(
+            b"expense,name,created_by,total_amount,split_type,user_id,amount_owed,percentage_owed\n"
+            + f"a,Taxi,{self.alice.id},12.00,EXACT,{self.bob.id},12.00,\n".encode()
+            + f"b,Hotel,{self.bob.id},100.00,PERCENTAGE,{self.alice.id},,40\n".encode()
+            + f"b,Hotel,{self.bob.id},100.00,PERCENTAGE,{self.carol.id},,50\n".encode()
+        )
+        upload.name = 'expenses.csv'
+        response = self.client.post(reverse('bulk_add_expenses'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['expense_ids']), 1)
+        self.assertEqual(response.data['errors'][0]['ref'], 'b')
+
+    def test_bulk_query_count_is_independent_of_size(self):
+        """
+        Ensure user resolution and inserts are batched rather than per item.
+        """
+        counts = []
+        for size in (2, 20):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(reverse('bulk_add_expenses'), [self.expense() for _ in range(size)], format='json')
+            self.assertEqual(len(response.data['expense_ids']), size)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_unknown_users_are_looked_up_once(self):
+        """
+        Ensure items naming users that do not exist add no queries per item.
+        """
+        counts = []
+        for size in (2, 20):
+            items = [self.expense(participants=[{"user_id": self.bob.id}, {"user_id": 999999}]) for _ in range(size)]
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(reverse('bulk_add_expenses'), [self.expense(), *items], format='json')
+            self.assertEqual(len(response.data['expense_ids']), 1)
+            self.assertEqual(len(response.data['errors']), size)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_bulk_query_count_with_disjoint_participants(self):
+        """
+        Ensure latest-expense pointers are set in one statement however many expenses are newest.
+        """
+        counts = []
+        for size in (2, 20):
+            guests = CustomUser.objects.bulk_create([
+                CustomUser(username=f'guest{size}_{i}', email=f'guest{size}_{i}@example.com', mobile_number=f'3{size:02d}00000{i:02d}')
+                for i in range(size)
+            ])
+            items = [self.expense(participants=[{"user_id": guest.id}]) for guest in guests]
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(reverse('bulk_add_expenses'), items, format='json')
+            self.assertEqual(len(response.data['expense_ids']), size)
+            counts.append(len(context.captured_queries))
+            pointers = dict(CustomUser.objects.filter(id__in=[guest.id for guest in guests]).values_list('id', 'last_expense_id'))
+            self.assertEqual(pointers, {guest.id: expense_id for guest, expense_id in zip(guests, response.data['expense_ids'])})
+        self.assertEqual(counts[0], counts[1])
+
+
+class LatestExpenseTest(MultiUserTestCase):
+    def test_latest_expense_pointer_follows_writes(self):
+        """
+        Ensure each participant's latest-expense pointer moves to their newest expense.
+        """
+        first = self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+        second = self.add_expense(self.carol, "10.00", [(self.alice, "10.00")])
+        self.bob.refresh_from_db()
+        self.alice.refresh_from_db()
+        self.assertEqual(self.bob.last_expense_id, first)
+        self.assertEqual(self.alice.last_expense_id, second)
+
+        response = self.client.get(reverse('latest_expense', args=[self.bob.id]))
+        self.assertEqual(response.data['id'], first)
+        response = self.client.get(reverse('latest_expense', args=[self.carol.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @skipUnless(connection.vendor == 'sqlite', "Checks the SQLite query plan.")
+    def test_lookups_use_indexes(self):
+        """
+        Ensure the latest-expense lookups are index searches, not table scans.
+        """
+        plan = Expense.objects.filter(id=CustomUser.objects.filter(id=self.bob.id).values('last_expense_id')[:1]).explain()
+        self.assertNotIn('SCAN', plan)
+        self.assertIn('USING INTEGER PRIMARY KEY', plan)
+
+        plan = Expense.objects.filter(participants__user__id=self.bob.id).order_by('-created_at', '-id').explain()
+        self.assertIn('participant_user_expense_idx', plan)
+        self.assertNotIn('SCAN', plan)
+
+
+class ConditionalGetTest(MultiUserTestCase):
+    def test_unchanged_expenses_return_not_modified(self):
+        """
+        Ensure a repeated poll gets a 304 until an expense involving the user is written.
+        """
+        self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+        url = reverse('get_user_expenses', args=[self.bob.id])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        # Only the authentication and version lookups run for a 304.
+        with self.assertNumQueries(2):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(url, {'page_size': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # An expense between other users leaves bob's ETag alone.
+        self.add_expense(self.alice, "10.00", [(self.carol, "10.00")])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.add_expense(self.carol, "10.00", [(self.bob, "10.00")])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_user_details_etag(self):
+        """
+        Ensure user detail lookups by id and by username support conditional GET.
+        """
+        url = reverse('get_user_details', args=[self.bob.id])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        url = reverse('get_user_by_username')
+        response = self.client.get(url, {'username': 'bob'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url, {'username': 'nobody'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ResponseCacheTest(MultiUserTestCase):
+    def test_cached_until_next_write(self):
+        """
+        Ensure aggregate endpoints are served from the cache until an expense is written.
+        """
+        self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+        url = reverse('get_overall_expenses')
+        first = self.client.get(url)
+
+        # Only authentication runs on a hit.
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.data, first.data)
+
+        # Different query parameters are cached separately.
+        with self.assertNumQueries(2):
+            self.client.get(url, {'page_size': 1})
+
+        self.add_expense(self.alice, "10.00", [(self.carol, "10.00")])
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 2)
+
+        stats = response_cache.get_stats(['overall_expenses'])['overall_expenses']
+        self.assertEqual(stats, {'hits': 1, 'misses': 3})
+
+    def test_small_balance_sheets_are_cached(self):
+        """
+        Ensure a streamed CSV is cached when it fits under the size limit.
+        """
+        self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+        url = reverse('download_balance_sheet')
+        first = b''.join(self.client.get(url).streaming_content)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.content, first)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+    def test_entries_expire(self):
+        """
+        Ensure cached responses expire after the cache's TIMEOUT.
+        """
+        self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+        url = reverse('get_overall_expenses')
+        self.client.get(url)
+        timeout = response_cache.get_cache().default_timeout
+        with mock.patch('time.time', return_value=time.time() + timeout - 1):
+            self.client.get(url)
+        with mock.patch('time.time', return_value=time.time() + timeout + 1):
+            self.client.get(url)
+        stats = response_cache.get_stats(['overall_expenses'])['overall_expenses']
+        self.assertEqual(stats, {'hits': 1, 'misses': 2})
+
+    def test_evicted_generation_is_not_reused(self):
+        """
+        Ensure losing the generation counter never makes older responses readable again.
+        """
+        self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+        url = reverse('get_overall_expenses')
+        cache = response_cache.get_cache()
+        self.client.get(url)
+        old = response_cache.get_generation(cache)
+
+        self.add_expense(self.alice, "10.00", [(self.carol, "10.00")])
+        cache.delete(response_cache.GENERATION_KEY)
+        self.assertGreater(response_cache.get_generation(cache), old)
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_cache_stats_requires_staff(self):
+        """
+        Ensure only staff users can read the cache counters.
+        """
+        response = self.client.get(reverse('get_cache_stats'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.alice.is_staff = True
+        self.alice.save()
+        response = self.client.get(reverse('get_cache_stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('balance_sheet', response.data['endpoints'])
+
+
+class AsyncReadEndpointTest(MultiUserTestCase):
+    def test_async_endpoints_match_sync_endpoints(self):
+        """
+        Ensure the async read endpoints return the same JSON as the sync ones.
+        """
+        for i in range(3):
+            self.add_expense(self.alice, "30.00", [(self.alice, "10.00"), (self.bob, "20.00")])
+        pairs = [
+            ('get_user_details', 'async_get_user_details', [self.bob.id], {}),
+            ('get_user_by_username', 'async_get_user_by_username', [], {'username': 'bob'}),
+            ('get_user_expenses', 'async_get_user_expenses', [self.bob.id], {'page_size': 2}),
+            ('latest_expense', 'async_latest_expense', [self.bob.id], {}),
+            ('latest_expense', 'async_latest_expense', [self.carol.id], {}),
+        ]
+        for sync_name, async_name, args, params in pairs:
+            expected = self.client.get(reverse(sync_name, args=args), params)
+            response = self.client.get(reverse(async_name, args=args), params)
+            self.assertEqual(response.status_code, expected.status_code, async_name)
+            # Pagination links point back at the endpoint that was called.
+            self.assertEqual(response.content.replace(b'/async', b''), expected.content, async_name)
+
+    def test_async_conditional_get_and_authentication(self):
+        """
+        Ensure the async endpoints honour ETags and require a valid token.
+        """
+        self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+        url = reverse('async_latest_expense', args=[self.bob.id])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.credentials()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class DeltaSyncTest(QueryBudgetMixin, MultiUserTestCase):
+    def test_changes_since_cursor(self):
+        """
+        Ensure a client holding a cursor receives exactly the expenses written after it.
+        """
+        self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+        url = reverse('get_expense_changes')
+        cursor = self.client.get(url, {'user_id': self.bob.id}).data['cursor']
+        alice_cursor = self.client.get(url).data['cursor']
+
+        bob_expense = self.add_expense(self.carol, "20.00", [(self.bob, "20.00")])
+        self.add_expense(self.carol, "5.00", [(self.carol, "5.00")])
+
+        response = self.client.get(url, {'since': cursor, 'user_id': self.bob.id})
+        self.assertEqual([expense['id'] for expense in response.data['results']], [bob_expense])
+        self.assertFalse(response.data['has_more'])
+        # Alice is neither creator nor participant of the new expenses.
+        response = self.client.get(url, {'since': alice_cursor})
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response.data['cursor'], alice_cursor)
+
+        response = self.client.get(url, {'since': 'latest'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_changes_are_paged(self):
+        """
+        Ensure a full replay from cursor 0 arrives in order across pages.
+        """
+        expense_ids = [self.add_expense(self.alice, "10.00", [(self.bob, "10.00")]) for _ in range(5)]
+        url = reverse('get_expense_changes')
+        seen = []
+        cursor = '0'
+        while True:
+            response = self.client.get(url, {'since': cursor, 'limit': 2})
+            seen.extend(expense['id'] for expense in response.data['results'])
+            cursor = response.data['cursor']
+            if not response.data['has_more']:
+                break
+        self.assertEqual(seen, expense_ids)
+
+    def test_query_count_is_independent_of_history(self):
+        """
+        Ensure a sync costs the same however many expenses were written before the cursor.
+        """
+        url = reverse('get_expense_changes')
+        for count in (1, 20):
+            for _ in range(count):
+                self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+            cursor = self.client.get(url).data['cursor']
+            self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+            # Authentication, changes, expenses and participants.
+            response = self.assertQueryBudget(url, 4, since=cursor)
+            self.assertEqual(len(response.data['results']), 1)
+
+    @skipUnless(connection.vendor == 'postgresql', "Checks the PostgreSQL advisory lock.")
+    def test_change_log_writers_are_serialized(self):
+        """
+        Ensure writing changes holds the change-log lock until the transaction ends.
+        """
+        self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid() "
+                "AND ((classid::bigint << 32) | objid::bigint) = %s",
+                [changes.CHANGE_LOG_LOCK],
+            )
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class ExpenseEventStreamTest(MultiUserTestCase):
+    def add_committed_expense(self, *args):
+        # Run the on-commit publish that the test transaction would swallow.
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.add_expense(*args)
+
+    async def read_event(self, stream):
+        """
+        Return the next chunk of the stream that is not a keep-alive comment.
+        """
+        while True:
+            chunk = (await asyncio.wait_for(anext(stream), 5)).decode()
+            if not chunk.startswith(':'):
+                return chunk
+
+    async def test_stream_receives_new_expenses(self):
+        """
+        Ensure an open stream receives an event for each expense the user takes part in.
+        """
+        token = str(RefreshToken.for_user(self.bob).access_token)
+        response = await self.async_client.get(reverse('expense_events'), {'token': token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await self.read_event(stream)).startswith('retry:'))
+
+        expense_id = await sync_to_async(self.add_committed_expense)(self.alice, "10.00", [(self.bob, "10.00")])
+        chunk = await self.read_event(stream)
+        self.assertIn('event: expense', chunk)
+        self.assertEqual(json.loads(chunk.split('data: ')[1])['expense_id'], expense_id)
+
+    async def test_reconnect_replays_missed_changes(self):
+        """
+        Ensure a stream opened with Last-Event-ID first replays the changes after it.
+        """
+        expense_ids = [
+            await sync_to_async(self.add_expense)(self.alice, "10.00", [(self.bob, "10.00")])
+            for _ in range(2)
+        ]
+        token = str(RefreshToken.for_user(self.bob).access_token)
+        response = await self.async_client.get(
+            reverse('expense_events'), headers={'Authorization': f'Bearer {token}', 'Last-Event-ID': '0'},
+        )
+        stream = aiter(response.streaming_content)
+        await self.read_event(stream)
+        for expense_id in expense_ids:
+            chunk = await self.read_event(stream)
+            self.assertEqual(json.loads(chunk.split('data: ')[1])['expense_id'], expense_id)
+
+    async def test_requires_token(self):
+        """
+        Ensure a stream cannot be opened without a valid token.
+        """
+        response = await self.async_client.get(reverse('expense_events'), {'token': 'not-a-token'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_slow_subscriber_is_dropped(self):
+        """
+        Ensure a subscriber whose queue overflows is told to resync instead of buffering.
+        """
+        broker = pubsub.LocalBroker(queue_size=2, max_subscribers=1)
+        subscription = broker.subscribe(self.bob.id)
+        self.assertTrue(broker.is_full())
+        await sync_to_async(broker.publish, thread_sensitive=False)(
+            [(self.bob.id, pubsub.make_event(cursor, cursor)) for cursor in range(1, 4)]
+        )
+        await asyncio.sleep(0)
+        self.assertEqual((await subscription.get(1))['cursor'], 1)
+        self.assertEqual((await subscription.get(1))['cursor'], 2)
+        with self.assertRaises(pubsub.Overflow):
+            await subscription.get(1)
+        broker.unsubscribe(subscription)
+        self.assertFalse(broker.is_full())
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class MetricsTest(MultiUserTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def scrape(self):
+        # A fresh client: the test client's JWT credentials would take precedence.
+        response = APIClient().get(reverse('get_metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_requests_are_recorded_per_route(self):
+        """
+        Ensure status codes, query counts and response sizes are recorded per route.
+        """
+        self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+        url = reverse('get_user_expenses', args=[self.bob.id])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.client.get(reverse('get_user_expenses', args=[999]))
+
+        samples = self.scrape()
+        labels = '{route="get_user_expenses",method="GET"}'
+        self.assertEqual(samples['http_requests_total{route="get_user_expenses",method="GET",status="200"}'], 1)
+        self.assertEqual(samples['http_requests_total{route="get_user_expenses",method="GET",status="404"}'], 1)
+        self.assertEqual(samples['http_request_duration_seconds_count' + labels], 2)
+        self.assertGreaterEqual(samples['http_request_db_queries_sum' + labels], len(context.captured_queries))
+        self.assertGreater(samples['http_response_size_bytes_sum' + labels], len(response.content))
+        self.assertEqual(
+            samples['http_request_duration_seconds_bucket{route="get_user_expenses",method="GET",le="+Inf"}'], 2,
+        )
+
+    def test_async_and_streamed_responses(self):
+        """
+        Ensure queries of async views and the size of streamed bodies are counted.
+        """
+        self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+        self.client.get(reverse('async_get_user_details', args=[self.bob.id]))
+        response = self.client.get(reverse('download_balance_sheet'))
+        body = b''.join(response.streaming_content)
+
+        samples = self.scrape()
+        self.assertGreater(samples['http_request_db_queries_sum{route="async_get_user_details",method="GET"}'], 0)
+        self.assertEqual(samples['http_response_size_bytes_sum{route="download_balance_sheet",method="GET"}'], len(body))
+
+    def test_scrape_requires_token(self):
+        """
+        Ensure the endpoint needs the metrics token and is off without one.
+        """
+        self.assertEqual(self.client.get(reverse('get_metrics')).status_code, status.HTTP_401_UNAUTHORIZED)
+        with self.settings(METRICS_TOKEN=''):
+            response = self.client.get(reverse('get_metrics'), HTTP_AUTHORIZATION='Bearer ')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SlowQueryLogTest(MultiUserTestCase):
+    def test_slow_queries_are_logged_with_plan(self):
+        """
+        Ensure queries over the threshold are logged with their view, caller and plan.
+        """
+        self.add_expense(self.alice, "10.00", [(self.bob, "10.00")])
+        url = reverse('latest_expense', args=[self.bob.id])
+        with self.settings(SLOW_QUERY_THRESHOLD_MS=0), self.assertLogs('api.slow_queries', 'WARNING') as logs:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        entries = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertTrue(all(entry['view'] == 'latest_expense' for entry in entries))
+        self.assertFalse(any('EXPLAIN' in entry['sql'] for entry in entries))
+        expense_query = next(entry for entry in entries if entry['sql'].startswith('SELECT "api_expense"'))
+        self.assertEqual(expense_query['path'], url)
+        self.assertIn('api/views.py', expense_query['caller'])
+        if connection.vendor == 'sqlite':
+            self.assertTrue(any('api_expense' in line for line in expense_query['plan']))
+
+    def test_failed_explain_leaves_the_transaction_usable(self):
+        """
+        Ensure a failing EXPLAIN inside a transaction is reported without breaking it.
+        """
+        with mock.patch.dict(slow_queries.EXPLAIN_PREFIXES, {connection.vendor: 'EXPLAIN BOGUS '}):
+            plan, error = slow_queries.explain(connection, 'SELECT 1', None)
+        self.assertIsNone(plan)
+        self.assertIsNotNone(error)
+        self.assertFalse(connection.needs_rollback)
+        self.assertEqual(CustomUser.objects.count(), 3)
+
+    def test_log_file_is_created_on_first_write(self):
+        """
+        Ensure the log follows SLOW_QUERY_LOG and creates its directory lazily.
+        """
+        self.assertNotEqual(settings.SLOW_QUERY_LOG, settings.BASE_DIR / 'logs' / 'slow_queries.log')
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'nested' / 'slow.log'
+            with self.settings(SLOW_QUERY_LOG=path):
+                self.assertFalse(path.parent.exists())
+                slow_queries.logger.warning(json.dumps({'sql': 'SELECT 1'}))
+                self.assertEqual([entry['sql'] for entry in slow_queries.read_entries([path])], ['SELECT 1'])
+            for handler in slow_queries.logger.handlers:
+                handler.close()
+
+    def test_disabled_without_threshold(self):
+        """
+        Ensure nothing is logged while the threshold is unset.
+        """
+        with self.settings(SLOW_QUERY_THRESHOLD_MS=None), self.assertNoLogs('api.slow_queries'):
+            self.client.get(reverse('get_overall_expenses'))
+
+    def test_summary_command(self):
+        """
+        Ensure the summary ranks statements by total time and shows the worst plan.
+        """
+        entries = [
+            {'sql': 'SELECT fast', 'duration_ms': 300, 'view': 'a', 'plan': ['SCAN fast']},
+            {'sql': 'SELECT slow', 'duration_ms': 250, 'view': 'b', 'plan': ['SCAN slow']},
+            {'sql': 'SELECT slow', 'duration_ms': 900, 'view': 'c', 'plan': ['SCAN slow worst']},
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'slow_queries.log'
+            path.write_text(''.join(json.dumps(entry) + '\n' for entry in entries) + 'not json\n')
+            out = StringIO()
+            call_command('slow_queries', str(path), stdout=out)
+        output = out.getvalue()
+        self.assertLess(output.index('SELECT slow'), output.index('SELECT fast'))
+        self.assertIn('2 calls, 1150.0 ms total', output)
+        self.assertIn('views:   b, c', output)
+        self.assertIn('plan:    SCAN slow worst', output)
+
+
+class RequestProfilerTest(MultiUserTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_override = self.settings(PROFILES_DIR=Path(directory.name))
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.add_expense(self.alice, "30.00", [(self.bob, "10.00"), (self.carol, "20.00")])
+
+    def test_staff_can_profile_a_request(self):
+        """
+        Ensure a staff request with X-Profile is profiled, streamed body included.
+        """
+        CustomUser.objects.filter(id=self.alice.id).update(is_staff=True)
+        response = self.client.get(reverse('download_balance_sheet'), HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'carol', b''.join(response.streaming_content))
+        profile_id = response['X-Profile-Id']
+
+        [profile] = profiling.list_profiles()
+        self.assertEqual(profile['id'], profile_id)
+        self.assertEqual(profile['view'], 'download_balance_sheet')
+        functions = {name for _, _, name in profiling.load_stats(profile_id).stats}
+        self.assertIn('stream_balance_sheet', functions)
+
+        second = self.client.get(reverse('get_overall_expenses'), {'profile': '1'})['X-Profile-Id']
+        out = StringIO()
+        call_command('profiles', 'diff', profile_id, second, '--limit', '1000', stdout=out)
+        self.assertIn('stream_balance_sheet', out.getvalue())
+        out = StringIO()
+        call_command('profiles', 'list', stdout=out)
+        self.assertIn(second, out.getvalue())
+
+    def test_streamed_body_is_profiled_as_it_is_sent(self):
+        """
+        Ensure a streamed body is not buffered and its profile is saved once it ends.
+        """
+        CustomUser.objects.filter(id=self.alice.id).update(is_staff=True)
+        response = self.client.get(reverse('download_balance_sheet'), HTTP_X_PROFILE='1')
+        self.assertEqual(profiling.list_profiles(), [])
+        self.assertTrue(profiling.lock.locked())
+
+        b''.join(response.streaming_content)
+        self.assertFalse(profiling.lock.locked())
+        self.assertEqual([profile['id'] for profile in profiling.list_profiles()], [response['X-Profile-Id']])
+
+        response = self.client.get(reverse('download_balance_sheet'), HTTP_X_PROFILE='1')
+        response.close()
+        self.assertFalse(profiling.lock.locked())
+        self.assertEqual(len(profiling.list_profiles()), 2)
+
+    def test_concurrent_profile_requests_are_skipped(self):
+        """
+        Ensure a request is served unprofiled, and says so, while another is profiled.
+        """
+        CustomUser.objects.filter(id=self.alice.id).update(is_staff=True)
+        with profiling.lock, self.assertLogs('api.middleware', 'WARNING') as logs:
+            response = self.client.get(reverse('get_overall_expenses'), HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Profile-Skipped'], 'another request is being profiled')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertIn('another request is being profiled', logs.output[0])
+
+    def test_non_staff_requests_are_not_profiled(self):
+        """
+        Ensure the profile flag is ignored for other users.
+        """
+        response = self.client.get(reverse('get_overall_expenses'), HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(profiling.list_profiles(), [])
+
+class SeedDataTest(APITestCase):
+    def test_seed_data_writes_consistent_rows(self):
+        """
+        Ensure seeded expenses come with the state the write paths maintain.
+        """
+        call_command('seed_data', '--users', '30', '--expenses', '300', '--batch-size', '64', stdout=StringIO())
+        self.assertEqual(CustomUser.objects.count(), 30)
+        self.assertEqual(Expense.objects.count(), 300)
+        self.assertEqual(set(Expense.objects.values_list('split_type', flat=True)), {'EQUAL', 'EXACT', 'PERCENTAGE'})
+
+        for expense in Expense.objects.filter(split_type__in=['EQUAL', 'EXACT']).prefetch_related('participants'):
+            self.assertEqual(sum(p.amount_owed for p in expense.participants.all()), expense.total_amount)
+        self.assertEqual(ledger.find_mismatches(ledger.compute_from_rows(), ledger.stored_balances()), [])
+        for user in CustomUser.objects.all():
+            latest = ExpenseParticipant.objects.filter(user=user).order_by('-expense__created_at').first()
+            self.assertEqual(user.last_expense_id, latest and latest.expense_id)
+        self.assertGreaterEqual(ExpenseChange.objects.count(), ExpenseParticipant.objects.count())
+
+        # The user with the most expenses can log in with the shared password.
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'seed0', 'password': seeding.PASSWORD})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertRaises(CommandError):
+            call_command('seed_data', '--users', '30', '--expenses', '10', stdout=StringIO())
+
+    def test_same_seed_generates_same_expenses(self):
+        """
+        Ensure the generator is deterministic for a given seed.
+        """
+        def generate(seed):
+            generator = seeding.Generator(list(range(1, 51)), seed=seed)
+            return [generator.expense() for _ in range(100)]
+
+        self.assertEqual(generate(1), generate(1))
+        self.assertNotEqual(generate(1), generate(2))
+
+class SQLiteProductionProfileTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(Path(directory.name) / 'db.sqlite3')
+
+    def connect(self, alias='production_profile', timeout=None):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        profile = settings.SQLITE_PRODUCTION
+        if timeout is not None:
+            profile = {**profile, 'OPTIONS': {**profile['OPTIONS'], 'timeout': timeout}}
+        wrapper = DatabaseWrapper({**connection.settings_dict, **profile, 'NAME': self.path}, alias=alias)
+        # Registered, so code looking connections up by alias finds it.
+        connections[alias] = wrapper
+        self.addCleanup(connections.__delitem__, alias)
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_connections_apply_the_pragmas(self):
+        """
+        Ensure SQLITE_PROFILE=production configures every new connection.
+        """
+        wrapper = self.connect()
+        with wrapper.cursor() as cursor:
+            pragmas = {}
+            for name in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {name}')
+                pragmas[name] = cursor.fetchone()[0]
+        busy_timeout = int(settings.SQLITE_PRODUCTION['OPTIONS']['timeout'] * 1000)
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': busy_timeout})
+        self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+
+    def test_slow_reads_do_not_wait_for_writers(self):
+        """
+        Ensure explaining a slow read takes no write lock while another connection writes.
+        """
+        reader = self.connect(timeout=2)
+        writer = self.connect(alias='production_writer')
+        with reader.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id integer PRIMARY KEY)')
+        writer.set_autocommit(False)
+        self.addCleanup(writer.rollback)
+        with writer.cursor() as cursor:
+            cursor.execute('INSERT INTO item VALUES (1)')
+
+        with self.settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_EXPLAIN=True), self.assertLogs('api.slow_queries', 'WARNING') as logs:
+            start = time.perf_counter()
+            with reader.cursor() as cursor:
+                cursor.execute('SELECT id FROM item')
+                self.assertEqual(cursor.fetchall(), [])
+            elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, 1)
+        [entry] = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertIsNone(entry['explain_error'])
+        self.assertTrue(entry['plan'])
+
+class ReplicaRoutingTest(APITransactionTestCase):
+    """
+    Runs with a second SQLite database holding a snapshot of the test
+    database as the replica, so reads served by it miss later writes.
+    """
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(
+            username="alice", email="alice@example.com", mobile_number="1000000001", password="password123"
+        )
+        self.bob = CustomUser.objects.create_user(
+            username="bob", email="bob@example.com", mobile_number="1000000002", password="password123"
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.alice).access_token}')
+        response_cache.get_cache().clear()
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = str(Path(directory.name) / 'replica.sqlite3')
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM INTO %s', [path])
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        # Registered on this thread only; the test client runs views here.
+        replica = DatabaseWrapper({**connection.settings_dict, 'NAME': path}, alias='replica')
+        connections['replica'] = replica
+        self.addCleanup(connections.__delitem__, 'replica')
+        self.addCleanup(replica.close)
+        self.settings_override = self.settings(DATABASE_REPLICAS=['replica'])
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def add_expense(self, *users):
+        return self.client.post(reverse('add_expense'), {
+            "name": "Shared",
+            "created_by": self.alice.id,
+            "total_amount": "30.00",
+            "split_type": "EQUAL",
+            "participants": [{"user_id": user.id} for user in users],
+        }, format='json')
+
+    def test_get_requests_read_from_the_replica(self):
+        """
+        Ensure GET endpoints, CSV downloads included, are served by the replica.
+        """
+        self.assertEqual(self.add_expense(self.alice, self.bob).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Expense.objects.count(), 1)
+
+        response = self.client.get(reverse('get_user_expenses', args=[self.bob.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
+        response = self.client.get(reverse('download_balance_sheet'))
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 1)
+
+    def test_writes_and_their_validation_use_the_primary(self):
+        """
+        Ensure writes, and the reads that validate them, go to the primary.
+        """
+        dave = CustomUser.objects.create_user(
+            username="dave", email="dave@example.com", mobile_number="1000000004", password="password123"
+        )
+        self.assertEqual(self.add_expense(self.alice, dave).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Expense.objects.get().participants.count(), 2)
+        response = self.client.get(reverse('get_user_details', args=[dave.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        """
+        Ensure a request that has written reads its own writes.
+        """
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Expense), None)
+        token = routers.replica_reads.set(routers.ReplicaReads())
+        try:
+            self.assertEqual(router.db_for_read(Expense), 'replica')
+            self.assertEqual(router.db_for_write(Expense), 'default')
+            self.assertEqual(router.db_for_read(Expense), None)
+        finally:
+            routers.replica_reads.reset(token)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 from .views import CustomTokenObtainPairView
 from rest_framework_simplejwt.views import TokenRefreshView
@@ -9,16 +9,36 @@ urlpatterns = [
     # User Endpoints
     path('users/register/', views.register_user, name='register_user'),
     path('users/<int:user_id>/', views.get_user_details, name='get_user_details'),
+    path('users/<int:user_id>/balances/', views.get_user_balances, name='get_user_balances'),
+    path('users/<int:user_id>/spending/', views.get_spending_summary, name='get_spending_summary'),
     path('users/by-username/', views.get_user_by_username, name='get_user_by_username'),
 
     # Expense Endpoints
     path('expenses/add/', views.add_expense, name='add_expense'),
+    path('expenses/bulk/', views.bulk_add_expenses, name='bulk_add_expenses'),
     path('expenses/user/<int:user_id>/', views.get_user_expenses, name='get_user_expenses'),
     path('expenses/user/<int:user_id>/latest/', views.get_latest_expense, name='latest_expense'),
     path('expenses/', views.get_overall_expenses, name='get_overall_expenses'),
+    path('expenses/changes/', views.get_expense_changes, name='get_expense_changes'),
+    path('expenses/settle/', views.settle_expenses, name='settle_expenses'),
     path('expenses/balance-sheet/', views.download_balance_sheet, name='download_balance_sheet'),
+    path('expenses/balance-sheet/jobs/<uuid:job_id>/', views.get_export_job, name='get_export_job'),
+    path('expenses/balance-sheet/jobs/<uuid:job_id>/download/', views.download_export_job, name='download_export_job'),
     path('expenses/user/<int:user_id>/latest/download/', views.download_latest_expense, name='download_latest_expense'),
     
+    # Async read endpoints for the ASGI application
+    path('async/users/<int:user_id>/', async_views.get_user_details, name='async_get_user_details'),
+    path('async/users/by-username/', async_views.get_user_by_username, name='async_get_user_by_username'),
+    path('async/expenses/user/<int:user_id>/', async_views.get_user_expenses, name='async_get_user_expenses'),
+    path('async/expenses/user/<int:user_id>/latest/', async_views.get_latest_expense, name='async_latest_expense'),
+    path('async/expenses/events/', async_views.expense_events, name='expense_events'),
+
+    # Server-side response cache
+    path('cache/stats/', views.get_cache_stats, name='get_cache_stats'),
+
+    # Prometheus metrics
+    path('metrics/', views.get_metrics, name='get_metrics'),
+
     # auth token 
     path('auth/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
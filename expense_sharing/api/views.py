@@ -1,13 +1,23 @@
 
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from .models import CustomUser, Expense, ExpenseParticipant
-from .serializers import UserSerializer, ExpenseSerializer, ExpenseParticipantSerializer
+from .models import Balance, CustomUser, Expense, ExpenseParticipant, ExportJob
+from .serializers import UserSerializer, ExpenseSerializer, ExpenseParticipantSerializer, BalanceSerializer, SettlementTransferSerializer, SpendingSummarySerializer, ExportJobSerializer
+from . import bulk, changes, export_jobs, exports, fast_serializers, metrics, rollups, settlement
+from .cache import CACHED_VIEWS, cached_response, get_stats
+from .conditional import expense_conditions, user_conditions, user_state
+from .filters import filter_expenses
+from .pagination import ExpenseCursorPagination
+from django.conf import settings
 from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_date
 import csv
-from django.http import HttpResponse
+import hmac
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 
 # User Endpoints
 
@@ -25,6 +35,7 @@ def register_user(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@user_conditions
 def get_user_details(request, user_id):
     """
     Retrieve user details by user_id.
@@ -33,6 +44,55 @@ def get_user_details(request, user_id):
     serializer = UserSerializer(user)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@expense_conditions
+def get_user_balances(request, user_id):
+    """
+    Retrieve the net balance between a user and each of their counterparties.
+    A positive amount means the user owes the counterparty.
+    """
+    if user_state(request, id=user_id) is None:
+        raise Http404("User not found.")
+    balances = Balance.objects.filter(debtor_id=user_id).exclude(amount=0).select_related('creditor')
+    serializer = BalanceSerializer(balances, many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@expense_conditions
+def get_spending_summary(request, user_id):
+    """
+    Retrieve a user's totals owed (their shares) and paid (expenses they
+    created) per day, week or month, served from the daily rollups.
+    Optional query parameters: period (day, week or month; default month),
+    start and end (ISO dates, inclusive).
+    """
+    if user_state(request, id=user_id) is None:
+        raise Http404("User not found.")
+    errors = {}
+    period = request.query_params.get('period', 'month')
+    if period not in rollups.PERIODS:
+        errors['period'] = [f"Must be one of {', '.join(rollups.PERIODS)}."]
+    bounds = {}
+    for param in ('start', 'end'):
+        value = request.query_params.get(param)
+        try:
+            bounds[param] = parse_date(value) if value else None
+        except ValueError:
+            bounds[param] = None
+        if value and bounds[param] is None:
+            errors[param] = ["Enter a valid ISO 8601 date."]
+    if errors:
+        raise ValidationError(errors)
+
+    totals = rollups.summarize(user_id, period, bounds['start'], bounds['end'])
+    serializer = SpendingSummarySerializer([
+        {'period_start': period_start, 'owed': owed, 'paid': paid, 'net': paid - owed}
+        for period_start, owed, paid in totals
+    ], many=True)
+    return Response({'user_id': user_id, 'period': period, 'results': serializer.data}, status=status.HTTP_200_OK)
+
 # Expense Endpoints
 
 @api_view(['POST'])
@@ -47,19 +107,60 @@ def add_expense(request):
         return Response({'message': 'Expense added successfully.', 'expense_id': expense.id}, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_add_expenses(request):
+    """
+    Add many expenses at once.
+    Accepts a JSON list of expenses (or {"expenses": [...]}) or a CSV upload in
+    the `file` field with one participant per row. Valid expenses are created
+    even when others fail validation; the errors are returned per item.
+    """
+    upload = request.FILES.get('file')
+    if upload is not None:
+        try:
+            items = bulk.parse_csv(upload)
+        except (ValueError, csv.Error) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        items = request.data.get('expenses') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            return Response({"error": "Expected a list of expenses or a CSV file."}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not items:
+        return Response({"error": "No expenses given."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > bulk.MAX_ITEMS:
+        return Response({"error": f"At most {bulk.MAX_ITEMS} expenses can be added at once."}, status=status.HTTP_400_BAD_REQUEST)
+
+    created, errors = bulk.create_expenses(items)
+    return Response({
+        'message': f'{len(created)} expenses added successfully.',
+        'expense_ids': [expense.id for _, expense in created],
+        'errors': [
+            {'index': index, 'ref': items[index].get('ref'), 'errors': error} if upload is not None
+            else {'index': index, 'errors': error}
+            for index, error in errors
+        ],
+    }, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@expense_conditions
 def get_user_expenses(request, user_id):
     """
-    Retrieve individual user expenses.
+    Retrieve individual user expenses, newest first.
+    Paginated with an opaque cursor; see `list_expenses` for the filters.
     """
-    user = get_object_or_404(CustomUser, id=user_id)
-    expenses = Expense.objects.filter(participants__user=user).distinct()
-    serializer = ExpenseSerializer(expenses, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    if user_state(request, id=user_id) is None:
+        raise Http404("User not found.")
+    expenses = Expense.objects.filter(
+        id__in=ExpenseParticipant.objects.filter(user_id=user_id).values('expense_id')
+    )
+    return list_expenses(request, expenses)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@user_conditions
 def get_user_by_username(request):
     """
     Retrieve user details by username.
@@ -75,13 +176,30 @@ def get_user_by_username(request):
     serializer = UserSerializer(user)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
+def find_latest_expense(request, user_id):
+    """
+    Return the newest expense the user takes part in, or None.
+    Reads the user's denormalized pointer with a single primary key lookup
+    and only falls back to scanning their expenses when it is not set.
+    """
+    state = user_state(request, id=user_id)
+    if state is None:
+        return None
+    last_expense_id = state[-1]
+    expenses = ExpenseSerializer.setup_eager_loading(Expense.objects.all())
+    latest_expense = expenses.filter(id=last_expense_id).first() if last_expense_id else None
+    if latest_expense is None:
+        latest_expense = expenses.filter(participants__user__id=user_id).order_by('-created_at', '-id').first()
+    return latest_expense
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@expense_conditions
 def get_latest_expense(request, user_id):
     """
     Get the latest expense for the given user.
     """
-    latest_expense = Expense.objects.filter(participants__user__id=user_id).order_by('-created_at').first()
+    latest_expense = find_latest_expense(request, user_id)
     if latest_expense:
         serializer = ExpenseSerializer(latest_expense)
         return Response(serializer.data)
@@ -89,68 +207,163 @@ def get_latest_expense(request, user_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response('overall_expenses')
 def get_overall_expenses(request):
     """
-    Retrieve overall expenses for all users.
+    Retrieve overall expenses for all users, newest first.
+    Paginated with an opaque cursor; see `list_expenses` for the filters.
     """
-    expenses = Expense.objects.all()
-    serializer = ExpenseSerializer(expenses, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return list_expenses(request, Expense.objects.all())
+
+def list_expenses(request, expenses):
+    """
+    Filter and paginate an expense queryset into a cursor-paginated response.
+    Optional query parameters: created_after, created_before, created_by,
+    split_type, page_size and cursor.
+    Serialized by `fast_serializers` from one query for the page's
+    expenses, creators and participants.
+    """
+    paginator = ExpenseCursorPagination()
+    page_queryset = paginator.get_page_queryset(filter_expenses(expenses, request.query_params), request)
+    rows = fast_serializers.expense_rows_query(page_queryset, paginator.get_ordering())
+    page = paginator.build_page(fast_serializers.group_rows(rows))
+    return paginator.get_paginated_response(fast_serializers.serialize_page(page))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_expense_changes(request):
+    """
+    Retrieve the expenses written after the `since` cursor, oldest change
+    first, with the cursor to send next time. Without `since` only the
+    current cursor is returned, so a client can take it before loading the
+    full list and then keep its copy in sync.
+    Optional query parameters: user_id (defaults to the authenticated user) and limit.
+    """
+    try:
+        user_id = int(request.query_params.get('user_id', request.user.id))
+        limit = min(int(request.query_params.get('limit', changes.PAGE_SIZE)), changes.MAX_PAGE_SIZE)
+        since = request.query_params.get('since')
+        since = None if since is None else int(since)
+    except ValueError:
+        return Response({"error": "user_id, since and limit must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+    if limit < 1 or (since is not None and since < 0):
+        return Response({"error": "since must not be negative and limit must be positive."}, status=status.HTTP_400_BAD_REQUEST)
+
+    if since is None:
+        return Response({'cursor': str(changes.latest_cursor(user_id)), 'has_more': False, 'results': []})
+
+    expense_ids, cursor, has_more = changes.changes_since(user_id, since, limit)
+    expenses = ExpenseSerializer.setup_eager_loading(Expense.objects.filter(id__in=expense_ids))
+    expenses = {expense.id: expense for expense in expenses}
+    serializer = ExpenseSerializer([expenses[id] for id in expense_ids if id in expenses], many=True)
+    return Response({'cursor': str(cursor), 'has_more': has_more, 'results': serializer.data}, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response('settle_expenses')
+def settle_expenses(request):
+    """
+    Compute the smallest list of transfers that settles everyone's net balances.
+    Optional query parameter: user_ids to settle only the debts within that group.
+    """
+    user_ids = request.query_params.get('user_ids')
+    if user_ids:
+        try:
+            user_ids = {int(id) for id in user_ids.split(",")}
+        except ValueError:
+            return Response({"error": "user_ids must be a comma-separated list of integers."}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        user_ids = None
+
+    positions = settlement.compute_net_positions(user_ids)
+    transfers = settlement.minimize_cash_flow(positions)
+    users = CustomUser.objects.all() if user_ids is None else CustomUser.objects.filter(id__in=user_ids)
+    usernames = dict(users.values_list('id', 'username'))
+
+    serializer = SettlementTransferSerializer([
+        {
+            'from_user_id': debtor_id,
+            'from_username': usernames[debtor_id],
+            'to_user_id': creditor_id,
+            'to_username': usernames[creditor_id],
+            'amount': amount,
+        }
+        for debtor_id, creditor_id, amount in transfers
+    ], many=True)
+    return Response({'transfers': serializer.data}, status=status.HTTP_200_OK)
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+@cached_response('balance_sheet')
 def download_balance_sheet(request):
     """
     Download selected expenses as a CSV file.
     Optional query parameter: expense_ids to filter by specific expenses.
+    The CSV is streamed from a single chunked query, so memory use and the
+    number of queries stay flat regardless of the export size.
+
+    POST starts an export job instead, for exports that take longer than a
+    request may; expense_ids can also be sent in the body as a list. The job
+    is returned with 202, or with 200 when a finished export of the same
+    expenses is still current.
     """
     expense_ids = request.query_params.get('expense_ids')
-    
+    if request.method == 'POST' and expense_ids is None:
+        expense_ids = request.data.get('expense_ids')
+
     # Filter by selected expense IDs if provided
     if expense_ids:
-        expense_ids = [int(id) for id in expense_ids.split(",")]
-        expenses = Expense.objects.filter(id__in=expense_ids)
+        try:
+            if isinstance(expense_ids, list):
+                expense_ids = [int(id) for id in expense_ids]
+            else:
+                expense_ids = [int(id) for id in str(expense_ids).split(",")]
+        except (TypeError, ValueError):
+            return Response({"error": "expense_ids must be a list of integers."}, status=status.HTTP_400_BAD_REQUEST)
     else:
-        expenses = Expense.objects.all()
-
-    # Create the HttpResponse object with CSV header
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="selected_expenses.csv"'
-
-    writer = csv.writer(response)
+        expense_ids = None
 
-    # Write the CSV header
-    writer.writerow([
-        'Expense ID', 'Name', 'Total Amount', 'Split Type', 'Created At',
-        'Participant Username', 'Amount Owed', 'Percentage Owed'
-    ])
-
-    # Write detailed expense and participant information
-    for expense in expenses:
-        for participant in expense.participants.all():
-            writer.writerow([
-                expense.id,
-                expense.name,
-                expense.total_amount,
-                expense.split_type,
-                expense.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                participant.user.username,
-                participant.amount_owed if participant.amount_owed else '',
-                participant.percentage_owed if participant.percentage_owed else '',
-            ])
+    if request.method == 'POST':
+        job, _ = export_jobs.start(expense_ids, request.user)
+        job.refresh_from_db()
+        serializer = ExportJobSerializer(job, context={'request': request})
+        response_status = status.HTTP_200_OK if job.status == ExportJob.DONE else status.HTTP_202_ACCEPTED
+        return Response(serializer.data, status=response_status, headers={'Location': serializer.data['status_url']})
 
+    response = StreamingHttpResponse(exports.stream_balance_sheet(expense_ids), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="selected_expenses.csv"'
     return response
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_export_job(request, job_id):
+    """
+    Retrieve the status of a balance sheet export job.
+    """
+    job = get_object_or_404(ExportJob, id=job_id)
+    export_jobs.expire_if_stale(job)
+    return Response(ExportJobSerializer(job, context={'request': request}).data, status=status.HTTP_200_OK)
 
-
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def download_export_job(request, job_id):
+    """
+    Download a finished balance sheet export. Supports single Range requests,
+    so interrupted downloads can resume.
+    """
+    job = get_object_or_404(ExportJob, id=job_id)
+    if job.status != ExportJob.DONE or not export_jobs.job_path(job).exists():
+        return Response({"error": f"The export is {job.status}, not ready for download."}, status=status.HTTP_409_CONFLICT)
+    return export_jobs.file_response(request, job, 'balance_sheet.csv')
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@expense_conditions
 def download_latest_expense(request, user_id):
     """
     Download the latest expense as a CSV file.
     """
-    latest_expense = Expense.objects.filter(participants__user__id=user_id).order_by('-created_at').first()
+    latest_expense = find_latest_expense(request, user_id)
     if not latest_expense:
         return HttpResponse("No expense found.", status=404)
 
@@ -176,6 +389,30 @@ def download_latest_expense(request, user_id):
 
     return response
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_cache_stats(request):
+    """
+    Hit and miss counters of the server-side response cache, per endpoint.
+    """
+    return Response({
+        'backend': settings.CACHES[settings.RESPONSE_CACHE_ALIAS]['BACKEND'],
+        'endpoints': get_stats(CACHED_VIEWS),
+    }, status=status.HTTP_200_OK)
+
+@require_GET
+def get_metrics(request):
+    """
+    Request metrics of this worker process in the Prometheus text format.
+    A plain Django view, so scrapers authenticate with METRICS_TOKEN rather than a JWT.
+    """
+    if not settings.METRICS_TOKEN:
+        raise Http404("Metrics are disabled.")
+    expected = f'Bearer {settings.METRICS_TOKEN}'
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+        return HttpResponse("Invalid metrics token.", status=401, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
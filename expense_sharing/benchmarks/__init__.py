@@ -0,0 +1,46 @@
+"""
+Performance benchmarks for the expense sharing API.
+
+Each module is a standalone script run from the Django project directory:
+
+    python -m benchmarks.<name> --help
+"""
+
+import os
+
+
+def setup_django():
+    """
+    Configure Django so benchmark scripts can import the `api` app.
+    """
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "expense_sharing.settings")
+    django.setup()
+
+
+class test_database:
+    """
+    Context manager running a benchmark against a throwaway test database,
+    the same way `manage.py test` does, so the dev database and the slow
+    query log are never touched.
+    """
+    def __enter__(self):
+        from django.db import connection
+        from django.test.utils import setup_test_environment
+
+        from api import slow_queries
+
+        setup_test_environment()
+        self.slow_query_log = slow_queries.temporary_log()
+        self.slow_query_log.__enter__()
+        self.connection = connection
+        self.old_name = connection.creation.create_test_db(verbosity=0)
+        return connection
+
+    def __exit__(self, *exc_info):
+        from django.test.utils import teardown_test_environment
+
+        self.connection.creation.destroy_test_db(self.old_name, verbosity=0)
+        self.slow_query_log.__exit__(None, None, None)
+        teardown_test_environment()
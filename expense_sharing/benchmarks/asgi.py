@@ -0,0 +1,88 @@
+"""
+Compare read throughput of the sync endpoints under WSGI with the async
+endpoints under ASGI, at increasing concurrency.
+
+Starts gunicorn (or the threaded runserver) and uvicorn (or daphne) against a
+scratch SQLite database seeded with --users and --expenses.
+
+    python -m benchmarks.asgi --concurrency 1 16 64 --duration 5
+"""
+
+import argparse
+import random
+
+from benchmarks import harness, setup_django
+
+
+def seed(num_users, num_expenses, participants):
+    from api import bulk
+    from api.models import CustomUser
+
+    users = CustomUser.objects.bulk_create([
+        CustomUser(username=f'user{i}', email=f'user{i}@example.com', mobile_number=f'{i:010d}')
+        for i in range(num_users)
+    ])
+    rng = random.Random(0)
+    items = []
+    for _ in range(num_expenses):
+        group = rng.sample(users, participants)
+        items.append({
+            'name': 'Dinner',
+            'created_by': group[0].id,
+            'total_amount': '100.00',
+            'split_type': 'EQUAL',
+            'participants': [{'user_id': user.id} for user in group],
+        })
+    bulk.create_expenses(items)
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--expenses', type=int, default=5000)
+    parser.add_argument('--participants', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    directory = harness.scratch_database()
+    try:
+        setup_django()
+        from django.core.management import call_command
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        call_command('migrate', verbosity=0)
+        users = seed(args.users, args.expenses, args.participants)
+        token = str(AccessToken.for_user(users[0]))
+        user_ids = [user.id for user in users]
+
+        paths = {
+            'sync': ['/api/expenses/user/{id}/', '/api/expenses/user/{id}/latest/', '/api/users/{id}/'],
+            'async': ['/api/async/expenses/user/{id}/', '/api/async/expenses/user/{id}/latest/', '/api/async/users/{id}/'],
+        }
+        scenarios = [('wsgi', 'sync'), ('asgi', 'sync'), ('asgi', 'async')]
+
+        print(harness.SUMMARY_HEADER)
+        for server_name, flavour in scenarios:
+            port = harness.free_port()
+            argv = harness.server_commands(port, args.workers).get(server_name)
+            if argv is None:
+                print(f"{server_name}: no server available, skipped (pip install uvicorn)")
+                continue
+            with harness.Server(argv, port) as server:
+                def make_request(worker, i):
+                    path = paths[flavour][i % len(paths[flavour])]
+                    return harness.request(server.base_url + path.format(id=user_ids[(worker * 7919 + i) % len(user_ids)]), token)
+
+                for concurrency in args.concurrency:
+                    summary = harness.run_load(make_request, concurrency, args.duration)
+                    label = f"{server_name}/{flavour} ({argv[0].rsplit('/', 1)[-1]}) c={concurrency}"
+                    print(harness.format_summary(label, summary))
+    finally:
+        harness.remove_scratch_database(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark creating one expense with many participants through ExpenseSerializer.
+
+Compares the batched path (one IN query for users, one bulk insert for
+participants) against the previous per-participant queries and inserts.
+
+    python -m benchmarks.create_expense --participants 10 100 500
+
+The test database is an in-memory SQLite database where a round trip is
+almost free; pass --latency-ms to add a fixed delay per query and emulate a
+database across the network.
+"""
+
+import argparse
+import time
+
+from benchmarks import setup_django, test_database
+
+setup_django()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from rest_framework import serializers  # noqa: E402
+
+from api import ledger  # noqa: E402
+from api.models import CustomUser, ExpenseParticipant  # noqa: E402
+from api.serializers import ExpenseSerializer  # noqa: E402
+
+
+class LegacyExpenseSerializer(ExpenseSerializer):
+    """
+    The previous write path: a query per user id and an insert per participant.
+    """
+    def to_internal_value(self, data):
+        return serializers.ModelSerializer.to_internal_value(self, data)
+
+    def create(self, validated_data):
+        participants_data = validated_data.pop('participants')
+        expense = ExpenseSerializer.Meta.model.objects.create(**validated_data)
+        participants = self.build_participants(expense, participants_data)
+        for participant in participants:
+            participant.save()
+        ledger.record_participants(participants)
+        return expense
+
+
+def payload(users):
+    return {
+        "name": "Company event",
+        "created_by": users[0].id,
+        "total_amount": "12345.67",
+        "split_type": "EQUAL",
+        "participants": [{"user_id": user.id} for user in users],
+    }
+
+
+def network_latency(seconds):
+    """
+    Execute wrapper sleeping `seconds` before every query.
+    """
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+    return wrapper
+
+
+def run(serializer_class, data, repeat):
+    timings = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            if serializer_class is LegacyExpenseSerializer:
+                # The legacy path resolved each user id with its own query.
+                serializer = serializer_class(data=data, context={'users': None})
+            else:
+                serializer = serializer_class(data=data)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            timings.append(time.perf_counter() - start)
+    return min(timings), len(context.captured_queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--participants', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Emulated round-trip time per query.")
+    args = parser.parse_args()
+
+    with test_database(), connection.execute_wrapper(network_latency(args.latency_ms / 1000)):
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'user{i}', email=f'user{i}@example.com', mobile_number=f'{i:010d}')
+            for i in range(max(args.participants))
+        ])
+
+        print(f"{'participants':>12} {'legacy ms':>10} {'queries':>8} {'batched ms':>11} {'queries':>8} {'speedup':>8}")
+        for count in args.participants:
+            data = payload(users[:count])
+            legacy, legacy_queries = run(LegacyExpenseSerializer, data, args.repeat)
+            batched, batched_queries = run(ExpenseSerializer, data, args.repeat)
+            print(
+                f"{count:>12} {legacy * 1000:>10.1f} {legacy_queries:>8} "
+                f"{batched * 1000:>11.1f} {batched_queries:>8} {legacy / batched:>7.1f}x"
+            )
+            ExpenseParticipant.objects.all().delete()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Helpers for benchmarks that drive a real server over HTTP.
+"""
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def scratch_database():
+    """
+    Point SQLITE_PATH at a fresh SQLite file and return its directory.
+
+    Must run before Django is set up; servers started afterwards inherit the
+    environment and share the file.
+    """
+    directory = tempfile.mkdtemp(prefix='expense-bench-')
+    os.environ['SQLITE_PATH'] = str(Path(directory) / 'db.sqlite3')
+    return directory
+
+
+def remove_scratch_database(directory):
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def server_commands(port, workers=1):
+    """
+    Return {name: argv} for the WSGI and ASGI servers available locally.
+    """
+    commands = {}
+    if shutil.which('gunicorn'):
+        commands['wsgi'] = [
+            'gunicorn', 'expense_sharing.wsgi:application', '--bind', f'127.0.0.1:{port}',
+            '--workers', str(workers), '--threads', '8', '--log-level', 'warning',
+        ]
+    else:
+        # The threaded development server is the WSGI stand-in.
+        commands['wsgi'] = [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload']
+    if shutil.which('uvicorn'):
+        commands['asgi'] = [
+            'uvicorn', 'expense_sharing.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(workers), '--log-level', 'warning', '--no-access-log',
+        ]
+    elif shutil.which('daphne'):
+        commands['asgi'] = ['daphne', '-b', '127.0.0.1', '-p', str(port), 'expense_sharing.asgi:application']
+    return commands
+
+
+class Server:
+    """
+    Run a server command from the project directory until the context exits.
+    """
+    def __init__(self, argv, port, env=None):
+        self.argv = argv
+        self.port = port
+        self.env = {**os.environ, **(env or {})}
+        self.base_url = f'http://127.0.0.1:{port}'
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            self.argv, cwd=PROJECT_DIR, env=self.env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(('127.0.0.1', self.port), timeout=0.5):
+                    return self
+            except OSError:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"{self.argv[0]} exited with {self.process.returncode}")
+                time.sleep(0.1)
+        raise RuntimeError(f"{self.argv[0]} did not start listening on port {self.port}")
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+# Database contention errors, recognised in the debug error page of a 500.
+LOCK_ERRORS = (
+    (b'database is locked', 'locked'),
+    (b'deadlock detected', 'deadlock'),
+    (b'could not serialize access', 'serialization'),
+    (b'lock timeout', 'lock_timeout'),
+)
+
+
+def request(url, token=None, method='GET', body=None, timeout=30):
+    """
+    Send one request; return (status, error kind or None).
+    """
+    headers = {}
+    data = None
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    if body is not None:
+        headers['Content-Type'] = 'application/json'
+        data = json.dumps(body).encode()
+    req = urllib.request.Request(url, data=data, headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            return response.status, None
+    except urllib.error.HTTPError as e:
+        payload = e.read()
+        for marker, kind in LOCK_ERRORS:
+            if marker in payload:
+                return e.code, kind
+        return e.code, f'http_{e.code}'
+    except (TimeoutError, socket.timeout):
+        return 0, 'timeout'
+    except (urllib.error.URLError, ConnectionError) as e:
+        return 0, type(getattr(e, 'reason', e)).__name__
+
+
+def fetch_json(url, token=None, method='GET', body=None, timeout=30):
+    """
+    Send one request and return its decoded JSON body; raises on HTTP errors.
+    """
+    headers = {'Accept': 'application/json'}
+    data = None
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    if body is not None:
+        headers['Content-Type'] = 'application/json'
+        data = json.dumps(body).encode()
+    req = urllib.request.Request(url, data=data, headers=headers, method=method)
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def collect_load(make_request, concurrency, duration):
+    """
+    Call `make_request(worker, i)` from `concurrency` threads for `duration`
+    seconds; each call returns (status, error). Returns (latencies of the
+    successful requests, {error: count}, elapsed seconds).
+    """
+    latencies = []
+    errors = {}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker(worker_id):
+        i = 0
+        local_latencies = []
+        local_errors = {}
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            _, error = make_request(worker_id, i)
+            elapsed = time.perf_counter() - start
+            if error:
+                local_errors[error] = local_errors.get(error, 0) + 1
+            else:
+                local_latencies.append(elapsed)
+            i += 1
+        with lock:
+            latencies.extend(local_latencies)
+            for error, count in local_errors.items():
+                errors[error] = errors.get(error, 0) + count
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def summarize(latencies, errors, elapsed):
+    return {
+        'requests': len(latencies),
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'errors': errors,
+    }
+
+
+def run_load(make_request, concurrency, duration):
+    """
+    Run `collect_load` and return its summary dict.
+    """
+    return summarize(*collect_load(make_request, concurrency, duration))
+
+
+def format_summary(label, summary):
+    errors = ', '.join(f'{kind}={count}' for kind, count in sorted(summary['errors'].items())) or '-'
+    return (
+        f"{label:<32} {summary['throughput']:>9.1f} {summary['p50_ms']:>9.1f} "
+        f"{summary['p99_ms']:>9.1f}  {errors}"
+    )
+
+
+SUMMARY_HEADER = f"{'scenario':<32} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}  errors"
@@ -0,0 +1,117 @@
+"""
+Measure the per-request overhead of the metrics middleware and query wrapper.
+
+Requests go through the full Django stack in-process, alternating between a
+handler with and without the middleware so both see the same conditions.
+
+    python -m benchmarks.metrics --requests 2000
+"""
+
+import argparse
+import time
+
+from benchmarks import setup_django, test_database
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from rest_framework_simplejwt.tokens import AccessToken  # noqa: E402
+
+from api import bulk, metrics  # noqa: E402
+from api.models import CustomUser  # noqa: E402
+
+MIDDLEWARE = 'api.middleware.MetricsMiddleware'
+
+
+def seed():
+    users = CustomUser.objects.bulk_create([
+        CustomUser(username=f'user{i}', email=f'user{i}@example.com', mobile_number=f'{i:010d}')
+        for i in range(20)
+    ])
+    bulk.create_expenses([
+        {
+            'name': 'Dinner',
+            'created_by': users[i % 20].id,
+            'total_amount': '100.00',
+            'split_type': 'EQUAL',
+            'participants': [{'user_id': users[(i + j) % 20].id} for j in range(4)],
+        }
+        for i in range(200)
+    ])
+    return users
+
+
+def time_requests(client, paths, count):
+    timings = []
+    for i in range(count):
+        path = paths[i % len(paths)]
+        start = time.perf_counter()
+        client.get(path)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    with test_database():
+        users = seed()
+        token = str(AccessToken.for_user(users[0]))
+        paths = [
+            f'/api/users/{users[1].id}/',
+            f'/api/expenses/user/{users[1].id}/?page_size=10',
+            f'/api/expenses/user/{users[1].id}/latest/',
+        ]
+        without = [name for name in settings.MIDDLEWARE if name != MIDDLEWARE]
+        with_metrics = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+        without_metrics = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        # Warm both handlers (middleware chains are built on first use).
+        time_requests(with_metrics, paths, 50)
+        with override_settings(MIDDLEWARE=without):
+            without_metrics.handler.load_middleware()
+            time_requests(without_metrics, paths, 50)
+
+        baseline, instrumented = [], []
+        for _ in range(args.rounds):
+            instrumented.extend(time_requests(with_metrics, paths, args.requests // args.rounds))
+            with override_settings(MIDDLEWARE=without):
+                baseline.extend(time_requests(without_metrics, paths, args.requests // args.rounds))
+
+        def median(values):
+            return sorted(values)[len(values) // 2]
+
+        base, inst = median(baseline), median(instrumented)
+        print(f"{'handler':<20} {'median us':>10}")
+        print(f"{'without metrics':<20} {base * 1e6:>10.1f}")
+        print(f"{'with metrics':<20} {inst * 1e6:>10.1f}")
+        print(f"overhead: {(inst - base) * 1e6:.1f} us per request ({(inst - base) / base:.1%})")
+
+        # The pieces in isolation.
+        n = 100000
+        start = time.perf_counter()
+        for _ in range(n):
+            metrics.record_request('route', 'GET', 200, 0.01, 3, 0.001, 1024)
+        record = (time.perf_counter() - start) / n
+        with connection.cursor() as cursor:
+            def run_queries():
+                start = time.perf_counter()
+                for _ in range(n // 10):
+                    cursor.execute('SELECT 1')
+                return (time.perf_counter() - start) / (n // 10)
+            plain = run_queries()
+            token = metrics.request_queries.set([0, 0.0])
+            try:
+                wrapped = run_queries()
+            finally:
+                metrics.request_queries.reset(token)
+        print(f"record_request: {record * 1e6:.2f} us; per query: {(wrapped - plain) * 1e6:.2f} us")
+
+
+if __name__ == '__main__':
+    main()
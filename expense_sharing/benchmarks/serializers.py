@@ -0,0 +1,69 @@
+"""
+Benchmark the values-based expense list rendering against ExpenseSerializer.
+
+    python -m benchmarks.serializers --expenses 1000 5000 --repeat 5
+
+Each run seeds a throwaway test database, then renders the newest
+`--expenses` expenses to JSON both ways, queries included, and reports the
+time per 1k expenses. The two outputs are checked to be identical.
+"""
+
+import argparse
+import time
+
+from benchmarks import setup_django, test_database
+
+setup_django()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from api import fast_serializers, seeding  # noqa: E402
+from api.models import Expense  # noqa: E402
+from api.serializers import ExpenseSerializer  # noqa: E402
+
+ORDERING = ('-created_at', '-id')
+
+
+def render_serializer(count):
+    expenses = ExpenseSerializer.setup_eager_loading(Expense.objects.order_by(*ORDERING)[:count])
+    return JSONRenderer().render(ExpenseSerializer(expenses, many=True).data)
+
+
+def render_fast(count):
+    rows = fast_serializers.expense_rows_query(Expense.objects.order_by(*ORDERING)[:count], ORDERING)
+    return JSONRenderer().render(fast_serializers.serialize_page(fast_serializers.group_rows(rows)))
+
+
+def best_of(repeat, function, count):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = function(count)
+        timings.append(time.perf_counter() - start)
+    return min(timings), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--expenses', type=int, nargs='+', default=[50, 1000, 5000])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with test_database():
+        seeding.seed(users=args.users, expenses=max(args.expenses), seed=args.seed)
+        print(f"{'expenses':>10} {'serializer ms/1k':>17} {'fast ms/1k':>11} {'speedup':>8}")
+        for count in args.expenses:
+            serializer_time, expected = best_of(args.repeat, render_serializer, count)
+            fast_time, body = best_of(args.repeat, render_fast, count)
+            assert body == expected, "fast rendering differs from ExpenseSerializer"
+            per_1k = 1000 / count
+            print(
+                f"{count:>10} {serializer_time * 1000 * per_1k:>17.1f} {fast_time * 1000 * per_1k:>11.1f} "
+                f"{serializer_time / fast_time:>7.1f}x"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark the minimum-cash-flow settlement algorithm.
+
+    python -m benchmarks.settlement --users 1000 10000 100000
+"""
+
+import argparse
+import random
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from benchmarks import setup_django
+
+setup_django()
+
+from api.settlement import CENT, minimize_cash_flow  # noqa: E402
+
+
+def random_positions(num_users, seed):
+    """
+    Build net positions in cents for `num_users` users that sum to zero.
+    """
+    rng = random.Random(seed)
+    positions = {user_id: Decimal(rng.randint(-500000, 500000)) * CENT for user_id in range(1, num_users)}
+    positions[num_users] = -sum(positions.values())
+    return positions
+
+
+def check(positions, transfers):
+    """
+    Ensure the transfers settle every position exactly.
+    """
+    remaining = defaultdict(Decimal, positions)
+    for debtor_id, creditor_id, amount in transfers:
+        remaining[debtor_id] += amount
+        remaining[creditor_id] -= amount
+    assert all(amount == 0 for amount in remaining.values()), "transfers do not settle the positions"
+    assert len(transfers) < len(positions), "more transfers than n - 1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'transfers':>10} {'best ms':>10} {'us/user':>10}")
+    for num_users in args.users:
+        positions = random_positions(num_users, args.seed)
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            transfers = minimize_cash_flow(positions)
+            timings.append(time.perf_counter() - start)
+        check(positions, transfers)
+        best = min(timings)
+        print(f"{num_users:>10} {len(transfers):>10} {best * 1000:>10.1f} {best / num_users * 1e6:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark integer-cent splitting and aggregation against the Decimal path.
+
+    python -m benchmarks.splits --expenses 10000 100000 1000000
+    python -m benchmarks.splits --aggregate-expenses 100000
+
+The split benchmark times the previous per-participant Decimal arithmetic
+against `api.splits.split_batch` over the same generated expenses. The
+aggregate benchmark seeds a throwaway test database and times the per-pair
+balance sum over the decimal and the integer-cent columns.
+"""
+
+import argparse
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from benchmarks import setup_django, test_database
+
+setup_django()
+
+from django.db.models import F, Sum  # noqa: E402
+
+from api import seeding, splits  # noqa: E402
+from api.models import ExpenseParticipant  # noqa: E402
+
+
+def decimal_split(split_type, total_amount, shares):
+    """
+    The Decimal arithmetic used before api/splits.py.
+    """
+    if split_type == 'EQUAL':
+        equal_share = (total_amount / len(shares)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        amounts = [equal_share] * len(shares)
+        amounts[-1] += total_amount - sum(amounts)
+        return amounts
+    if split_type == 'EXACT':
+        return [share['amount_owed'] for share in shares]
+    return [
+        (share['percentage_owed'] / Decimal('100.00') * total_amount).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        for share in shares
+    ]
+
+
+def generate(count, seed):
+    generator = seeding.Generator(list(range(1, 1001)), seed=seed)
+    return [generator.expense() for _ in range(count)]
+
+
+def to_arrays(expenses):
+    """
+    Flatten expenses into the integer arrays `split_batch` takes.
+    """
+    split_types, totals, counts, values = [], [], [], []
+    for fields, shares in expenses:
+        split_type = fields['split_type']
+        split_types.append(split_type)
+        totals.append(splits.to_cents(fields['total_amount']))
+        counts.append(len(shares))
+        if split_type == 'EXACT':
+            values.extend(splits.to_cents(share['amount_owed']) for share in shares)
+        elif split_type == 'PERCENTAGE':
+            values.extend(splits.to_basis_points(share['percentage_owed']) for share in shares)
+        else:
+            values.extend([None] * len(shares))
+    return split_types, totals, counts, values
+
+
+def best_of(repeat, function, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def run_decimal(expenses):
+    return [
+        amount
+        for fields, shares in expenses
+        for amount in decimal_split(fields['split_type'], fields['total_amount'], shares)
+    ]
+
+
+def bench_splits(counts, repeat, seed):
+    print(f"{'expenses':>10} {'decimal ms':>11} {'cents ms':>10} {'speedup':>8} {'off by':>7}")
+    for count in counts:
+        expenses = generate(count, seed)
+        arrays = to_arrays(expenses)
+        decimal_time, amounts = best_of(repeat, run_decimal, expenses)
+        cents_time, cents = best_of(repeat, splits.split_batch, *arrays)
+        # Expenses whose Decimal shares do not add up to their total.
+        start = off = 0
+        for fields, shares in expenses:
+            off += sum(amounts[start:start + len(shares)]) != fields['total_amount']
+            start += len(shares)
+        assert sum(cents) == sum(arrays[1]), "integer shares do not add up to the totals"
+        print(f"{count:>10} {decimal_time * 1000:>11.1f} {cents_time * 1000:>10.1f} {decimal_time / cents_time:>7.1f}x {off:>7}")
+
+
+def bench_aggregate(expenses, repeat, seed):
+    with test_database():
+        seeding.seed(users=1000, expenses=expenses, seed=seed)
+        rows = ExpenseParticipant.objects.exclude(user_id=F('expense__created_by_id')).values_list('user_id', 'expense__created_by_id').order_by()
+        decimal_time, _ = best_of(repeat, lambda: list(rows.annotate(total=Sum('amount_owed'))))
+        cents_time, _ = best_of(repeat, lambda: list(rows.annotate(total=Sum('amount_owed_cents'))))
+        print(f"\n{'expenses':>10} {'decimal ms':>11} {'cents ms':>10} {'speedup':>8}")
+        print(f"{expenses:>10} {decimal_time * 1000:>11.1f} {cents_time * 1000:>10.1f} {decimal_time / cents_time:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--expenses', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--aggregate-expenses', type=int, default=0, help="Also time balance aggregation over this many seeded expenses.")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    bench_splits(args.expenses, args.repeat, args.seed)
+    if args.aggregate_expenses:
+        bench_aggregate(args.aggregate_expenses, args.repeat, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Hold many idle Server-Sent Events streams open against one uvicorn worker and
+report the worker's memory per connection and the delivery latency of an
+expense event to its participants.
+
+    python -m benchmarks.sse --connections 1000 5000
+    EVENTS_BACKEND=changelog python -m benchmarks.sse --connections 1000
+"""
+
+import argparse
+import asyncio
+import json
+import resource
+import time
+
+from benchmarks import harness, setup_django
+
+PARTICIPANTS = 10
+
+
+def process_status(pid):
+    """
+    Return (resident KiB, thread count) of process `pid`.
+    """
+    values = {}
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            key, _, value = line.partition(':')
+            values[key] = value.split()[0] if value.split() else ''
+    return int(values.get('VmRSS', 0)), int(values.get('Threads', 0))
+
+
+class Stream:
+    """
+    One raw HTTP/1.1 event stream; records when its first expense event arrives.
+    """
+    def __init__(self, port, user_id, token):
+        self.port = port
+        self.user_id = user_id
+        self.token = token
+        self.received_at = None
+        self.opened = asyncio.Event()
+
+    async def run(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write(
+            f'GET /api/async/expenses/events/?token={self.token} HTTP/1.1\r\n'
+            f'Host: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n'.encode()
+        )
+        await writer.drain()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.startswith(b'retry:'):
+                    self.opened.set()
+                elif line.startswith(b'event: expense') and self.received_at is None:
+                    self.received_at = time.perf_counter()
+        finally:
+            self.opened.set()
+            writer.close()
+
+
+async def measure(port, pid, users, tokens, connections):
+    baseline, _ = process_status(pid)
+    streams = [Stream(port, users[i % len(users)].id, tokens[i % len(users)]) for i in range(connections)]
+    tasks = []
+    started = time.perf_counter()
+    for i in range(0, connections, 200):
+        batch = streams[i:i + 200]
+        tasks.extend(asyncio.create_task(stream.run()) for stream in batch)
+        await asyncio.gather(*(stream.opened.wait() for stream in batch))
+    open_seconds = time.perf_counter() - started
+    await asyncio.sleep(1)
+    held, threads = process_status(pid)
+    failed = sum(task.done() for task in tasks)
+
+    # Publish one expense through the same worker and time its fan-out.
+    group = users[:PARTICIPANTS]
+    body = {
+        'name': 'Benchmark',
+        'created_by': group[0].id,
+        'total_amount': '100.00',
+        'split_type': 'EQUAL',
+        'participants': [{'user_id': user.id} for user in group],
+    }
+    published = time.perf_counter()
+    status, error = await asyncio.to_thread(
+        harness.request, f'http://127.0.0.1:{port}/api/expenses/add/', tokens[0], 'POST', body,
+    )
+    targets = [stream for stream in streams if stream.user_id in {user.id for user in group}]
+    deadline = time.perf_counter() + 10
+    while time.perf_counter() < deadline and any(stream.received_at is None for stream in targets):
+        await asyncio.sleep(0.01)
+    latencies = [stream.received_at - published for stream in targets if stream.received_at is not None]
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        'connections': connections,
+        'failed': failed,
+        'open_seconds': open_seconds,
+        'rss_mib': held / 1024,
+        'threads': threads,
+        'kib_per_connection': (held - baseline) / connections,
+        'publish_status': status if error is None else error,
+        'delivered': f'{len(latencies)}/{len(targets)}',
+        'p50_ms': harness.percentile(latencies, 0.5) * 1000,
+        'max_ms': max(latencies, default=0) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--connections', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    needed = max(args.connections) + 256
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+    directory = harness.scratch_database()
+    try:
+        setup_django()
+        from django.core.management import call_command
+        from rest_framework_simplejwt.tokens import AccessToken
+        from api.models import CustomUser
+
+        call_command('migrate', verbosity=0)
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'user{i}', email=f'user{i}@example.com', mobile_number=f'{i:010d}')
+            for i in range(args.users)
+        ])
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+
+        port = harness.free_port()
+        argv = harness.server_commands(port).get('asgi')
+        if argv is None:
+            raise SystemExit("No ASGI server available (pip install uvicorn).")
+        print(f"{'streams':>8} {'failed':>7} {'open s':>7} {'RSS MiB':>8} {'threads':>8} {'KiB/stream':>11} {'delivered':>10} {'p50 ms':>7} {'max ms':>7}")
+        with harness.Server(argv, port) as server:
+            for connections in args.connections:
+                result = asyncio.run(measure(port, server.process.pid, users, tokens, connections))
+                print(
+                    f"{result['connections']:>8} {result['failed']:>7} {result['open_seconds']:>7.2f} "
+                    f"{result['rss_mib']:>8.1f} {result['threads']:>8} {result['kib_per_connection']:>11.1f} {result['delivered']:>10} "
+                    f"{result['p50_ms']:>7.1f} {result['max_ms']:>7.1f}"
+                )
+                if result['publish_status'] != 201:
+                    print(f"  publish failed: {json.dumps(result['publish_status'])}")
+                # Let the worker notice the disconnects before the next level.
+                time.sleep(2)
+    finally:
+        harness.remove_scratch_database(directory)
+
+
+if __name__ == '__main__':
+    main()
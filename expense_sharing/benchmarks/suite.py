@@ -0,0 +1,351 @@
+"""
+Latency and query count of every endpoint in api/urls.py against a seeded
+dataset, saved as JSON so runs can be compared.
+
+    python -m benchmarks.suite --scale 10k
+    python -m benchmarks.suite --scale 10k 1m --baseline benchmarks/results/<earlier run>.json
+    python -m benchmarks.suite --compare OLD.json NEW.json
+
+A scale is a number of expenses. Its dataset is generated once with
+`manage.py seed_data` into benchmarks/data/ and reused by later runs with
+the same seed: 10k takes seconds, 1m about six minutes and 10m an hour or
+more and several GB of disk.
+
+Requests go through the full Django stack in-process, authenticated as the
+busiest user. The response cache is cleared before every timed request, so
+cached endpoints are measured on a miss. Writes run in a transaction that
+is rolled back, so the dataset is the same for every case and every run.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks import setup_django
+from benchmarks.harness import PROJECT_DIR, percentile
+
+DATA_DIR = Path(__file__).resolve().parent / 'data'
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+# scale -> (expenses, users)
+SCALES = {
+    '10k': (10_000, 1_000),
+    '1m': (1_000_000, 50_000),
+    '10m': (10_000_000, 250_000),
+}
+
+# Endpoints that cannot be timed as a single request.
+SKIPPED = {
+    'expense_events': "event stream that never ends; see benchmarks.sse",
+    'get_export_job': "needs a background export job; the export itself is download_balance_sheet",
+    'download_export_job': "needs a finished background export job",
+}
+
+# A later run is flagged when its median is this much slower or it issues more queries.
+REGRESSION_THRESHOLD = 0.2
+
+
+def dataset_path(scale, seed):
+    return DATA_DIR / f'{scale}-seed{seed}.sqlite3'
+
+
+def ensure_dataset(scale, seed):
+    """
+    Seed the scale's dataset unless a previous run already did; return its path.
+    """
+    path = dataset_path(scale, seed)
+    manage = [sys.executable, str(PROJECT_DIR / 'manage.py')]
+    # Seeding and migrating leave the slow query log off.
+    quiet = {**os.environ, 'SLOW_QUERY_THRESHOLD_MS': ''}
+    if path.exists():
+        # Datasets seeded before a schema change get its migrations.
+        subprocess.run([*manage, 'migrate', '--verbosity', '0'], env={**quiet, 'SQLITE_PATH': str(path)}, check=True)
+        return path
+    expenses, users = SCALES[scale]
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix('.partial')
+    partial.unlink(missing_ok=True)
+    env = {**quiet, 'SQLITE_PATH': str(partial)}
+    print(f"Seeding {scale}: {expenses} expenses, {users} users", flush=True)
+    subprocess.run([*manage, 'migrate', '--verbosity', '0'], env=env, check=True)
+    subprocess.run(
+        [*manage, 'seed_data', '--expenses', str(expenses), '--users', str(users), '--seed', str(seed)],
+        env=env, check=True,
+    )
+    partial.replace(path)
+    return path
+
+
+class Case:
+    """
+    One request to time. Unsafe methods are rolled back after each run.
+    """
+    def __init__(self, label, name, path, method='GET', data=None, headers=None):
+        self.label = label
+        self.name = name
+        self.path = path
+        self.method = method
+        self.data = data
+        self.headers = headers or {}
+
+    def send(self, client):
+        from django.db import transaction
+
+        if self.method == 'GET':
+            return read_body(client.get(self.path, headers=self.headers))
+        with transaction.atomic():
+            response = read_body(client.generic(
+                self.method, self.path, json.dumps(self.data), content_type='application/json', headers=self.headers,
+            ))
+            transaction.set_rollback(True)
+        return response
+
+
+def read_body(response):
+    if response.streaming:
+        response.body = b''.join(response.streaming_content)
+    else:
+        response.body = response.content
+    return response
+
+
+def build_cases():
+    """
+    Return the cases for the seeded dataset, covering each URL name at
+    least once. Per-user endpoints run for the busiest user and a typical one.
+    """
+    from django.urls import reverse
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from api import changes, seeding
+    from api.models import CustomUser, Expense, ExpenseChange
+
+    user_ids = list(CustomUser.objects.filter(username__startswith='seed').order_by('id').values_list('id', flat=True))
+    # Seeded users are ranked by how often they take part in an expense.
+    users = {'hot': user_ids[0], 'typical': user_ids[len(user_ids) // 2]}
+    hot = users['hot']
+    recent_expense_ids = list(Expense.objects.order_by('-id').values_list('id', flat=True)[:50])
+    # Leave a page worth of changes to sync.
+    since = (
+        ExpenseChange.objects.filter(user_id=hot).order_by('-id').values_list('id', flat=True)[changes.PAGE_SIZE:changes.PAGE_SIZE + 1].first()
+        or 0
+    )
+
+    def expense(i):
+        return {
+            'name': 'Benchmark dinner',
+            'created_by': hot,
+            'total_amount': '120.00',
+            'split_type': 'EQUAL',
+            'participants': [{'user_id': user_ids[(i * 7 + j) % len(user_ids)]} for j in range(4)],
+        }
+
+    cases = [
+        Case('register_user', 'register_user', reverse('register_user'), 'POST', {
+            'username': 'benchmark', 'email': 'benchmark@example.com',
+            'mobile_number': '1234567890', 'password': 'benchmark-password',
+        }),
+        Case('get_user_by_username', 'get_user_by_username', f"{reverse('get_user_by_username')}?username={seeding.username(0)}"),
+        Case('async_get_user_by_username', 'async_get_user_by_username', f"{reverse('async_get_user_by_username')}?username={seeding.username(0)}"),
+        Case('add_expense', 'add_expense', reverse('add_expense'), 'POST', expense(0)),
+        Case('bulk_add_expenses', 'bulk_add_expenses', reverse('bulk_add_expenses'), 'POST', {'expenses': [expense(i) for i in range(100)]}),
+        Case('get_overall_expenses', 'get_overall_expenses', reverse('get_overall_expenses')),
+        Case('get_overall_expenses[filtered]', 'get_overall_expenses', f"{reverse('get_overall_expenses')}?split_type=EXACT&created_after=2025-01-01"),
+        Case('get_expense_changes', 'get_expense_changes', f"{reverse('get_expense_changes')}?since={since}"),
+        Case('settle_expenses', 'settle_expenses', reverse('settle_expenses')),
+        Case('settle_expenses[group]', 'settle_expenses', f"{reverse('settle_expenses')}?user_ids={','.join(map(str, user_ids[:10]))}"),
+        Case('download_balance_sheet', 'download_balance_sheet', f"{reverse('download_balance_sheet')}?expense_ids={','.join(map(str, recent_expense_ids))}"),
+        Case('get_cache_stats', 'get_cache_stats', reverse('get_cache_stats')),
+        Case('get_metrics', 'get_metrics', reverse('get_metrics'), headers={'Authorization': 'Bearer benchmark'}),
+        Case('token_obtain_pair', 'token_obtain_pair', reverse('token_obtain_pair'), 'POST', {
+            'username': seeding.username(0), 'password': seeding.PASSWORD,
+        }),
+        Case('token_refresh', 'token_refresh', reverse('token_refresh'), 'POST', {
+            'refresh': str(RefreshToken.for_user(CustomUser(id=hot))),
+        }),
+    ]
+    for kind, user_id in users.items():
+        for name in (
+            'get_user_details', 'get_user_balances', 'get_spending_summary', 'get_user_expenses', 'latest_expense', 'download_latest_expense',
+            'async_get_user_details', 'async_get_user_expenses', 'async_latest_expense',
+        ):
+            cases.append(Case(f'{name}[{kind}]', name, reverse(name, kwargs={'user_id': user_id})))
+    return cases
+
+
+def measure(client, case, repeat, warmup):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from api.cache import get_cache
+
+    for _ in range(warmup):
+        case.send(client)
+    timings = []
+    for _ in range(repeat):
+        get_cache().clear()
+        start = time.perf_counter()
+        case.send(client)
+        timings.append(time.perf_counter() - start)
+    get_cache().clear()
+    with CaptureQueriesContext(connection) as queries:
+        response = case.send(client)
+    return {
+        'name': case.name,
+        'method': case.method,
+        'status': response.status_code,
+        'queries': len(queries),
+        'bytes': len(response.body),
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scale(scale, seed, repeat, warmup):
+    """
+    Time every case against the scale's dataset in this process.
+    """
+    os.environ['SQLITE_PATH'] = str(ensure_dataset(scale, seed))
+    setup_django()
+
+    from django.db import transaction
+    from django.test import Client, override_settings
+    from django.test.utils import setup_test_environment
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from api import slow_queries
+    from api.models import CustomUser
+    from api.urls import urlpatterns
+
+    # Allows the test client's host name.
+    setup_test_environment()
+    results = {}
+    # The benchmark's queries stay out of the real slow query log.
+    with slow_queries.temporary_log(), override_settings(METRICS_TOKEN='benchmark'), transaction.atomic():
+        cases = build_cases()
+        user = CustomUser.objects.get(username='seed0')
+        # Staff, for the cache stats; rolled back with everything else.
+        CustomUser.objects.filter(id=user.id).update(is_staff=True)
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        for case in cases:
+            results[case.label] = measure(client, case, repeat, warmup)
+            print(format_result(case.label, results[case.label]), flush=True)
+        transaction.set_rollback(True)
+
+    covered = {case.name for case in cases} | set(SKIPPED)
+    for pattern in urlpatterns:
+        if pattern.name not in covered:
+            print(f"warning: no benchmark case for {pattern.name}", file=sys.stderr)
+
+    expenses, users = SCALES[scale]
+    return {
+        'scale': scale,
+        'expenses': expenses,
+        'users': users,
+        'seed': seed,
+        'repeat': repeat,
+        'revision': git_revision(),
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'skipped': SKIPPED,
+        'results': results,
+    }
+
+
+RESULT_HEADER = f"{'case':<40} {'status':>6} {'queries':>7} {'p50 ms':>9} {'p95 ms':>9} {'bytes':>9}"
+
+
+def format_result(label, result):
+    return (
+        f"{label:<40} {result['status']:>6} {result['queries']:>7} "
+        f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['bytes']:>9}"
+    )
+
+
+def compare(before, after, threshold=REGRESSION_THRESHOLD):
+    """
+    Print the cases of two runs side by side; return the regressed labels.
+    """
+    regressions = []
+    print(f"{'case':<40} {'p50 before':>10} {'p50 after':>10} {'change':>8} {'queries':>9}")
+    for label, new in after['results'].items():
+        old = before['results'].get(label)
+        if old is None:
+            print(f"{label:<40} {'':>10} {new['p50_ms']:>10.2f} {'new':>8} {new['queries']:>9}")
+            continue
+        change = (new['p50_ms'] - old['p50_ms']) / old['p50_ms'] if old['p50_ms'] else 0.0
+        regressed = change > threshold or new['queries'] > old['queries']
+        if regressed:
+            regressions.append(label)
+        queries = f"{old['queries']}->{new['queries']}" if new['queries'] != old['queries'] else str(new['queries'])
+        print(
+            f"{label:<40} {old['p50_ms']:>10.2f} {new['p50_ms']:>10.2f} {change:>+8.0%} {queries:>9}"
+            + ("  REGRESSION" if regressed else "")
+        )
+    return regressions
+
+
+def load(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', nargs='+', choices=SCALES, default=['10k'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--output', type=Path, help="Result file; defaults to benchmarks/results/<time>-<scale>.json.")
+    parser.add_argument('--baseline', type=Path, help="Earlier result file to compare this run against.")
+    parser.add_argument('--compare', nargs=2, type=Path, metavar=('BEFORE', 'AFTER'), help="Compare two result files and exit.")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(load(args.compare[0]), load(args.compare[1]), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    if len(args.scale) > 1:
+        # Django is bound to one database per process, so each scale runs in its own.
+        if args.output or args.baseline:
+            parser.error("--output and --baseline take a single --scale")
+        for scale in args.scale:
+            subprocess.run(
+                [sys.executable, '-m', 'benchmarks.suite', '--scale', scale, '--seed', str(args.seed),
+                 '--repeat', str(args.repeat), '--warmup', str(args.warmup)],
+                cwd=PROJECT_DIR, check=True,
+            )
+        return
+
+    print(RESULT_HEADER)
+    run = run_scale(args.scale[0], args.seed, args.repeat, args.warmup)
+    output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%dT%H%M%S}-{run['scale']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(run, indent=2), encoding='utf-8')
+    print(f"Saved {output}")
+
+    if args.baseline:
+        print()
+        if compare(load(args.baseline), run, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
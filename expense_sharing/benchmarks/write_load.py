@@ -0,0 +1,225 @@
+"""
+Fire concurrent writes at a server and report throughput, p50/p99 latency
+and database lock errors, per database configuration.
+
+    python -m benchmarks.write_load --database sqlite sqlite-wal --concurrency 1 8 32
+    python -m benchmarks.write_load --processes 4 --concurrency 16
+    python -m benchmarks.write_load --url http://127.0.0.1:8000 --scenario add_expense
+
+Without --url, a server (gunicorn or the threaded runserver; --server asgi
+for uvicorn) is started for each --database against a database freshly
+filled by `seed_data`:
+
+    sqlite             the stock settings, with a rollback journal
+    sqlite-wal         the same, with the file switched to write-ahead logging
+    sqlite-production  SQLITE_PROFILE=production (see settings.py)
+    postgresql         DATABASE_ENGINE=postgresql and the POSTGRES_*
+                       variables; POSTGRES_DB must be a throwaway database,
+                       as it is flushed
+
+Every server also gets the --env KEY=VALUE pairs, to measure other
+settings. With --url the server must already hold `seed_data` users.
+
+Scenarios: add_expense, register_user (password hashing dominates it) and
+mixed, which reads user expenses for --read-ratio of its requests and adds
+expenses otherwise. Lock errors are recognised from the debug error page;
+with DEBUG off they are counted as http_500.
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from benchmarks import harness, setup_django
+
+setup_django()
+
+from api import seeding  # noqa: E402
+
+DATABASES = {
+    'sqlite': {},
+    'sqlite-wal': {},
+    'sqlite-production': {'SQLITE_PROFILE': 'production'},
+    'postgresql': {'DATABASE_ENGINE': 'postgresql'},
+}
+SCENARIOS = ('add_expense', 'register_user', 'mixed')
+
+
+class WriteLoad:
+    """
+    Request function for `harness.collect_load`: one scenario against one
+    server. Picklable, so --processes can hand it to worker processes.
+    """
+    def __init__(self, base_url, token, user_ids, scenario, read_ratio=0.8, process=0, threads=1):
+        self.base_url = base_url
+        self.token = token
+        self.user_ids = user_ids
+        self.scenario = scenario
+        self.read_ratio = read_ratio
+        self.process = process
+        self.threads = threads
+        # Keeps registered usernames unique across runs against one server.
+        self.tag = random.randrange(100000)
+
+    def __call__(self, worker, i):
+        worker += self.process * self.threads
+        rng = random.Random(worker * 1_000_003 + i)
+        if self.scenario == 'register_user':
+            return self.register_user(worker, i)
+        if self.scenario == 'mixed' and rng.random() < self.read_ratio:
+            return harness.request(f'{self.base_url}/api/expenses/user/{rng.choice(self.user_ids)}/', self.token)
+        return self.add_expense(rng)
+
+    def add_expense(self, rng):
+        group = rng.sample(self.user_ids, rng.randint(2, 5))
+        return harness.request(f'{self.base_url}/api/expenses/add/', self.token, 'POST', {
+            'name': 'Load test',
+            'created_by': group[0],
+            'total_amount': f'{rng.randint(100, 50000) / 100:.2f}',
+            'split_type': 'EQUAL',
+            'participants': [{'user_id': user_id} for user_id in group],
+        })
+
+    def register_user(self, worker, i):
+        username = f'load{self.tag}-{worker}-{i}'
+        return harness.request(f'{self.base_url}/api/users/register/', None, 'POST', {
+            'username': username,
+            'email': f'{username}@example.com',
+            'mobile_number': f'{self.tag:05d}{worker:03d}{i:07d}',
+            'password': 'load-test-Password-1',
+        })
+
+
+def run_scenario(load, processes, threads, duration):
+    """
+    Run `load` from `processes` processes of `threads` threads each and
+    summarize all their requests together.
+    """
+    if processes == 1:
+        return harness.run_load(load, threads, duration)
+    loads = [
+        WriteLoad(load.base_url, load.token, load.user_ids, load.scenario, load.read_ratio, process, threads)
+        for process in range(processes)
+    ]
+    with ProcessPoolExecutor(processes) as pool:
+        runs = list(pool.map(harness.collect_load, loads, [threads] * processes, [duration] * processes))
+    latencies, errors = [], {}
+    for run_latencies, run_errors, _ in runs:
+        latencies.extend(run_latencies)
+        for kind, count in run_errors.items():
+            errors[kind] = errors.get(kind, 0) + count
+    return harness.summarize(latencies, errors, max(elapsed for _, _, elapsed in runs))
+
+
+def prepare_database(name, directory, env, users, expenses):
+    """
+    Migrate and seed a database for configuration `name`; return the server environment.
+    """
+    env = {**env, **DATABASES[name]}
+    if name.startswith('sqlite'):
+        env['SQLITE_PATH'] = str(Path(directory) / f'{name}.sqlite3')
+    server_env = {**os.environ, **env}
+    manage = [sys.executable, 'manage.py']
+    subprocess.run([*manage, 'migrate', '--verbosity', '0'], cwd=harness.PROJECT_DIR, env=server_env, check=True)
+    if name == 'postgresql':
+        subprocess.run([*manage, 'flush', '--noinput'], cwd=harness.PROJECT_DIR, env=server_env, check=True)
+    subprocess.run(
+        [*manage, 'seed_data', '--users', str(users), '--expenses', str(expenses), '--verbosity', '0'],
+        cwd=harness.PROJECT_DIR, env=server_env, check=True, stdout=subprocess.DEVNULL,
+    )
+    if name == 'sqlite-wal':
+        # The journal mode is stored in the file, so the server picks it up.
+        with sqlite3.connect(env['SQLITE_PATH']) as db:
+            db.execute('PRAGMA journal_mode=WAL')
+    return env
+
+
+def seeded_users(base_url, count):
+    """
+    Log in as the first seeded user; return (token, ids of `count` seeded users).
+    """
+    token = harness.fetch_json(f'{base_url}/api/auth/token/', method='POST', body={
+        'username': seeding.username(0), 'password': seeding.PASSWORD,
+    })['access']
+    user_ids = [
+        harness.fetch_json(f'{base_url}/api/users/by-username/?username={seeding.username(index)}', token)['id']
+        for index in range(count)
+    ]
+    return token, user_ids
+
+
+def run_all(label, base_url, args, results):
+    token, user_ids = seeded_users(base_url, min(args.users, 200))
+    for scenario in args.scenario:
+        for concurrency in args.concurrency:
+            load = WriteLoad(base_url, token, user_ids, scenario, args.read_ratio)
+            summary = run_scenario(load, args.processes, concurrency, args.duration)
+            name = f'{label}/{scenario} x{args.processes * concurrency}'
+            print(harness.format_summary(name, summary), flush=True)
+            results.append({
+                'database': label, 'scenario': scenario, 'processes': args.processes,
+                'threads': concurrency, **summary,
+            })
+
+
+def parse_env(values):
+    env = {}
+    for value in values:
+        key, separator, setting = value.partition('=')
+        if not separator:
+            raise ValueError(f"--env expects KEY=VALUE, got {value!r}")
+        env[key] = setting
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', nargs='+', choices=DATABASES, default=['sqlite', 'sqlite-wal', 'sqlite-production'])
+    parser.add_argument('--scenario', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help="Threads per process.")
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--read-ratio', type=float, default=0.8)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--expenses', type=int, default=10000)
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--workers', type=int, default=1, help="Server worker processes (gunicorn/uvicorn).")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE')
+    parser.add_argument('--url', help="Load an already running server instead of starting one.")
+    parser.add_argument('--output', type=Path, help="Also write the results as JSON.")
+    args = parser.parse_args()
+    try:
+        env = parse_env(args.env)
+    except ValueError as error:
+        parser.error(str(error))
+
+    results = []
+    print(harness.SUMMARY_HEADER)
+    if args.url:
+        run_all('url', args.url.rstrip('/'), args, results)
+    else:
+        directory = harness.scratch_database()
+        try:
+            for name in args.database:
+                port = harness.free_port()
+                argv = harness.server_commands(port, args.workers).get(args.server)
+                if argv is None:
+                    parser.error(f"no {args.server} server installed")
+                server_env = prepare_database(name, directory, env, args.users, args.expenses)
+                with harness.Server(argv, port, server_env) as server:
+                    run_all(name, server.base_url, args, results)
+        finally:
+            harness.remove_scratch_database(directory)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -9,8 +9,32 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
+from django.urls import reverse
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "expense_sharing.settings")
 
-application = get_asgi_application()
+
+class EventStreamASGIHandler(ASGIHandler):
+    """
+    Serve long-lived event streams without a per-request thread.
+
+    Django runs each request in its own ThreadSensitiveContext, whose executor
+    thread lives until the response ends, so every open stream would pin an
+    idle thread. Stream requests skip that context; their few short sync
+    calls share the process-wide thread-sensitive executor instead.
+    """
+    def __init__(self):
+        super().__init__()
+        self.stream_paths = {reverse('expense_events')}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.stream_paths:
+            await self.handle(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
+
+
+django.setup(set_prefix=False)
+application = EventStreamASGIHandler()
@@ -34,6 +34,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.MetricsMiddleware",
+    "api.middleware.ReplicaRoutingMiddleware",
     'corsheaders.middleware.CorsMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -42,6 +44,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.middleware.ProfilerMiddleware",
 ]
 
 ROOT_URLCONF = "expense_sharing.urls"
@@ -68,13 +71,224 @@ WSGI_APPLICATION = "expense_sharing.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
+#
+# SQLite by default; DATABASE_ENGINE=postgresql switches to PostgreSQL
+# (needs psycopg), configured with the usual POSTGRES_* variables.
+
+DATABASE_ENGINES = {
+    "sqlite": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": os.environ.get("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+    },
+    "postgresql": {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("POSTGRES_DB", "expense_sharing"),
+        "USER": os.environ.get("POSTGRES_USER", ""),
+        "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+        "HOST": os.environ.get("POSTGRES_HOST", ""),
+        "PORT": os.environ.get("POSTGRES_PORT", ""),
+    },
+}
+
+# SQLITE_PROFILE=production tunes SQLite for serving traffic:
+# - write-ahead logging, so readers and the writer don't block each other;
+# - synchronous=NORMAL, which under WAL survives application crashes and
+#   only risks the last commits on power loss;
+# - memory-mapped reads and a larger page cache per connection;
+# - a busy timeout, so writers queue for the lock instead of failing with
+#   "database is locked";
+# - IMMEDIATE transactions, which take the write lock when they begin; a
+#   deferred transaction that reads before it writes can fail to upgrade
+#   its lock, whatever the timeout;
+# - persistent connections, so the pragmas run once per connection rather
+#   than once per request. Under ASGI set CONN_MAX_AGE=0: requests run in
+#   short-lived threads there and their connections would not be reused.
+
+SQLITE_PRODUCTION = {
+    "OPTIONS": {
+        "init_command": ";".join([
+            "PRAGMA journal_mode=WAL",
+            "PRAGMA synchronous=NORMAL",
+            f"PRAGMA mmap_size={int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}",
+            # Negative sizes are in KiB.
+            f"PRAGMA cache_size=-{int(os.environ.get('SQLITE_CACHE_SIZE_KIB', 32 * 1024))}",
+        ]),
+        "transaction_mode": "IMMEDIATE",
+        # Seconds; sqlite3 applies it as the connection's busy timeout.
+        "timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 20000)) / 1000,
+    },
+    "CONN_MAX_AGE": int(os.environ.get("CONN_MAX_AGE", 600)),
+    "CONN_HEALTH_CHECKS": True,
+}
+
+if os.environ.get("SQLITE_PROFILE") == "production":
+    DATABASE_ENGINES["sqlite"].update(SQLITE_PRODUCTION)
+
+DATABASES = {
+    "default": DATABASE_ENGINES[os.environ.get("DATABASE_ENGINE", "sqlite")],
+}
+
+# Read replicas. GET and HEAD requests read from one of them unless they
+# write first; everything else uses the primary (see api/routers.py).
+# List replica files in SQLITE_REPLICA_PATHS or hosts in
+# POSTGRES_REPLICA_HOSTS, comma-separated. Keeping them in sync is up to
+# the database (streaming replication, or Litestream/LiteFS for SQLite).
+
+REPLICA_SETTING = {"sqlite": ("NAME", "SQLITE_REPLICA_PATHS"), "postgresql": ("HOST", "POSTGRES_REPLICA_HOSTS")}
+DATABASE_REPLICAS = []
+replica_key, replica_variable = REPLICA_SETTING[os.environ.get("DATABASE_ENGINE", "sqlite")]
+for index, value in enumerate(filter(None, os.environ.get(replica_variable, "").split(",")), 1):
+    DATABASES[f"replica{index}"] = {
+        **DATABASES["default"],
+        replica_key: value.strip(),
+        # Tests run against the primary only.
+        "TEST": {"MIRROR": "default"},
     }
+    DATABASE_REPLICAS.append(f"replica{index}")
+
+DATABASE_ROUTERS = ["api.routers.ReplicaRouter"]
+
+# Amounts are stored both as decimals and as integer minor units (cents and
+# basis points, see api/splits.py). AMOUNT_COLUMNS=cents makes balance and
+# settlement aggregation sum the integer columns; run migration 0010 first,
+# which fills them in for existing rows.
+
+AMOUNT_COLUMNS = os.environ.get("AMOUNT_COLUMNS", "decimal")
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+#
+# The "responses" cache holds server-side cached responses of the aggregate
+# endpoints. LocMem is per process; set RESPONSE_CACHE_BACKEND to "file" or
+# "db" (after `python manage.py createcachetable`) to share it between
+# workers, including its write-driven invalidation.
+
+RESPONSE_CACHE_BACKENDS = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "expense-sharing-responses",
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "cache" / "responses",
+    },
+    "db": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "response_cache",
+    },
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "responses": {
+        **RESPONSE_CACHE_BACKENDS[os.environ.get("RESPONSE_CACHE_BACKEND", "locmem")],
+        "TIMEOUT": int(os.environ.get("RESPONSE_CACHE_TIMEOUT", 300)),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 1000)),
+        },
+    },
 }
 
+RESPONSE_CACHE_ALIAS = "responses"
+
+# Streamed CSV exports larger than this are never cached.
+RESPONSE_CACHE_MAX_STREAMING_BYTES = 5 * 1024 * 1024
+
+
+# Server-Sent Events
+#
+# Expense events reach the open event streams through an in-process broker.
+# With several ASGI workers set EVENTS_BACKEND to "changelog": each worker
+# then polls the shared change log instead of relying on in-process publishes.
+
+EVENTS_BACKENDS = {
+    "local": "api.pubsub.LocalBroker",
+    "changelog": "api.pubsub.ChangeLogBroker",
+}
+
+EVENTS = {
+    "BACKEND": EVENTS_BACKENDS[os.environ.get("EVENTS_BACKEND", "local")],
+    # Events buffered per stream before a slow client is disconnected.
+    "QUEUE_SIZE": 32,
+    # Open streams per worker; further connections get a 503.
+    "MAX_SUBSCRIBERS": int(os.environ.get("EVENTS_MAX_SUBSCRIBERS", 10000)),
+    "POLL_INTERVAL": float(os.environ.get("EVENTS_POLL_INTERVAL", 0.5)),
+}
+
+# Seconds between keep-alive comments on an idle event stream.
+EVENTS_HEARTBEAT_SECONDS = 15
+
+
+# Request metrics
+#
+# Scrapers must send "Authorization: Bearer <METRICS_TOKEN>" to read
+# /api/metrics/; the endpoint is disabled while the token is empty.
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+
+# Slow query log
+#
+# Queries slower than SLOW_QUERY_THRESHOLD_MS are written to SLOW_QUERY_LOG
+# as JSON lines, with the plan the database reports for reads. Set the
+# threshold to an empty string to turn the log off; summarise it with
+# `python manage.py slow_queries`. Test runs write to a temporary log.
+
+SLOW_QUERY_THRESHOLD_MS = os.environ.get("SLOW_QUERY_THRESHOLD_MS", "200")
+SLOW_QUERY_THRESHOLD_MS = float(SLOW_QUERY_THRESHOLD_MS) if SLOW_QUERY_THRESHOLD_MS else None
+SLOW_QUERY_EXPLAIN = os.environ.get("SLOW_QUERY_EXPLAIN", "1") == "1"
+SLOW_QUERY_LOG = Path(os.environ.get("SLOW_QUERY_LOG", BASE_DIR / "logs" / "slow_queries.log"))
+
+TEST_RUNNER = "api.test_runner.TestRunner"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "message": {"format": "%(message)s"},
+    },
+    "handlers": {
+        "slow_queries": {
+            "class": "api.slow_queries.LogFileHandler",
+            "maxBytes": 10 * 1024 * 1024,
+            "backupCount": 5,
+            "formatter": "message",
+        },
+    },
+    "loggers": {
+        "api.slow_queries": {
+            "handlers": ["slow_queries"],
+            "level": "WARNING",
+            "propagate": False,
+        },
+    },
+}
+
+
+# Request profiling
+#
+# Staff users can profile a single request by sending "X-Profile: 1" (or
+# "?profile=1"; "sampling" uses pyinstrument when installed). Profiles are
+# saved to PROFILES_DIR; see `python manage.py profiles`.
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "1") == "1"
+PROFILES_DIR = Path(os.environ.get("PROFILES_DIR", BASE_DIR / "profiles"))
+
+
+# Export jobs
+#
+# POST /api/expenses/balance-sheet/ writes the CSV to EXPORTS_DIR on one of
+# EXPORT_WORKERS background threads per process (0 runs it inside the
+# request). Jobs not finished after EXPORT_JOB_TIMEOUT seconds, for example
+# because their process restarted, are reported as failed.
+
+EXPORTS_DIR = Path(os.environ.get("EXPORTS_DIR", BASE_DIR / "exports"))
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", 2))
+EXPORT_JOB_TIMEOUT = int(os.environ.get("EXPORT_JOB_TIMEOUT", 3600))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -1,4 +1,4 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { toast } from "react-toastify"; // For notifications
 import api from "../../services/api";
 import { useAuth } from "../context/AuthContext";
@@ -10,6 +10,10 @@ const ExpenseHistory = () => {
   const [loading, setLoading] = useState(true); // Loading state
   const [error, setError] = useState(""); // Error state
   const [selectedExpenses, setSelectedExpenses] = useState([]); // Track selected expenses
+  const [nextPage, setNextPage] = useState(null); // Cursor URL of the next page
+  const syncCursor = useRef(null); // Delta-sync cursor of the loaded list
+  const syncing = useRef(false); // Whether a sync is in flight
+  const syncAgain = useRef(false); // Whether another change arrived meanwhile
 
   // Fetch all expenses for the current user
   const fetchExpenses = async () => {
@@ -19,8 +23,12 @@ const ExpenseHistory = () => {
     setError(""); // Reset error state
 
     try {
+      // Take the sync cursor first so nothing written during the load is missed.
+      const changes = await api.get("/expenses/changes/");
+      syncCursor.current = changes.data.cursor;
       const response = await api.get(`/expenses/user/${user.userId}/`);
-      setExpenses(response.data.reverse()); // Reverse to show latest first
+      setExpenses(response.data.results); // Already ordered latest first
+      setNextPage(response.data.next);
     } catch (err) {
       console.log(err);
 
@@ -30,6 +38,53 @@ const ExpenseHistory = () => {
     }
   };
 
+  // Append the next page of expenses
+  const loadMore = async () => {
+    try {
+      const response = await api.get(nextPage);
+      setExpenses((prevExpenses) => [...prevExpenses, ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (err) {
+      console.log(err);
+
+      setError("Failed to load expenses.");
+    }
+  };
+
+  // Merge the expenses written since the last sync instead of refetching the list
+  const syncExpenses = async () => {
+    if (syncCursor.current === null) return;
+    if (syncing.current) {
+      syncAgain.current = true; // Run once more when the current sync ends
+      return;
+    }
+
+    syncing.current = true;
+    try {
+      let hasMore = true;
+      while (hasMore || syncAgain.current) {
+        syncAgain.current = false;
+        const response = await api.get("/expenses/changes/", {
+          params: { since: syncCursor.current },
+        });
+        const changed = response.data.results; // Oldest change first
+        if (changed.length > 0) {
+          const changedIds = new Set(changed.map((expense) => expense.id));
+          setExpenses((prevExpenses) => [
+            ...[...changed].reverse(),
+            ...prevExpenses.filter((expense) => !changedIds.has(expense.id)),
+          ]);
+        }
+        syncCursor.current = response.data.cursor;
+        hasMore = response.data.has_more;
+      }
+    } catch (err) {
+      console.log(err);
+    } finally {
+      syncing.current = false;
+    }
+  };
+
   // Fetch expenses only when `user` is available
   useEffect(() => {
     if (user) {
@@ -37,6 +92,30 @@ const ExpenseHistory = () => {
     }
   }, [user]); // Fetch whenever `user` changes
 
+  // Keep the list in sync while the page is open: the server pushes an event
+  // for every new expense, and polling only runs while the stream is down
+  useEffect(() => {
+    if (!user) return;
+
+    const token = localStorage.getItem("access_token");
+    const events = new EventSource(
+      `${import.meta.env.VITE_API_URL}/async/expenses/events/?token=${encodeURIComponent(token)}`
+    );
+    events.addEventListener("expense", syncExpenses);
+
+    const interval = setInterval(() => {
+      if (events.readyState !== EventSource.OPEN) {
+        syncExpenses();
+      }
+    }, 30000);
+    window.addEventListener("focus", syncExpenses);
+    return () => {
+      events.close();
+      clearInterval(interval);
+      window.removeEventListener("focus", syncExpenses);
+    };
+  }, [user]);
+
   // Handle checkbox selection
   const handleCheckboxChange = (expenseId) => {
     setSelectedExpenses((prevSelected) =>
@@ -175,6 +254,17 @@ const ExpenseHistory = () => {
             ))}
           </ul>
         )}
+
+        {nextPage && (
+          <div className="flex justify-center mt-6">
+            <button
+              onClick={loadMore}
+              className="bg-blue-500 text-white px-6 py-2 rounded-lg hover:bg-blue-600 transition duration-300"
+            >
+              Load More
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );